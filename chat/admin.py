@@ -1,12 +1,123 @@
 from django.contrib import admin
+from django.utils.text import Truncator
 
-import chat.models
+from myproject.pagination import EstimatedCountPaginator
 
-# Register your models here.
-admin.site.register(chat.models.Chat)
-admin.site.register(chat.models.ChatMember)
-admin.site.register(chat.models.Message)
-admin.site.register(chat.models.MessageReaction)
-admin.site.register(chat.models.MessageStatusEntry)
-admin.site.register(chat.models.Call)
-admin.site.register(chat.models.CallParticipant)
+from .models import (
+    ArchivedMessage,
+    Call,
+    CallParticipant,
+    Chat,
+    ChatMember,
+    Message,
+    MessageReaction,
+    MessageStatusEntry,
+)
+
+
+class LargeTableAdmin(admin.ModelAdmin):
+    """
+    Changelist settings for tables that grow with traffic: no exact
+    COUNT(*) of the whole table, and foreign keys are edited through
+    autocomplete or raw id widgets rather than <select>s of every row.
+    Related objects shown in ``list_display`` belong in
+    ``list_select_related``. A ``date_hierarchy`` field needs an index:
+    its choices come from the MIN and MAX of the field (see
+    ``chat.templatetags.large_table_admin``).
+    """
+
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+    change_list_template = "admin/large_table_change_list.html"
+
+
+@admin.register(Chat)
+class ChatAdmin(LargeTableAdmin):
+    list_display = ("name", "is_group", "created_at", "last_activity_at")
+    list_filter = ("is_group",)
+    search_fields = ("name",)
+    raw_id_fields = ("last_message",)
+
+
+@admin.register(ChatMember)
+class ChatMemberAdmin(LargeTableAdmin):
+    list_display = ("__str__", "chat", "role", "joined_at", "unread_count")
+    list_select_related = ("chat", "user")
+    list_filter = ("role",)
+    search_fields = ("=user__email",)
+    # Walks the (chat, user) unique index instead of sorting by joined_at.
+    ordering = ("chat_id", "user_id")
+    autocomplete_fields = ("chat", "user")
+    raw_id_fields = ("last_delivered_message", "last_read_message")
+
+    def get_queryset(self, request):
+        # __str__ names the other member of a private chat.
+        return super().get_queryset(request).prefetch_related(ChatMember.prefetch_private_members())
+
+
+@admin.register(Message)
+class MessageAdmin(LargeTableAdmin):
+    list_display = ("id", "chat", "sender", "type", "preview", "created_at", "deleted_at")
+    list_select_related = ("chat", "sender")
+    list_filter = ("type",)
+    # Exact matches only: a LIKE over every message body would scan the table.
+    search_fields = ("=sender__email", "=chat__name")
+    date_hierarchy = "created_at"
+    ordering = ("-created_at",)
+    autocomplete_fields = ("chat", "sender")
+    raw_id_fields = ("reply_to",)
+
+    @admin.display(description="Content")
+    def preview(self, obj):
+        return Truncator(obj.content or "").chars(60)
+
+
+@admin.register(ArchivedMessage)
+class ArchivedMessageAdmin(LargeTableAdmin):
+    list_display = ("id", "chat", "sender", "type", "preview", "created_at", "deleted_at")
+    list_select_related = ("chat", "sender")
+    search_fields = ("=sender__email", "=chat__name")
+    ordering = ("-created_at",)
+
+    preview = MessageAdmin.preview
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+
+@admin.register(MessageReaction)
+class MessageReactionAdmin(LargeTableAdmin):
+    list_display = ("message", "user", "type", "created_at")
+    list_select_related = ("message", "user")
+    list_filter = ("type",)
+    date_hierarchy = "created_at"
+    autocomplete_fields = ("user",)
+    raw_id_fields = ("message",)
+
+
+@admin.register(MessageStatusEntry)
+class MessageStatusEntryAdmin(LargeTableAdmin):
+    list_display = ("message", "user", "status", "updated_at")
+    list_select_related = ("message", "user")
+    list_filter = ("status",)
+    autocomplete_fields = ("user",)
+    raw_id_fields = ("message",)
+
+
+@admin.register(Call)
+class CallAdmin(LargeTableAdmin):
+    list_display = ("id", "chat", "initiator", "call_type", "call_status", "started_at", "ended_at")
+    list_select_related = ("chat", "initiator")
+    list_filter = ("call_type", "call_status")
+    autocomplete_fields = ("chat", "initiator")
+
+
+@admin.register(CallParticipant)
+class CallParticipantAdmin(LargeTableAdmin):
+    list_display = ("call", "user", "joined_at", "left_at")
+    list_select_related = ("call", "user")
+    autocomplete_fields = ("user",)
+    raw_id_fields = ("call",)
@@ -0,0 +1,150 @@
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Case, DateTimeField, Exists, OuterRef, Q, Value, When
+from django.utils import timezone
+
+from chat.models import ArchivedMessage, Chat, ChatMember, Message, MessageReaction, MessageStatusEntry
+
+from loguru import logger
+
+
+ARCHIVED_FIELDS = (
+    "id",
+    "type",
+    "content",
+    "chat_id",
+    "sender_id",
+    "reply_to_id",
+    "created_at",
+    "updated_at",
+    "deleted_at",
+)
+
+
+def archive_horizon(now=None):
+    """Messages created at or after this instant are never in the archive."""
+    return (now or timezone.now()) - timedelta(days=settings.MESSAGE_ARCHIVE_AFTER_DAYS)
+
+
+def is_partitioned():
+    return connection.vendor == "postgresql"
+
+
+def month_start(moment):
+    moment = moment.astimezone(dt_timezone.utc)
+    return datetime(moment.year, moment.month, 1, tzinfo=dt_timezone.utc)
+
+
+def next_month(month):
+    return month.replace(year=month.year + month.month // 12, month=month.month % 12 + 1)
+
+
+def partition_name(month):
+    return f"{ArchivedMessage._meta.db_table}_{month:%Y_%m}"
+
+
+def ensure_partitions(first, last):
+    """
+    Create the monthly archive partitions covering ``first`` to ``last``
+    that do not exist yet and return their names. A no-op outside
+    PostgreSQL, where the archive is a single table.
+    """
+    if not is_partitioned():
+        return []
+
+    quote = connection.ops.quote_name
+    table = ArchivedMessage._meta.db_table
+    created = []
+    month, last = month_start(first), month_start(last)
+    with connection.cursor() as cursor:
+        while month <= last:
+            name = partition_name(month)
+            cursor.execute("SELECT to_regclass(%s)", [quote(name)])
+            if cursor.fetchone()[0] is None:
+                cursor.execute(
+                    f"CREATE TABLE {quote(name)} PARTITION OF {quote(table)} "
+                    f"FOR VALUES FROM ('{month.isoformat()}') TO ('{next_month(month).isoformat()}')"
+                )
+                created.append(name)
+            month = next_month(month)
+    return created
+
+
+def archivable(before):
+    """
+    Messages created before ``before`` that nothing points at: replies,
+    inbox previews, receipt watermarks, reactions and status entries keep
+    a message in the hot table until they move on or are archived too.
+    """
+    return Message.objects.filter(created_at__lt=before).filter(
+        ~Exists(Message.objects.filter(reply_to=OuterRef("pk"))),
+        ~Exists(Chat.objects.filter(last_message=OuterRef("pk"))),
+        ~Exists(ChatMember.objects.filter(last_delivered_message=OuterRef("pk"))),
+        ~Exists(ChatMember.objects.filter(last_read_message=OuterRef("pk"))),
+        ~Exists(MessageReaction.objects.filter(message=OuterRef("pk"))),
+        ~Exists(MessageStatusEntry.objects.filter(message=OuterRef("pk"))),
+    )
+
+
+def archive_messages(before=None, batch_size=5000):
+    """
+    Move archivable messages created before ``before`` (default: the
+    archive horizon) from ``Message`` to ``ArchivedMessage``, oldest first
+    and ``batch_size`` per transaction. Returns how many were moved.
+
+    Archived replies free their parents, so batches run until one finds
+    nothing left to move. Selected rows are locked (skipping those another
+    archiver holds) and only the rows still archivable when the DELETE runs
+    are moved; see ``_delete_archivable``.
+    """
+    before = before or archive_horizon()
+    moved = 0
+    while True:
+        with transaction.atomic():
+            rows = list(
+                archivable(before).select_for_update(skip_locked=True)
+                .order_by("created_at").values(*ARCHIVED_FIELDS)[:batch_size]
+            )
+            if not rows:
+                break
+            deleted = _delete_archivable([row["id"] for row in rows], before)
+            rows = [row for row in rows if row["id"] in deleted]
+            if rows:
+                ensure_partitions(rows[0]["created_at"], rows[-1]["created_at"])
+                ArchivedMessage.objects.bulk_create([ArchivedMessage(**row) for row in rows])
+                _lower_watermarks(rows)
+        moved += len(rows)
+        if rows:
+            logger.info(f"Archived {moved} message(s) so far, up to {rows[-1]['created_at'].isoformat()}.")
+    return moved
+
+
+def _delete_archivable(ids, before):
+    """
+    DELETE the messages of ``ids`` that are still archivable and return the
+    ids removed. The ``archivable`` checks are repeated in the statement
+    itself, so a reply, reaction or watermark added since the SELECT keeps
+    its message in place; ``QuerySet.delete()`` would have cascaded to it or
+    set it to NULL instead.
+    """
+    sql, params = archivable(before).filter(id__in=ids).values("id").query.sql_with_params()
+    table = connection.ops.quote_name(Message._meta.db_table)
+    with connection.cursor() as cursor:
+        cursor.execute(f"DELETE FROM {table} WHERE id IN ({sql}) RETURNING id", params)
+        return {Message._meta.pk.to_python(value) for (value,) in cursor.fetchall()}
+
+
+def _lower_watermarks(rows):
+    """Move ``Chat.first_archived_at`` back to the oldest of ``rows`` per chat."""
+    oldest = {}
+    for row in rows:
+        oldest.setdefault(row["chat_id"], row["created_at"])
+    value = Case(
+        *[When(id=chat_id, then=Value(created_at)) for chat_id, created_at in oldest.items()],
+        output_field=DateTimeField(),
+    )
+    Chat.objects.filter(id__in=oldest).filter(
+        Q(first_archived_at__isnull=True) | Q(first_archived_at__gt=value)
+    ).update(first_archived_at=value)
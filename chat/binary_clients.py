@@ -0,0 +1,57 @@
+import time
+
+from django.core.cache import cache
+
+
+class BinaryClients:
+    """
+    How many ``MSGPACK_SUBPROTOCOL`` connections each chat group has, so
+    that broadcasts only carry a MessagePack encoding when someone will
+    read it.
+
+    Counts live in the cache, shared by every worker. Senders remember the
+    answer for ``memo_seconds``: a worker can go on sending text-only
+    frames for that long after a binary client joined elsewhere, and the
+    receiving consumer then encodes the frame itself. A worker that dies
+    leaves its count behind until ``timeout``, which only costs encodings.
+    """
+
+    def __init__(self, memo_seconds=1.0, timeout=24 * 60 * 60, max_memo=10_000):
+        self.memo_seconds = memo_seconds
+        self.timeout = timeout
+        self.max_memo = max_memo
+        self._memo = {}
+
+    @staticmethod
+    def key(group):
+        return f"binary_clients:{group}"
+
+    async def add(self, group):
+        key = self.key(group)
+        if not await cache.aadd(key, 1, timeout=self.timeout):
+            await cache.aincr(key)
+            await cache.atouch(key, timeout=self.timeout)
+        self._remember(group, True)
+
+    async def discard(self, group):
+        try:
+            await cache.adecr(self.key(group))
+        except ValueError:
+            # Expired meanwhile; nothing left to count down.
+            pass
+
+    async def any(self, group):
+        memo = self._memo.get(group)
+        if memo is not None and memo[1] > time.monotonic():
+            return memo[0]
+        present = (await cache.aget(self.key(group)) or 0) > 0
+        self._remember(group, present)
+        return present
+
+    def _remember(self, group, present):
+        if len(self._memo) >= self.max_memo:
+            self._memo.clear()
+        self._memo[group] = (present, time.monotonic() + self.memo_seconds)
+
+
+binary_clients = BinaryClients()
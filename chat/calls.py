@@ -0,0 +1,467 @@
+import asyncio
+import time
+import uuid
+from collections import namedtuple
+from datetime import datetime, timezone as dt_timezone
+
+import redis.asyncio as redis
+from channels.db import database_sync_to_async
+from django.conf import settings
+from django.db import IntegrityError, transaction
+
+from chat.models import Call, CallParticipant
+
+from loguru import logger
+
+
+LiveCall = namedtuple("LiveCall", ["id", "chat_id", "initiator_id", "call_type", "started_at"])
+
+
+# KEYS: live call of the chat, live calls set
+# ARGV: key prefix, new call id, chat id, user id, username, channel name, call type, now
+# Returns {call id, initiator id, call type, started at}.
+JOIN_SCRIPT = """
+local call_id = redis.call('GET', KEYS[1])
+if not call_id then
+    call_id = ARGV[2]
+    redis.call('SET', KEYS[1], call_id)
+    redis.call('SADD', KEYS[2], call_id)
+    redis.call('HSET', ARGV[1] .. call_id,
+        'chat_id', ARGV[3], 'initiator_id', ARGV[4], 'call_type', ARGV[7], 'started_at', ARGV[8])
+end
+
+local call = ARGV[1] .. call_id
+redis.call('HSET', call .. ':active', ARGV[4], ARGV[8])
+redis.call('HSET', call .. ':channels', ARGV[4], ARGV[6])
+redis.call('HSET', call .. ':names', ARGV[4], ARGV[5])
+redis.call('HSETNX', call .. ':joined', ARGV[4], ARGV[8])
+redis.call('HDEL', call .. ':left', ARGV[4])
+
+local meta = redis.call('HMGET', call, 'initiator_id', 'call_type', 'started_at')
+return {call_id, meta[1], meta[2], meta[3]}
+"""
+
+# KEYS: none
+# ARGV: key prefix, call id, user id, channel name, now
+HEARTBEAT_SCRIPT = """
+local call = ARGV[1] .. ARGV[2]
+if redis.call('HGET', call .. ':channels', ARGV[3]) ~= ARGV[4] then
+    return 0
+end
+redis.call('HSET', call .. ':active', ARGV[3], ARGV[5])
+return 1
+"""
+
+# Shared by leave and sweep: drops participants that stopped heartbeating and
+# moves the call to the ending set once nobody is left.
+END_IF_EMPTY = """
+local function end_if_empty(prefix, call_id, live_key, ending_key, now, ttl)
+    if redis.call('SISMEMBER', live_key, call_id) == 0 then
+        -- Already ended, e.g. by a leave racing the sweep.
+        return 0
+    end
+
+    local call = prefix .. call_id
+    local active = redis.call('HGETALL', call .. ':active')
+    local last_heartbeat = 0
+    for i = 1, #active, 2 do
+        local heartbeat = tonumber(active[i + 1])
+        if heartbeat < now - ttl then
+            redis.call('HDEL', call .. ':active', active[i])
+            redis.call('HDEL', call .. ':channels', active[i])
+            redis.call('HSET', call .. ':left', active[i], active[i + 1])
+            last_heartbeat = math.max(last_heartbeat, heartbeat)
+        end
+    end
+
+    if redis.call('HLEN', call .. ':active') > 0 then
+        return 0
+    end
+
+    local chat_id = redis.call('HGET', call, 'chat_id')
+    if chat_id then
+        local chat_key = prefix .. 'chat:' .. chat_id
+        if redis.call('GET', chat_key) == call_id then
+            redis.call('DEL', chat_key)
+        end
+    end
+    redis.call('SREM', live_key, call_id)
+    redis.call('SADD', ending_key, call_id)
+    if last_heartbeat > 0 then
+        redis.call('HSET', call, 'ended_at', last_heartbeat)
+    else
+        redis.call('HSET', call, 'ended_at', now)
+    end
+    return 1
+end
+"""
+
+# KEYS: live calls set, ending calls set
+# ARGV: key prefix, call id, user id, channel name, now, ttl
+# Returns 1 when the call ended with this participant leaving.
+LEAVE_SCRIPT = END_IF_EMPTY + """
+local call = ARGV[1] .. ARGV[2]
+if redis.call('HGET', call .. ':channels', ARGV[3]) ~= ARGV[4] then
+    -- The user rejoined from another connection; that one is still in the call.
+    return 0
+end
+redis.call('HDEL', call .. ':active', ARGV[3])
+redis.call('HDEL', call .. ':channels', ARGV[3])
+redis.call('HSET', call .. ':left', ARGV[3], ARGV[5])
+return end_if_empty(ARGV[1], ARGV[2], KEYS[1], KEYS[2], tonumber(ARGV[5]), tonumber(ARGV[6]))
+"""
+
+# Ends one live call if every participant stopped heartbeating (e.g. the
+# worker holding them crashed before running disconnect). The sweep walks the
+# live set with SSCAN and runs this per call, so no single script holds Redis
+# for the whole set.
+# KEYS: live calls set, ending calls set
+# ARGV: key prefix, call id, now, ttl
+SWEEP_SCRIPT = END_IF_EMPTY + """
+return end_if_empty(ARGV[1], ARGV[2], KEYS[1], KEYS[2], tonumber(ARGV[3]), tonumber(ARGV[4]))
+"""
+
+
+class RedisCallStateBackend:
+    PREFIX = "call:"
+    LIVE_KEY = "call:live"
+    ENDING_KEY = "call:ending"
+
+    def __init__(self, url):
+        self.client = redis.Redis.from_url(url, decode_responses=True)
+        self.join_script = self.client.register_script(JOIN_SCRIPT)
+        self.heartbeat_script = self.client.register_script(HEARTBEAT_SCRIPT)
+        self.leave_script = self.client.register_script(LEAVE_SCRIPT)
+        self.sweep_script = self.client.register_script(SWEEP_SCRIPT)
+
+    def call_keys(self, call_id):
+        call = self.PREFIX + call_id
+        return [call] + [f"{call}:{name}" for name in ("active", "channels", "names", "joined", "left")]
+
+    async def join(self, chat_id, user_id, username, channel_name, call_type, now):
+        call_id, initiator_id, call_type, started_at = await self.join_script(
+            keys=[f"{self.PREFIX}chat:{chat_id}", self.LIVE_KEY],
+            args=[self.PREFIX, str(uuid.uuid4()), chat_id, user_id, username, channel_name, call_type, now],
+        )
+        return LiveCall(call_id, chat_id, initiator_id, call_type, float(started_at))
+
+    async def heartbeat(self, call_id, user_id, channel_name, now):
+        await self.heartbeat_script(args=[self.PREFIX, call_id, user_id, channel_name, now])
+
+    async def leave(self, call_id, user_id, channel_name, now, ttl):
+        return bool(await self.leave_script(
+            keys=[self.LIVE_KEY, self.ENDING_KEY],
+            args=[self.PREFIX, call_id, user_id, channel_name, now, ttl],
+        ))
+
+    async def sweep(self, now, ttl, batch_size=100):
+        ended = 0
+        # SSCAN may return a call twice; the script ignores calls no longer live.
+        async for call_id in self.client.sscan_iter(self.LIVE_KEY, count=batch_size):
+            ended += await self.sweep_script(
+                keys=[self.LIVE_KEY, self.ENDING_KEY], args=[self.PREFIX, call_id, now, ttl]
+            )
+        return ended
+
+    async def participants(self, call_id):
+        _, active, _, names, _, _ = self.call_keys(call_id)
+        async with self.client.pipeline(transaction=False) as pipe:
+            pipe.hgetall(active)
+            pipe.hgetall(names)
+            heartbeats, names = await pipe.execute()
+        return {user_id: (float(heartbeat), names.get(user_id, "")) for user_id, heartbeat in heartbeats.items()}
+
+    async def peer_channel(self, call_id, user_id):
+        return await self.client.hget(self.PREFIX + call_id + ":channels", user_id)
+
+    async def ending(self):
+        return await self.client.smembers(self.ENDING_KEY)
+
+    async def snapshot(self, call_id):
+        call, _, _, _, joined, left = self.call_keys(call_id)
+        async with self.client.pipeline(transaction=False) as pipe:
+            pipe.hgetall(call)
+            pipe.hgetall(joined)
+            pipe.hgetall(left)
+            meta, joined, left = await pipe.execute()
+        if not meta:
+            return None
+        return {
+            "id": call_id,
+            "chat_id": meta["chat_id"],
+            "initiator_id": meta["initiator_id"],
+            "call_type": meta["call_type"],
+            "started_at": float(meta["started_at"]),
+            "ended_at": float(meta["ended_at"]),
+            "participants": {
+                user_id: (float(joined_at), float(left[user_id]) if user_id in left else None)
+                for user_id, joined_at in joined.items()
+            },
+        }
+
+    async def discard(self, call_id):
+        async with self.client.pipeline(transaction=True) as pipe:
+            pipe.delete(*self.call_keys(call_id))
+            pipe.srem(self.ENDING_KEY, call_id)
+            await pipe.execute()
+
+
+class MemoryCallStateBackend:
+    """Per-process call state for development and tests."""
+
+    def __init__(self):
+        self.chats = {}
+        self.calls = {}
+        self.live = set()
+        self.ending_calls = set()
+
+    async def join(self, chat_id, user_id, username, channel_name, call_type, now):
+        call_id = self.chats.get(chat_id)
+        if call_id is None:
+            call_id = self.chats[chat_id] = str(uuid.uuid4())
+            self.live.add(call_id)
+            self.calls[call_id] = {
+                "id": call_id,
+                "chat_id": chat_id,
+                "initiator_id": user_id,
+                "call_type": call_type,
+                "started_at": now,
+                "ended_at": None,
+                "active": {},
+                "channels": {},
+                "names": {},
+                "joined": {},
+                "left": {},
+            }
+
+        call = self.calls[call_id]
+        call["active"][user_id] = now
+        call["channels"][user_id] = channel_name
+        call["names"][user_id] = username
+        call["joined"].setdefault(user_id, now)
+        call["left"].pop(user_id, None)
+        return LiveCall(call_id, chat_id, call["initiator_id"], call["call_type"], call["started_at"])
+
+    async def heartbeat(self, call_id, user_id, channel_name, now):
+        call = self.calls.get(call_id)
+        if call is not None and call["channels"].get(user_id) == channel_name:
+            call["active"][user_id] = now
+
+    async def leave(self, call_id, user_id, channel_name, now, ttl):
+        call = self.calls.get(call_id)
+        if call is None or call["channels"].get(user_id) != channel_name:
+            return False
+        del call["active"][user_id]
+        del call["channels"][user_id]
+        call["left"][user_id] = now
+        return self._end_if_empty(call_id, now, ttl)
+
+    def _end_if_empty(self, call_id, now, ttl):
+        call = self.calls[call_id]
+        stale = {user_id: heartbeat for user_id, heartbeat in call["active"].items() if heartbeat < now - ttl}
+        for user_id, heartbeat in stale.items():
+            del call["active"][user_id]
+            call["channels"].pop(user_id, None)
+            call["left"][user_id] = heartbeat
+
+        if call["active"]:
+            return False
+
+        if self.chats.get(call["chat_id"]) == call_id:
+            del self.chats[call["chat_id"]]
+        self.live.discard(call_id)
+        self.ending_calls.add(call_id)
+        call["ended_at"] = max(stale.values()) if stale else now
+        return True
+
+    async def sweep(self, now, ttl):
+        return sum(self._end_if_empty(call_id, now, ttl) for call_id in list(self.live))
+
+    async def participants(self, call_id):
+        call = self.calls.get(call_id, {"active": {}, "names": {}})
+        return {user_id: (heartbeat, call["names"][user_id]) for user_id, heartbeat in call["active"].items()}
+
+    async def peer_channel(self, call_id, user_id):
+        return self.calls.get(call_id, {"channels": {}})["channels"].get(user_id)
+
+    async def ending(self):
+        return set(self.ending_calls)
+
+    async def snapshot(self, call_id):
+        call = self.calls.get(call_id)
+        if call is None:
+            return None
+        return {
+            **{key: call[key] for key in ("id", "chat_id", "initiator_id", "call_type", "started_at", "ended_at")},
+            "participants": {
+                user_id: (joined_at, call["left"].get(user_id))
+                for user_id, joined_at in call["joined"].items()
+            },
+        }
+
+    async def discard(self, call_id):
+        self.calls.pop(call_id, None)
+        self.ending_calls.discard(call_id)
+
+
+def _datetime(timestamp):
+    return datetime.fromtimestamp(timestamp, tz=dt_timezone.utc)
+
+
+class CallStateEngine:
+    """
+    Keeps live calls and their participant sets out of the database.
+
+    Joins, leaves, rejoins and heartbeats only touch the shared store, and
+    "who is in the call" is answered from it. When the last participant
+    leaves, the call is moved to an ending set and written as one ``Call``
+    with its ``CallParticipant`` rows in a single transaction, so the
+    database sees each call exactly once, already finished.
+
+    ``reconcile`` recovers from crashed workers: calls whose participants all
+    stopped heartbeating are ended, calls left in the ending set are
+    persisted, and ``Call`` rows still marked ONGOING (which this engine never
+    writes) are closed off.
+    """
+
+    def __init__(self, backend, ttl=60, sweep_interval=30):
+        self.backend = backend
+        self.ttl = ttl
+        self.sweep_interval = sweep_interval
+        self._touched = {}
+        self._sweeper = None
+
+    async def join(self, chat_id, user_id, username, channel_name, call_type=Call.CallType.AUDIO):
+        now = time.time()
+        call = await self.backend.join(str(chat_id), str(user_id), username, channel_name, call_type, now)
+        self._touched[(call.id, str(user_id))] = now
+        self.ensure_sweeper()
+        return call
+
+    async def heartbeat(self, call_id, user_id, channel_name):
+        """Refresh a participant; calls within a third of ``ttl`` are absorbed locally."""
+        user_id = str(user_id)
+        now = time.time()
+        if now - self._touched.get((call_id, user_id), 0) < self.ttl / 3:
+            return
+        self._touched[(call_id, user_id)] = now
+        await self.backend.heartbeat(call_id, user_id, channel_name, now)
+
+    async def leave(self, call_id, user_id, channel_name):
+        """Remove the participant; returns True if that ended the call."""
+        self._touched.pop((call_id, str(user_id)), None)
+        ended = await self.backend.leave(call_id, str(user_id), channel_name, time.time(), self.ttl)
+        if ended:
+            await self.finalize(call_id)
+        return ended
+
+    async def participants(self, call_id):
+        cutoff = time.time() - self.ttl
+        participants = await self.backend.participants(call_id)
+        return [
+            {"user_id": user_id, "username": username}
+            for user_id, (heartbeat, username) in participants.items()
+            if heartbeat >= cutoff
+        ]
+
+    async def peer_channel(self, call_id, user_id):
+        return await self.backend.peer_channel(call_id, str(user_id))
+
+    async def finalize(self, call_id):
+        snapshot = await self.backend.snapshot(call_id)
+        if snapshot is not None:
+            try:
+                await database_sync_to_async(self._persist)(snapshot)
+            except IntegrityError as e:
+                # The chat or a participant was deleted mid-call; nothing to keep.
+                logger.error(f"Dropping call {call_id}: {str(e)}")
+        await self.backend.discard(call_id)
+
+    def _persist(self, snapshot):
+        initiator_id = snapshot["initiator_id"]
+        answered = any(user_id != initiator_id for user_id in snapshot["participants"])
+        ended_at = _datetime(snapshot["ended_at"])
+
+        with transaction.atomic():
+            Call.objects.bulk_create([
+                Call(
+                    id=snapshot["id"],
+                    chat_id=snapshot["chat_id"],
+                    initiator_id=initiator_id,
+                    call_type=snapshot["call_type"],
+                    call_status=Call.CallStatus.COMPLETED if answered else Call.CallStatus.MISSED,
+                    started_at=_datetime(snapshot["started_at"]),
+                    ended_at=ended_at,
+                )
+            ], ignore_conflicts=True)
+            CallParticipant.objects.bulk_create([
+                CallParticipant(
+                    call_id=snapshot["id"],
+                    user_id=user_id,
+                    joined_at=_datetime(joined_at),
+                    left_at=_datetime(left_at) if left_at else ended_at,
+                )
+                for user_id, (joined_at, left_at) in snapshot["participants"].items()
+            ], ignore_conflicts=True)
+
+    async def reconcile(self):
+        ended = await self.backend.sweep(time.time(), self.ttl)
+        if ended:
+            logger.info(f"Ended {ended} abandoned call(s).")
+
+        for call_id in await self.backend.ending():
+            await self.finalize(call_id)
+
+        closed = await database_sync_to_async(self._close_orphaned_calls)()
+        if closed:
+            logger.info(f"Closed {closed} orphaned ongoing call(s).")
+
+    def _close_orphaned_calls(self):
+        with transaction.atomic():
+            calls = list(Call.objects.select_for_update().filter(call_status=Call.CallStatus.ONGOING))
+            if not calls:
+                return 0
+
+            participants = list(CallParticipant.objects.filter(call__in=calls))
+            by_call = {}
+            for participant in participants:
+                by_call.setdefault(participant.call_id, []).append(participant)
+
+            for call in calls:
+                members = by_call.get(call.id, [])
+                left = [participant.left_at for participant in members if participant.left_at]
+                call.ended_at = max(left, default=call.started_at)
+                answered = any(participant.user_id != call.initiator_id for participant in members)
+                call.call_status = Call.CallStatus.COMPLETED if answered else Call.CallStatus.MISSED
+                for participant in members:
+                    if participant.left_at is None:
+                        participant.left_at = call.ended_at
+
+            Call.objects.bulk_update(calls, ["call_status", "ended_at"])
+            CallParticipant.objects.bulk_update(participants, ["left_at"])
+        return len(calls)
+
+    def ensure_sweeper(self):
+        if self._sweeper is None or self._sweeper.done():
+            self._sweeper = asyncio.ensure_future(self._sweep_forever())
+
+    async def _sweep_forever(self):
+        while True:
+            await asyncio.sleep(self.sweep_interval)
+            try:
+                await self.reconcile()
+            except Exception as e:
+                logger.error(f"Call state sweep failed: {str(e)}")
+
+
+def get_backend():
+    if settings.CALL_STATE_BACKEND == "memory":
+        return MemoryCallStateBackend()
+    return RedisCallStateBackend(settings.CALL_STATE_REDIS_URL)
+
+
+call_state = CallStateEngine(
+    get_backend(),
+    ttl=settings.CALL_STATE_TTL,
+    sweep_interval=settings.CALL_STATE_SWEEP_INTERVAL,
+)
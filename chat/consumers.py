@@ -1,20 +1,60 @@
+import asyncio
 import json
+from urllib.parse import parse_qs
+
+import msgpack
+from redis.exceptions import RedisError
+
 from channels.generic.websocket import AsyncWebsocketConsumer
 from channels.db import database_sync_to_async
+from django.conf import settings
+from django.db import transaction
 
-from chat.models import Chat, ChatMember, Message
-from chat.utils import rate_limit
+from chat.binary_clients import binary_clients
+from chat.calls import call_state
+from chat.history import InvalidCursor, clamp_page_size, fetch_history, history_frame_row
+from chat.inbox import update_last_message
+from chat.membership import membership_cache
+from chat.models import Call, Message
+from chat.persistence import message_write_behind
+from chat.ratelimit import TokenBucket
+from chat.receipts import DELIVERED, READ, receipt_coalescer
+from chat.typing_roster import typing_aggregator
+from chat.unread import increment_unread
+from chat.utils import (
+    MSGPACK_SUBPROTOCOL,
+    decode_binary_frame,
+    encode_binary_frame,
+    encode_frame,
+    frame_event,
+    parse_uuid,
+    rate_limit,
+)
+from myproject.metrics import WORKER, channel_layer_sends, database_calls, websocket_connections, websocket_events
+from myproject.profiling import ProfiledDispatchMixin
+from users.presence import presence
 
 
 from loguru import logger
 
-from uuid import UUID
 
-class ChatConsumer(AsyncWebsocketConsumer):
+class ChatConsumer(ProfiledDispatchMixin, AsyncWebsocketConsumer):
+    """
+    Chat events over JSON text frames or, for clients offering the
+    ``msgpack`` subprotocol, MessagePack binary frames both ways.
+    """
+
+    # Inbound frame types timed under their own name; anything else is "unknown".
+    EVENTS = ("heartbeat", "typing", "chat_message", "receipt", "history")
+
+    @websocket_events.track(consumer="chat", event="connect")
     async def connect(self):
         self.user = self.scope["user"]
         self.chat_id = self.scope["url_route"]["kwargs"]["chat_id"]
         self.group_name = f"chat_{self.chat_id}"
+        self.tracking_presence = False
+        self.counted_binary = False
+        self.binary = MSGPACK_SUBPROTOCOL in (self.scope.get("subprotocols") or [])
 
         if not self.user.is_authenticated:
             logger.error(f"Anonymous user tried to connect to chat {self.chat_id}.")
@@ -26,13 +66,8 @@ class ChatConsumer(AsyncWebsocketConsumer):
             await self.close()
             return
         
-        if not await self.chat_exists(self.chat_id):
-            logger.error(f"Chat {self.chat_id} does not exist.")
-            await self.close()
-            return
-
-        if not await self.is_user_member(self.chat_id, self.user.id):
-            logger.error(f"User is not a member of chat {self.chat_id}.")
+        if not await membership_cache.is_member(self.chat_id, self.user.id):
+            logger.error(f"User is not a member of chat {self.chat_id} or it does not exist.")
             await self.close()
             return
 
@@ -41,10 +76,21 @@ class ChatConsumer(AsyncWebsocketConsumer):
             self.channel_name
         )
 
+        if self.binary:
+            # Counted before accepting, so the client's first frames already carry bytes.
+            await binary_clients.add(self.group_name)
+            self.counted_binary = True
+
         logger.info(f"User {self.user.get_full_name()} connected to chat {self.chat_id}.")
-        await self.accept()
+        # Only one subprotocol can be echoed back; the token one is just a
+        # carrier, so the frame protocol wins when both are offered.
+        await self.accept(MSGPACK_SUBPROTOCOL if self.binary else self.scope.get("auth_subprotocol"))
+        websocket_connections.inc(consumer="chat", worker=WORKER)
+        await presence.connect(self.user.id, self.channel_name)
+        self.tracking_presence = True
 
 
+    @websocket_events.track(consumer="chat", event="disconnect")
     async def disconnect(self, close_code):
         if self.channel_layer is not None:
             await self.channel_layer.group_discard(
@@ -52,39 +98,67 @@ class ChatConsumer(AsyncWebsocketConsumer):
                 self.channel_name
             )
 
-        logger.info(f"User {self.user.get_full_name()} disconnected from chat {self.chat_id}.")
+        if self.counted_binary:
+            # Counted before accept, so a handshake failing after that still
+            # has to give its count back.
+            await binary_clients.discard(self.group_name)
+            self.counted_binary = False
+
+        if self.tracking_presence:
+            websocket_connections.dec(consumer="chat", worker=WORKER)
+            await presence.disconnect(self.user.id, self.channel_name)
+
+        if self.user.is_authenticated:
+            logger.info(f"User {self.user.get_full_name()} disconnected from chat {self.chat_id}.")
+
+    async def receive(self, text_data=None, bytes_data=None):
+        try:
+            data = decode_binary_frame(bytes_data) if bytes_data is not None else json.loads(text_data)
+            msg_type = data.get("type")
+        except (ValueError, AttributeError, msgpack.UnpackException) as e:
+            logger.warning(f"Malformed frame from user {self.user.id}: {str(e)}")
+            await self.send_error("Malformed frame.", event_type="validation_error")
+            return
+
+        event = msg_type if msg_type in self.EVENTS else "unknown"
+        with websocket_events.time(consumer="chat", event=event):
+            # Any inbound frame proves the connection is alive; the tracker
+            # throttles these so only an occasional one reaches the backend.
+            await presence.heartbeat(self.user.id, self.channel_name)
+
+            match msg_type:
+                case "heartbeat":
+                    pass
+
+                case "typing":
+                    is_typing = data.get("is_typing", True)
+                    await self.handle_typing(is_typing)
+
+                case "chat_message":
+                    await self.handle_chat_message(
+                    data.get("content", ""),
+                    data.get("reply_to_id")
+                )
+                case "receipt":
+                    await self.handle_receipt(
+                        data.get("status"),
+                        data.get("message_id")
+                    )
+                case "history":
+                    await self.handle_history(
+                        data.get("before"),
+                        data.get("limit")
+                    )
+                case _:
+                    logger.warning(f"Unknown message type: {msg_type} from user {self.user.id}")
 
-    async def receive(self, text_data):
-        data = json.loads(text_data)
-        
-        msg_type = data.get("type")
-        
-        match msg_type:
-            case "typing":
-                is_typing = data.get("is_typing", False)
-                await self.handle_typing(is_typing)
-                
-            case "chat_message":
-                await self.handle_chat_message(
-                data.get("content", ""),
-                data.get("reply_to_id")
-            )
-            case _:
-                logger.warning(f"Unknown message type: {msg_type} from user {self.user.id}")
-                
-                
-    @rate_limit("typing_event", 2)  
     async def handle_typing(self, is_typing):
-        if self.channel_layer is not None:
-            await self.channel_layer.group_send(
-                self.group_name,
-                {
-                    "type": "typing_status",
-                    "user_id": self.user.id,
-                    "username": self.user.get_full_name(),
-                    "is_typing": is_typing,
-                }
-            )
+        await typing_aggregator.update(
+            self.chat_id,
+            self.user.id,
+            self.user.get_full_name(),
+            bool(is_typing),
+        )
             
     async def handle_chat_message(self, content, reply_to_id=None):
         if not content.strip():
@@ -93,59 +167,147 @@ class ChatConsumer(AsyncWebsocketConsumer):
 
         try:
             if reply_to_id:
-                reply_to_id = UUID(reply_to_id)
+                reply_to_id = parse_uuid(reply_to_id)
         except (ValueError, TypeError):
             await self.send_error("Invalid Message Reply Id.", event_type="validation_error")
             return
 
-        message = await self.create_message(
-            content=content,
-            sender=self.user,
-            chat_id=self.chat_id,
-            reply_to_id=reply_to_id
-        )
+        # Checked before the fan-out: with write-behind the message is
+        # broadcast before its INSERT could reject the reference.
+        if reply_to_id and not await self.reply_target_exists(reply_to_id):
+            await self.send_error("Invalid Message Reply Id.", event_type="validation_error")
+            return
 
-        if self.channel_layer is not None:
-            await self.channel_layer.group_send(
-                self.group_name,
-                {
-                    "type": "chat_message_event",
-                    "message": {
-                        "type": "chat_message",
-                        "id": str(message.id),
-                        "content": message.content,
-                        "sender": self.user.get_full_name(),
-                        "chat_id": str(message.chat_id),
-                        "reply_to_id": str(message.reply_to_id) if message.reply_to_id else None,
-                        "created_at": message.created_at.isoformat(),
-                        "updated_at": message.updated_at.isoformat(),
-                    }
-                }
+        if settings.CHAT_WRITE_BEHIND_ENABLED:
+            message = await self.queue_message(
+                content=content,
+                sender=self.user,
+                chat_id=self.chat_id,
+                reply_to_id=reply_to_id
+            )
+        else:
+            message = await self.create_message(
+                content=content,
+                sender=self.user,
+                chat_id=self.chat_id,
+                reply_to_id=reply_to_id
             )
 
-            
-    async def chat_message_event(self, event):
-        await self.send(text_data=json.dumps(event["message"]))
+        await self.broadcast_frame({
+            "type": "chat_message",
+            "id": message.id,
+            "content": message.content,
+            "sender": self.user.get_full_name(),
+            "chat_id": message.chat_id,
+            "reply_to_id": message.reply_to_id,
+            "created_at": message.created_at,
+            "updated_at": message.updated_at,
+        })
 
-    @database_sync_to_async
-    def chat_exists(self, chat_id):
-        return Chat.objects.filter(id=chat_id).exists()
+    async def handle_receipt(self, status, message_id):
+        """
+        Record that this user has received or read everything up to
+        ``message_id``. Receipts are coalesced and persisted in batches.
+        """
+        if status not in (DELIVERED, READ):
+            await self.send_error("Invalid receipt status.", event_type="validation_error")
+            return
 
-    @database_sync_to_async
-    def is_user_member(self, chat_id, user_id):
-        return ChatMember.objects.filter(chat_id=chat_id, user_id=user_id).exists()
+        try:
+            message_id = parse_uuid(message_id)
+        except (ValueError, TypeError):
+            await self.send_error("Invalid Message Id.", event_type="validation_error")
+            return
+
+        await receipt_coalescer.record(self.chat_id, self.user.id, status, message_id)
+
+    @rate_limit("history", policy=TokenBucket(rate=2, capacity=10))
+    async def handle_history(self, before=None, limit=None):
+        try:
+            with database_calls.time(call="fetch_history"):
+                messages, next_cursor = await database_sync_to_async(fetch_history)(
+                    self.chat_id,
+                    before=before,
+                    limit=clamp_page_size(limit),
+                    serialize=history_frame_row,
+                )
+        except InvalidCursor as e:
+            await self.send_error(str(e), event_type="validation_error")
+            return
+
+        await self.send_frame({
+            "type": "history",
+            "messages": messages,
+            "next_cursor": next_cursor,
+        })
+
+    async def send_frame(self, payload):
+        if self.binary:
+            await self.send(bytes_data=encode_binary_frame(payload))
+        else:
+            await self.send(text_data=encode_frame(payload))
+
+    async def broadcast_frame(self, payload):
+        """
+        Encode ``payload`` once per protocol in use and fan the prepared
+        frames out to the chat group; receiving consumers forward theirs as-is.
+        """
+        if self.channel_layer is not None:
+            event = frame_event(payload, binary=await binary_clients.any(self.group_name))
+            with channel_layer_sends.time(method="group_send", source="chat"):
+                await self.channel_layer.group_send(self.group_name, event)
+
+    async def frame_event(self, event):
+        if not self.binary:
+            await self.send(text_data=event["text"])
+        elif "bytes" in event:
+            await self.send(bytes_data=event["bytes"])
+        else:
+            # Sent by a worker that had not seen a binary client in the group
+            # yet. Binary frames carry the same values as text ones, so the
+            # re-encoded text gives the bytes that worker would have sent.
+            await self.send(bytes_data=encode_binary_frame(json.loads(event["text"])))
 
+    @database_calls.track(call="create_message")
     @database_sync_to_async
     def create_message(self, content, sender, chat_id, message_type="text", reply_to_id=None):
         kwargs = {
             "content": content,
-            "sender": sender,
+            "sender_id": sender.id,
             "chat_id": chat_id,
             "type": message_type, 
         }
         if reply_to_id:
             kwargs["reply_to_id"] = reply_to_id
-        return Message.objects.create(**kwargs)
+        with transaction.atomic():
+            message = Message.objects.create(**kwargs)
+            increment_unread([message])
+            update_last_message([message])
+        return message
+
+    async def reply_target_exists(self, reply_to_id):
+        """Whether ``reply_to_id`` is a message of this chat."""
+        if settings.CHAT_WRITE_BEHIND_ENABLED:
+            return await message_write_behind.has_message(self.chat_id, reply_to_id)
+        with database_calls.time(call="reply_target"):
+            return await database_sync_to_async(
+                Message.objects.filter(id=reply_to_id, chat_id=self.chat_id).exists
+            )()
+
+    async def queue_message(self, content, sender, chat_id, message_type="text", reply_to_id=None):
+        """
+        Build the message in memory and hand it to the write-behind queue.
+        The id and timestamps are final, so the fan-out can go out right away.
+        """
+        message = Message(
+            content=content,
+            sender_id=sender.id,
+            chat_id=chat_id,
+            type=message_type,
+            reply_to_id=reply_to_id,
+        )
+        message.updated_at = message.created_at
+        return await message_write_behind.enqueue(message)
 
     async def send_error(self, error_message, event_type="error"):
         """
@@ -155,4 +317,231 @@ class ChatConsumer(AsyncWebsocketConsumer):
             "message": error_message,
             "type": event_type,
         }
-        await self.send(text_data=json.dumps(payload))
+        await self.send_frame(payload)
+
+
+class SignalingConsumer(ProfiledDispatchMixin, AsyncWebsocketConsumer):
+    """
+    WebRTC signaling for a chat's call.
+
+    Offers, answers and ICE candidates are addressed to one participant and
+    sent straight to that participant's channel, looked up once in the call
+    state store and then remembered. Only join/leave notices go to the
+    whole call group. Trickled candidates are held for up to
+    ``CANDIDATE_BATCH_WINDOW`` seconds (or ``CANDIDATE_BATCH_SIZE``
+    candidates) and delivered as one ``candidates`` frame.
+
+    Media flows peer to peer, so clients must send ``heartbeat`` frames while
+    the call is up; participants silent for ``CALL_STATE_TTL`` seconds are
+    treated as gone.
+    """
+
+    CANDIDATE_BATCH_SIZE = 8
+    CANDIDATE_BATCH_WINDOW = 0.02
+    EVENTS = ("heartbeat", "offer", "answer", "candidate", "hangup")
+
+    @websocket_events.track(consumer="signaling", event="connect")
+    async def connect(self):
+        self.user = self.scope["user"]
+        self.chat_id = self.scope["url_route"]["kwargs"]["chat_id"]
+        self.call = None
+        self.peers = {}
+        self.pending_candidates = {}
+        self.candidate_flushers = {}
+
+        if not self.user.is_authenticated:
+            logger.error(f"Anonymous user tried to join the call in chat {self.chat_id}.")
+            await self.close()
+            return
+
+        if self.channel_layer is None:
+            logger.error("Channel layer is not configured.")
+            await self.close()
+            return
+
+        if not await membership_cache.is_member(self.chat_id, self.user.id):
+            logger.error(f"User is not a member of chat {self.chat_id} or it does not exist.")
+            await self.close()
+            return
+
+        query = parse_qs(self.scope.get("query_string", b"").decode())
+        call_type = query.get("call_type", [Call.CallType.AUDIO])[0]
+        if call_type not in Call.CallType.values:
+            call_type = Call.CallType.AUDIO
+
+        self.call = await call_state.join(
+            self.chat_id, self.user.id, self.user.get_full_name(), self.channel_name, call_type
+        )
+        self.group_name = f"call_{self.call.id}"
+
+        await self.channel_layer.group_add(self.group_name, self.channel_name)
+        await self.accept(self.scope.get("auth_subprotocol"))
+        websocket_connections.inc(consumer="signaling", worker=WORKER)
+
+        await self.send(text_data=encode_frame({
+            "type": "call_joined",
+            "call_id": self.call.id,
+            "call_type": self.call.call_type,
+            "participants": await call_state.participants(self.call.id),
+        }))
+        with channel_layer_sends.time(method="group_send", source="signaling"):
+            await self.channel_layer.group_send(
+                self.group_name,
+                {
+                    "type": "participant_event",
+                    "user_id": str(self.user.id),
+                    "channel_name": self.channel_name,
+                    "text": encode_frame({
+                        "type": "participant_joined",
+                        "user_id": str(self.user.id),
+                        "username": self.user.get_full_name(),
+                    }),
+                }
+            )
+        logger.info(f"User {self.user.get_full_name()} joined call {self.call.id}.")
+
+    @websocket_events.track(consumer="signaling", event="disconnect")
+    async def disconnect(self, close_code):
+        if self.call is None:
+            return
+
+        websocket_connections.dec(consumer="signaling", worker=WORKER)
+        for flusher in self.candidate_flushers.values():
+            flusher.cancel()
+
+        await self.channel_layer.group_discard(self.group_name, self.channel_name)
+        try:
+            await call_state.leave(self.call.id, self.user.id, self.channel_name)
+        except RedisError as e:
+            # The peers still have to hear about it; without heartbeats the
+            # sweep drops this participant within CALL_STATE_TTL.
+            logger.error(f"Could not remove user {self.user.id} from call {self.call.id}: {str(e)}")
+        with channel_layer_sends.time(method="group_send", source="signaling"):
+            await self.channel_layer.group_send(
+                self.group_name,
+                {
+                    "type": "participant_event",
+                    "user_id": str(self.user.id),
+                    "channel_name": None,
+                    "text": encode_frame({
+                        "type": "participant_left",
+                        "user_id": str(self.user.id),
+                    }),
+                }
+            )
+        logger.info(f"User {self.user.get_full_name()} left call {self.call.id}.")
+
+    async def receive(self, text_data=None, bytes_data=None):
+        try:
+            # JSON either way; some clients send it in binary frames.
+            data = json.loads(text_data if text_data is not None else bytes_data)
+            msg_type = data.get("type")
+            target = data.get("to")
+        except (ValueError, TypeError, AttributeError) as e:
+            logger.warning(f"Malformed signaling frame from user {self.user.id}: {str(e)}")
+            await self.send_error("Malformed frame.", event_type="validation_error")
+            return
+
+        try:
+            await call_state.heartbeat(self.call.id, self.user.id, self.channel_name)
+        except RedisError as e:
+            # The next frame refreshes it; the TTL allows for a few misses.
+            logger.warning(f"Could not refresh user {self.user.id} in call {self.call.id}: {str(e)}")
+
+        event = msg_type if msg_type in self.EVENTS else "unknown"
+        with websocket_events.time(consumer="signaling", event=event):
+            try:
+                match msg_type:
+                    case "heartbeat":
+                        pass
+                    case "offer" | "answer":
+                        # Candidates already gathered for this peer must not overtake
+                        # the description they belong with.
+                        await self.flush_candidates(target)
+                        await self.send_to_peer(target, {
+                            "type": msg_type,
+                            "from": str(self.user.id),
+                            "sdp": data.get("sdp"),
+                        })
+                    case "candidate":
+                        await self.queue_candidate(target, data.get("candidate"))
+                    case "hangup":
+                        await self.close()
+                    case _:
+                        logger.warning(f"Unknown signaling type: {msg_type} from user {self.user.id}")
+            except RedisError as e:
+                logger.error(f"Call state unavailable for user {self.user.id} in call {self.call.id}: {str(e)}")
+                await self.send_error("Call state is unavailable, try again.", event_type="signaling_error")
+
+    async def queue_candidate(self, target, candidate):
+        if not target:
+            await self.send_error("Signaling frames need a 'to' participant.", event_type="validation_error")
+            return
+
+        pending = self.pending_candidates.setdefault(target, [])
+        pending.append(candidate)
+
+        # A null candidate marks the end of gathering; no point waiting.
+        if candidate is None or len(pending) >= self.CANDIDATE_BATCH_SIZE:
+            await self.flush_candidates(target)
+        elif target not in self.candidate_flushers:
+            self.candidate_flushers[target] = asyncio.ensure_future(self.flush_candidates_later(target))
+
+    async def flush_candidates_later(self, target):
+        await asyncio.sleep(self.CANDIDATE_BATCH_WINDOW)
+        self.candidate_flushers.pop(target, None)
+        try:
+            await self.flush_candidates(target)
+        except RedisError as e:
+            logger.error(f"Call state unavailable for user {self.user.id} in call {self.call.id}: {str(e)}")
+            await self.send_error("Call state is unavailable, try again.", event_type="signaling_error")
+
+    async def flush_candidates(self, target):
+        flusher = self.candidate_flushers.pop(target, None)
+        if flusher is not None and flusher is not asyncio.current_task():
+            flusher.cancel()
+
+        candidates = self.pending_candidates.pop(target, None)
+        if candidates:
+            await self.send_to_peer(target, {
+                "type": "candidates",
+                "from": str(self.user.id),
+                "candidates": candidates,
+            })
+
+    async def send_to_peer(self, user_id, payload):
+        if not user_id:
+            await self.send_error("Signaling frames need a 'to' participant.", event_type="validation_error")
+            return
+
+        channel_name = self.peers.get(user_id)
+        if channel_name is None:
+            channel_name = await call_state.peer_channel(self.call.id, user_id)
+            if channel_name is None:
+                await self.send_error("Participant is not in the call.", event_type="signaling_error")
+                return
+            self.peers[user_id] = channel_name
+
+        with channel_layer_sends.time(method="send", source="signaling"):
+            await self.channel_layer.send(channel_name, {
+                "type": "frame_event",
+                "text": encode_frame(payload),
+            })
+
+    async def participant_event(self, event):
+        # Keep the peer directory current so signaling skips the lookup.
+        if event["user_id"] != str(self.user.id):
+            if event["channel_name"]:
+                self.peers[event["user_id"]] = event["channel_name"]
+            else:
+                self.peers.pop(event["user_id"], None)
+        await self.send(text_data=event["text"])
+
+    async def frame_event(self, event):
+        await self.send(text_data=event["text"])
+
+    async def send_error(self, error_message, event_type="error"):
+        await self.send(text_data=encode_frame({
+            "message": error_message,
+            "type": event_type,
+        }))
@@ -0,0 +1,142 @@
+import base64
+import binascii
+from datetime import datetime
+from uuid import UUID
+
+from django.conf import settings
+from django.db.models import Q, Subquery
+
+from chat.archive import archive_horizon
+from chat.models import ArchivedMessage, Chat, Message
+
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 100
+
+HISTORY_FIELDS = (
+    "id",
+    "type",
+    "content",
+    "chat_id",
+    "sender_id",
+    "sender__first_name",
+    "sender__last_name",
+    "reply_to_id",
+    "created_at",
+    "updated_at",
+)
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def encode_cursor(created_at, message_id):
+    raw = f"{created_at.isoformat()}|{message_id}".encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor):
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode()
+        created_at, message_id = raw.split("|")
+        return datetime.fromisoformat(created_at), UUID(message_id)
+    except (binascii.Error, UnicodeDecodeError, ValueError) as e:
+        raise InvalidCursor("Invalid history cursor.") from e
+
+
+def clamp_page_size(limit):
+    try:
+        limit = int(limit)
+    except (TypeError, ValueError):
+        return DEFAULT_PAGE_SIZE
+    return max(1, min(limit, MAX_PAGE_SIZE))
+
+
+def fetch_history(chat_id, before=None, limit=DEFAULT_PAGE_SIZE, serialize=None):
+    """
+    Return one page of a chat's messages, newest first, and the cursor for
+    the next (older) page or ``None`` when there is nothing left.
+
+    Pages are addressed by ``(created_at, id)`` keyset rather than OFFSET, so
+    every page is a bounded range scan of ``msg_chat_live_history_idx`` no
+    matter how deep the client has scrolled. No COUNT is ever issued; one
+    extra row is fetched to tell whether another page exists. Rows go through
+    ``serialize``, ``serialize_history_row`` unless given.
+
+    With ``MESSAGE_ARCHIVE_ENABLED``, pages that reach back past the archive
+    horizon also read ``ArchivedMessage`` with the same keyset and merge the
+    two; recent pages never touch the archive, and neither do pages of chats
+    with nothing archived before the cursor (``Chat.first_archived_at``,
+    read along with the page).
+    """
+    cursor = decode_cursor(before) if before else None
+    queryset = Message.objects.filter(chat_id=chat_id, deleted_at__isnull=True)
+    if not settings.MESSAGE_ARCHIVE_ENABLED:
+        rows = _newest_first(queryset, cursor, limit)
+    else:
+        queryset = queryset.annotate(
+            first_archived_at=Subquery(Chat.objects.filter(id=chat_id).values("first_archived_at")[:1])
+        )
+        rows = _newest_first(queryset, cursor, limit, "first_archived_at")
+        if _reaches_archive(rows, cursor, limit):
+            archived = _newest_first(ArchivedMessage.objects.filter(chat_id=chat_id, deleted_at__isnull=True), cursor, limit)
+            rows = sorted(rows + archived, key=lambda row: (row["created_at"], row["id"]), reverse=True)[: limit + 1]
+
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor(rows[-1]["created_at"], rows[-1]["id"])
+
+    serialize = serialize or serialize_history_row
+    return [serialize(row) for row in rows], next_cursor
+
+
+def _reaches_archive(rows, cursor, limit):
+    if not rows:
+        # Nothing hot left to carry the watermark; only the archive can tell.
+        return True
+    first_archived_at = rows[0]["first_archived_at"]
+    if first_archived_at is None or (cursor and cursor[0] < first_archived_at):
+        return False
+    return len(rows) <= limit or rows[-1]["created_at"] < archive_horizon()
+
+
+def _newest_first(queryset, cursor, limit, *extra):
+    if cursor:
+        created_at, message_id = cursor
+        # The redundant created_at__lte bound gives the planner a range it can
+        # seek to; the OR alone is not sargable on every backend.
+        queryset = queryset.filter(created_at__lte=created_at).filter(
+            Q(created_at__lt=created_at) | Q(created_at=created_at, id__lt=message_id)
+        )
+    return list(queryset.order_by("-created_at", "-id").values(*HISTORY_FIELDS, *extra)[: limit + 1])
+
+
+def serialize_history_row(row):
+    return {
+        "id": str(row["id"]),
+        "message_type": row["type"],
+        "content": row["content"],
+        "sender": f"{row['sender__first_name']} {row['sender__last_name']}",
+        "sender_id": str(row["sender_id"]),
+        "chat_id": str(row["chat_id"]),
+        "reply_to_id": str(row["reply_to_id"]) if row["reply_to_id"] else None,
+        "created_at": row["created_at"].isoformat(),
+        "updated_at": row["updated_at"].isoformat(),
+    }
+
+
+def history_frame_row(row):
+    """Like ``serialize_history_row`` but leaves UUIDs and datetimes to the websocket frame encoders."""
+    return {
+        "id": row["id"],
+        "message_type": row["type"],
+        "content": row["content"],
+        "sender": f"{row['sender__first_name']} {row['sender__last_name']}",
+        "sender_id": row["sender_id"],
+        "chat_id": row["chat_id"],
+        "reply_to_id": row["reply_to_id"],
+        "created_at": row["created_at"],
+        "updated_at": row["updated_at"],
+    }
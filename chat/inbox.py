@@ -0,0 +1,106 @@
+from django.db.models import F, Q
+
+from chat.history import DEFAULT_PAGE_SIZE, decode_cursor, encode_cursor
+from chat.models import Chat, ChatMember
+from users.presence import presence
+
+
+PREVIEW_LENGTH = 100
+
+
+def update_last_message(messages):
+    """
+    Point each chat at its newest message in ``messages``. The update is
+    conditional on the message being newer than the one already recorded, so
+    batches flushed out of order never move a chat's activity backwards.
+    """
+    latest = {}
+    for message in messages:
+        current = latest.get(message.chat_id)
+        if current is None or message.created_at > current.created_at:
+            latest[message.chat_id] = message
+
+    for chat_id, message in latest.items():
+        Chat.objects.filter(id=chat_id, last_activity_at__lt=message.created_at).update(
+            last_message_id=message.id, last_activity_at=message.created_at
+        )
+
+
+def fetch_inbox(user_id, before=None, limit=DEFAULT_PAGE_SIZE):
+    """
+    Return one page of the user's chats, most recently active first, and the
+    cursor for the next page or ``None``.
+
+    Two queries whatever the page holds: the memberships joined with their
+    chat, last message and its sender, then the other member of every
+    private chat on the page. Pages are keyed on ``(activity, chat_id)``.
+    """
+    memberships = (
+        ChatMember.objects
+        .filter(user_id=user_id)
+        .select_related("chat__last_message__sender")
+        .annotate(activity=F("chat__last_activity_at"))
+    )
+
+    if before:
+        activity, chat_id = decode_cursor(before)
+        memberships = memberships.filter(activity__lte=activity).filter(
+            Q(activity__lt=activity) | Q(activity=activity, chat_id__lt=chat_id)
+        )
+
+    memberships = list(memberships.order_by("-activity", "-chat_id")[: limit + 1])
+
+    next_cursor = None
+    if len(memberships) > limit:
+        memberships = memberships[:limit]
+        next_cursor = encode_cursor(memberships[-1].activity, memberships[-1].chat_id)
+
+    private_chat_ids = [member.chat_id for member in memberships if not member.chat.is_group]
+    peers = {
+        member.chat_id: member.user
+        for member in ChatMember.objects.filter(chat_id__in=private_chat_ids)
+        .exclude(user_id=user_id)
+        .select_related("user")
+    } if private_chat_ids else {}
+    online_ids = presence.is_online_many([peer.id for peer in peers.values()]) if peers else set()
+
+    return [
+        serialize_inbox_entry(member, peers.get(member.chat_id), online_ids)
+        for member in memberships
+    ], next_cursor
+
+
+def serialize_inbox_entry(member, peer, online_ids):
+    chat = member.chat
+    last_message = chat.last_message
+
+    if last_message is not None and last_message.deleted_at is None:
+        last_message = {
+            "id": str(last_message.id),
+            "message_type": last_message.type,
+            # Photo, video and audio messages may have no content.
+            "preview": (last_message.content or "")[:PREVIEW_LENGTH],
+            "sender": last_message.sender.get_full_name(),
+            "sender_id": str(last_message.sender_id),
+            "created_at": last_message.created_at.isoformat(),
+        }
+    else:
+        last_message = None
+
+    if peer is not None:
+        peer = {
+            "id": str(peer.id),
+            "full_name": peer.get_full_name(),
+            "profile_image": peer.profile_image_url(64),
+            "is_online": str(peer.id) in online_ids,
+        }
+
+    return {
+        "chat_id": str(chat.id),
+        "name": chat.name or (peer["full_name"] if peer else None),
+        "is_group": chat.is_group,
+        "unread_count": member.unread_count,
+        "last_activity_at": member.activity.isoformat(),
+        "last_message": last_message,
+        "peer": peer,
+    }
@@ -0,0 +1,278 @@
+import asyncio
+import json
+import platform
+import random
+import subprocess
+import time
+import uuid
+from datetime import datetime, timezone
+
+from channels.testing import WebsocketCommunicator
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.test.utils import override_settings
+
+from chat.models import Chat, ChatMember, Message
+from chat.utils import MSGPACK_SUBPROTOCOL, decode_binary_frame, encode_binary_frame
+from users.models import User
+from users.tokens import UserRefreshToken
+
+
+DOMAIN = "bench-load.example.com"
+
+
+def percentiles(values):
+    """Nearest-rank p50/p90/p99 and max in milliseconds, or ``None`` without samples."""
+    if not values:
+        return None
+    values = sorted(values)
+
+    def rank(q):
+        return round(values[min(len(values) - 1, int(len(values) * q))] * 1000, 3)
+
+    return {
+        "count": len(values),
+        "p50": rank(0.50),
+        "p90": rank(0.90),
+        "p99": rank(0.99),
+        "max": round(values[-1] * 1000, 3),
+    }
+
+
+class SimulatedClient:
+    """One websocket client: sends at the configured rates and timestamps every chat_message it receives."""
+
+    def __init__(self, application, chat_id, user_id, token, binary):
+        subprotocols = [MSGPACK_SUBPROTOCOL] if binary else []
+        self.communicator = WebsocketCommunicator(
+            application, f"/ws/chat/{chat_id}/", subprotocols=subprotocols + ["access_token", token]
+        )
+        self.user_id = user_id
+        self.binary = binary
+        self.sent = 0
+        self.typing_sent = 0
+        self.received = 0
+        self.latencies = []
+        self.other_frames = 0
+
+    async def connect(self):
+        start = time.perf_counter()
+        connected, _ = await self.communicator.connect(timeout=30)
+        return connected, time.perf_counter() - start
+
+    async def send(self, payload):
+        if self.binary:
+            await self.communicator.send_to(bytes_data=encode_binary_frame(payload))
+        else:
+            await self.communicator.send_to(text_data=json.dumps(payload))
+
+    async def drive(self, stop_at, message_rate, typing_rate):
+        """Send chat messages and typing frames as Poisson processes until ``stop_at``."""
+        next_message = self._next(message_rate)
+        next_typing = self._next(typing_rate)
+        while True:
+            wake = min(next_message, next_typing)
+            if wake >= stop_at:
+                return
+            await asyncio.sleep(max(0, wake - time.perf_counter()))
+            if wake == next_message:
+                # The sender's clock travels in the content; clients share a
+                # process, so receivers can compute the fan-out latency.
+                await self.send({"type": "chat_message", "content": f"{time.perf_counter():.9f}"})
+                self.sent += 1
+                next_message = self._next(message_rate, wake)
+            else:
+                await self.send({"type": "typing", "is_typing": True})
+                self.typing_sent += 1
+                next_typing = self._next(typing_rate, wake)
+
+    @staticmethod
+    def _next(rate, after=None):
+        if not rate:
+            return float("inf")
+        return (after or time.perf_counter()) + random.expovariate(rate)
+
+    async def listen(self):
+        while True:
+            message = await self.communicator.receive_output(timeout=3600)
+            if message["type"] != "websocket.send":
+                return
+            received_at = time.perf_counter()
+            if message.get("bytes") is not None:
+                frame = decode_binary_frame(message["bytes"])
+            else:
+                frame = json.loads(message["text"])
+            if frame.get("type") == "chat_message":
+                self.received += 1
+                self.latencies.append(received_at - float(frame["content"]))
+            else:
+                self.other_frames += 1
+
+
+class Command(BaseCommand):
+    help = (
+        "Load test ChatConsumer: open many simulated websocket clients across many chats, "
+        "drive message and typing traffic and report connect time, fan-out latency "
+        "percentiles and throughput, optionally as JSON for comparing commits. Run with "
+        "the memory presence/typing/rate limit backends when Redis is not available."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--chats", type=int, default=50)
+        parser.add_argument("--clients-per-chat", type=int, default=20)
+        parser.add_argument("--duration", type=float, default=10.0, help="Seconds of traffic.")
+        parser.add_argument("--message-rate", type=float, default=0.2, help="Chat messages per client per second.")
+        parser.add_argument("--typing-rate", type=float, default=0.5, help="Typing frames per client per second.")
+        parser.add_argument("--connect-concurrency", type=int, default=100)
+        parser.add_argument("--protocol", choices=["json", "msgpack"], default="json")
+        parser.add_argument("--write-behind", action="store_true", help="Persist messages through the write-behind queue.")
+        parser.add_argument(
+            "--configured-layer",
+            action="store_true",
+            help="Use the configured channel layer instead of the in-memory one.",
+        )
+        parser.add_argument("--drain", type=float, default=30.0, help="Max seconds to wait for in-flight frames.")
+        parser.add_argument("--output", help="Write the results as JSON to this file.")
+
+    def handle(self, *args, **options):
+        members = self._setup(options["chats"], options["clients_per_chat"])
+        overrides = {"CHAT_WRITE_BEHIND_ENABLED": options["write_behind"]}
+        if not options["configured_layer"]:
+            overrides["CHANNEL_LAYERS"] = {"default": {"BACKEND": "channels.layers.InMemoryChannelLayer"}}
+        try:
+            with override_settings(**overrides):
+                results = asyncio.run(self._run(members, options))
+        finally:
+            chat_ids = {chat_id for chat_id, _, _ in members}
+            Message.objects.filter(chat_id__in=chat_ids).delete()
+            Chat.objects.filter(id__in=chat_ids).delete()
+            User.objects.filter(email__endswith=f"@{DOMAIN}").delete()
+
+        self._report(results)
+        if options["output"]:
+            with open(options["output"], "w") as fp:
+                json.dump(results, fp, indent=2)
+            self.stdout.write(f"results written to {options['output']}")
+
+    def _setup(self, chats, per_chat):
+        users = User.objects.bulk_create([
+            User(email=f"load-{uuid.uuid4().hex}@{DOMAIN}", first_name="Load", last_name=str(i), password="!")
+            for i in range(chats * per_chat)
+        ], batch_size=1000)
+        chat_objects = Chat.objects.bulk_create([
+            Chat(name=f"bench-load-{i}", is_group=True) for i in range(chats)
+        ])
+        memberships = [
+            ChatMember(chat=chat, user=users[c * per_chat + i])
+            for c, chat in enumerate(chat_objects)
+            for i in range(per_chat)
+        ]
+        ChatMember.objects.bulk_create(memberships, batch_size=1000)
+        return [
+            (member.chat_id, member.user_id, str(UserRefreshToken.for_user(member.user).access_token))
+            for member in memberships
+        ]
+
+    async def _run(self, members, options):
+        from myproject.asgi import application
+
+        binary = options["protocol"] == "msgpack"
+        clients = [SimulatedClient(application, chat_id, user_id, token, binary) for chat_id, user_id, token in members]
+
+        gate = asyncio.Semaphore(options["connect_concurrency"])
+
+        async def connect(client):
+            async with gate:
+                return await client.connect()
+
+        start = time.perf_counter()
+        outcomes = await asyncio.gather(*(connect(client) for client in clients))
+        connect_wall = time.perf_counter() - start
+        connected = [client for client, (ok, _) in zip(clients, outcomes) if ok]
+
+        listeners = [asyncio.ensure_future(client.listen()) for client in connected]
+        stop_at = time.perf_counter() + options["duration"]
+        await asyncio.gather(*(
+            client.drive(stop_at, options["message_rate"], options["typing_rate"]) for client in connected
+        ))
+        # Let in-flight fan-out drain before counting: until nothing has
+        # arrived for a second, or --drain seconds at most.
+        drain_start = time.perf_counter()
+        delivered = -1
+        while time.perf_counter() - drain_start < options["drain"]:
+            current = sum(client.received + client.other_frames for client in connected)
+            if current == delivered:
+                break
+            delivered = current
+            await asyncio.sleep(1.0)
+        drain = time.perf_counter() - drain_start
+        for listener in listeners:
+            listener.cancel()
+        await asyncio.gather(*listeners, return_exceptions=True)
+
+        for client in connected:
+            await client.communicator.disconnect()
+
+        if options["write_behind"]:
+            from chat.persistence import message_write_behind
+            await message_write_behind.shutdown()
+
+        sent = sum(client.sent for client in connected)
+        received = sum(client.received for client in connected)
+        expected = sent * options["clients_per_chat"]
+        return {
+            "timestamp": datetime.now(timezone.utc).isoformat(),
+            "commit": self._commit(),
+            "python": platform.python_version(),
+            "config": {
+                key: options[key]
+                for key in (
+                    "chats", "clients_per_chat", "duration", "message_rate", "typing_rate",
+                    "protocol", "write_behind", "configured_layer",
+                )
+            },
+            "channel_layer": settings.CHANNEL_LAYERS["default"]["BACKEND"]
+            if options["configured_layer"] else "channels.layers.InMemoryChannelLayer",
+            "database": settings.DATABASES["default"]["ENGINE"],
+            "clients": len(clients),
+            "connected": len(connected),
+            "connect_wall_seconds": round(connect_wall, 3),
+            "drain_seconds": round(drain, 3),
+            "connect_ms": percentiles([elapsed for ok, elapsed in outcomes if ok]),
+            "fanout_ms": percentiles([latency for client in connected for latency in client.latencies]),
+            "messages_sent": sent,
+            "typing_sent": sum(client.typing_sent for client in connected),
+            "messages_delivered": received,
+            "delivery_ratio": round(received / expected, 4) if expected else None,
+            "other_frames": sum(client.other_frames for client in connected),
+            "sent_per_second": round(sent / options["duration"], 1),
+            "delivered_per_second": round(received / options["duration"], 1),
+        }
+
+    @staticmethod
+    def _commit():
+        try:
+            return subprocess.run(
+                ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True, cwd=settings.BASE_DIR
+            ).stdout.strip()
+        except (OSError, subprocess.CalledProcessError):
+            return None
+
+    def _report(self, results):
+        self.stdout.write(
+            f"clients       : {results['connected']}/{results['clients']} connected "
+            f"in {results['connect_wall_seconds']:.2f}s"
+        )
+        for label, key in (("connect", "connect_ms"), ("fan-out", "fanout_ms")):
+            stats = results[key]
+            if stats:
+                self.stdout.write(
+                    f"{label:<14}: p50 {stats['p50']:8.2f} ms  p90 {stats['p90']:8.2f} ms  "
+                    f"p99 {stats['p99']:8.2f} ms  max {stats['max']:8.2f} ms"
+                )
+        self.stdout.write(
+            f"messages      : {results['messages_sent']} sent ({results['sent_per_second']}/s), "
+            f"{results['messages_delivered']} delivered ({results['delivered_per_second']}/s), "
+            f"ratio {results['delivery_ratio']}"
+        )
+        self.stdout.write(f"typing frames : {results['typing_sent']} sent, {results['other_frames']} other frames received")
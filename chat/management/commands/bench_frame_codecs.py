@@ -0,0 +1,84 @@
+import json
+import time
+import uuid
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from chat.history import history_frame_row
+from chat.utils import decode_binary_frame, encode_binary_frame, encode_frame
+
+
+def _message_row(chat_id, sender_id, created_at, content):
+    return history_frame_row({
+        "id": uuid.uuid4(),
+        "type": "text",
+        "content": content,
+        "sender__first_name": "Maria",
+        "sender__last_name": "Garcia",
+        "sender_id": sender_id,
+        "chat_id": chat_id,
+        "reply_to_id": None,
+        "created_at": created_at,
+        "updated_at": created_at,
+    })
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare JSON text frames with MessagePack binary frames: size and "
+        "encode/decode CPU per frame for the events the chat consumer sends."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--iterations", type=int, default=20000)
+        parser.add_argument("--content-length", type=int, default=40, help="Characters of message text.")
+        parser.add_argument("--page-size", type=int, default=50, help="Messages in the history frame.")
+
+    def handle(self, *args, **options):
+        chat_id, sender_id = uuid.uuid4(), uuid.uuid4()
+        now = timezone.now()
+        content = ("lorem ipsum dolor sit amet " * 20)[: options["content_length"]]
+
+        message = {"type": "chat_message", **_message_row(chat_id, sender_id, now, content)}
+        frames = {
+            "chat_message": message,
+            "receipt": {"type": "receipt", "status": "read", "user_id": sender_id, "message_id": message["id"]},
+            "typing_roster": {
+                "type": "typing_roster",
+                "chat_id": chat_id,
+                "users": [{"user_id": uuid.uuid4(), "username": "Maria Garcia"} for _ in range(3)],
+            },
+            "history": {
+                "type": "history",
+                "messages": [
+                    _message_row(chat_id, sender_id, now - timedelta(seconds=i), content)
+                    for i in range(options["page_size"])
+                ],
+                "next_cursor": None,
+            },
+        }
+
+        iterations = options["iterations"]
+        self.stdout.write(
+            f"{'frame':>14} {'json B':>8} {'msgpack B':>10} {'json enc':>9} {'mp enc':>8} {'json dec':>9} {'mp dec':>8}"
+        )
+        for name, payload in frames.items():
+            repeat = max(1, iterations // len(payload.get("messages", [None])))
+            text, binary = encode_frame(payload), encode_binary_frame(payload)
+            self.stdout.write(
+                f"{name:>14} {len(text.encode()):>8} {len(binary):>10} "
+                f"{self._us(lambda: encode_frame(payload), repeat):>9} "
+                f"{self._us(lambda: encode_binary_frame(payload), repeat):>8} "
+                f"{self._us(lambda: json.loads(text), repeat):>9} "
+                f"{self._us(lambda: decode_binary_frame(binary), repeat):>8}"
+            )
+        self.stdout.write("times are microseconds per frame")
+
+    @staticmethod
+    def _us(run, repeat):
+        start = time.perf_counter()
+        for _ in range(repeat):
+            run()
+        return f"{(time.perf_counter() - start) / repeat * 1e6:.1f}"
@@ -0,0 +1,108 @@
+import statistics
+import time
+import uuid
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.test.utils import override_settings
+from django.utils import timezone
+
+from chat.archive import archive_messages
+from chat.history import encode_cursor, fetch_history
+from chat.models import ArchivedMessage, Chat, ChatMember, Message
+from users.models import User
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare message history page latency with every message in one table against the "
+        "hot table plus archive layout, for recent pages and pages reaching into the archive."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--messages", type=int, default=1_000_000)
+        parser.add_argument("--days", type=int, default=730, help="Span of time the messages are spread over.")
+        parser.add_argument("--archive-after-days", type=int, default=180)
+        parser.add_argument("--page-size", type=int, default=50)
+        parser.add_argument("--repeat", type=int, default=50)
+        parser.add_argument("--depths", default="0,1000,10000", help="Comma separated row offsets of the recent pages.")
+
+    def handle(self, *args, **options):
+        chat, user = self._populate(options["messages"], options["days"])
+        try:
+            now = timezone.now()
+            horizon = now - timedelta(days=options["archive_after_days"])
+            recent = Message.objects.filter(chat=chat, created_at__gte=horizon).count()
+            depths = [int(d) for d in options["depths"].split(",") if int(d) < recent]
+            # Rows just past the horizon: the first pages that have to read the archive.
+            depths.append(recent)
+            cursors = [self._cursor(chat, depth) for depth in depths]
+
+            single = [self._time(chat, cursor, options) for cursor in cursors]
+
+            with override_settings(MESSAGE_ARCHIVE_ENABLED=True, MESSAGE_ARCHIVE_AFTER_DAYS=options["archive_after_days"]):
+                start = time.perf_counter()
+                moved = archive_messages(horizon)
+                archive_seconds = time.perf_counter() - start
+                tiered = [self._time(chat, cursor, options) for cursor in cursors]
+
+            self.stdout.write(
+                f"chat {chat.id}: {options['messages']} messages over {options['days']} days; "
+                f"archived {moved} in {archive_seconds:.1f}s, {Message.objects.filter(chat=chat).count()} left hot"
+            )
+            self.stdout.write(f"{'depth':>10} {'single p50':>12} {'single p95':>12} {'tiered p50':>12} {'tiered p95':>12}")
+            for depth, one, two in zip(depths, single, tiered):
+                label = f"{depth}{'*' if depth == recent else ''}"
+                self.stdout.write(
+                    f"{label:>10} {self._ms(statistics.median(one)):>12} {self._ms(self._p95(one)):>12} "
+                    f"{self._ms(statistics.median(two)):>12} {self._ms(self._p95(two)):>12}"
+                )
+            self.stdout.write("* first page past the archive horizon")
+        finally:
+            ArchivedMessage.objects.filter(chat=chat).delete()
+            chat.delete()
+            user.delete()
+
+    def _populate(self, count, days, chunk=10_000):
+        user = User.objects.create(email=f"bench-{uuid.uuid4().hex}@example.com", first_name="Bench", last_name="Archive")
+        chat = Chat.objects.create(name="bench-archive", is_group=True)
+        ChatMember.objects.create(chat=chat, user=user)
+
+        step = timedelta(days=days) / count
+        start = timezone.now() - timedelta(days=days)
+        for offset in range(0, count, chunk):
+            Message.objects.bulk_create([
+                Message(
+                    chat_id=chat.id,
+                    sender_id=user.id,
+                    content=f"message {i}",
+                    created_at=start + step * i,
+                    updated_at=start + step * i,
+                )
+                for i in range(offset, min(offset + chunk, count))
+            ])
+            self.stdout.write(f"\rpopulated {min(offset + chunk, count)}/{count}", ending="")
+        self.stdout.write("")
+        return chat, user
+
+    def _cursor(self, chat, depth):
+        if not depth:
+            return None
+        row = Message.objects.filter(chat=chat).order_by("-created_at", "-id").values("created_at", "id")[depth - 1]
+        return encode_cursor(row["created_at"], row["id"])
+
+    def _time(self, chat, cursor, options):
+        timings = []
+        for _ in range(options["repeat"]):
+            start = time.perf_counter()
+            fetch_history(chat.id, before=cursor, limit=options["page_size"])
+            timings.append(time.perf_counter() - start)
+        return timings
+
+    @staticmethod
+    def _p95(timings):
+        return sorted(timings)[int(len(timings) * 0.95) - 1] if len(timings) > 1 else timings[0]
+
+    @staticmethod
+    def _ms(seconds):
+        return f"{seconds * 1000:.2f}ms"
@@ -0,0 +1,114 @@
+import statistics
+import time
+import uuid
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from chat.history import HISTORY_FIELDS, encode_cursor, fetch_history
+from chat.models import Chat, ChatMember, Message
+from users.models import User
+
+
+class Command(BaseCommand):
+    help = (
+        "Measure message history page latency at increasing scroll depths, "
+        "keyset cursor vs OFFSET, on one large chat."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--messages", type=int, default=10_000_000)
+        parser.add_argument("--page-size", type=int, default=50)
+        parser.add_argument("--repeat", type=int, default=20)
+        parser.add_argument(
+            "--depths",
+            default="0,1000,10000,100000,1000000,5000000,9999000",
+            help="Comma separated row offsets to measure at.",
+        )
+        parser.add_argument("--chat", help="Reuse a chat populated by a previous --keep run.")
+        parser.add_argument("--keep", action="store_true", help="Keep the generated chat for later runs.")
+        parser.add_argument("--skip-offset", action="store_true", help="Only measure the keyset path.")
+
+    def handle(self, *args, **options):
+        if options["chat"]:
+            chat = Chat.objects.get(id=options["chat"])
+            user = None
+        else:
+            chat, user = self._populate(options["messages"])
+
+        try:
+            total = Message.objects.filter(chat=chat, deleted_at__isnull=True).count()
+            depths = [int(d) for d in options["depths"].split(",") if int(d) < total]
+
+            self.stdout.write(f"chat {chat.id}: {total} messages, page size {options['page_size']}")
+            self.stdout.write(f"{'depth':>10} {'keyset p50':>12} {'keyset p95':>12} {'offset p50':>12}")
+            for depth in depths:
+                keyset = self._time_keyset(chat, depth, options["page_size"], options["repeat"])
+                offset = (
+                    None if options["skip_offset"]
+                    else self._time_offset(chat, depth, options["page_size"], options["repeat"])
+                )
+                self.stdout.write(
+                    f"{depth:>10} {self._ms(statistics.median(keyset)):>12} "
+                    f"{self._ms(self._p95(keyset)):>12} "
+                    f"{self._ms(statistics.median(offset)) if offset else '-':>12}"
+                )
+        finally:
+            if not options["chat"] and not options["keep"]:
+                chat.delete()
+                user.delete()
+
+    def _populate(self, count, chunk=10_000):
+        user = User.objects.create(email=f"bench-{uuid.uuid4().hex}@example.com", first_name="Bench", last_name="History")
+        chat = Chat.objects.create(name="bench-history", is_group=True)
+        ChatMember.objects.create(chat=chat, user=user)
+
+        start = timezone.now() - timedelta(seconds=count)
+        for offset in range(0, count, chunk):
+            Message.objects.bulk_create([
+                Message(
+                    chat_id=chat.id,
+                    sender_id=user.id,
+                    content=f"message {i}",
+                    created_at=start + timedelta(seconds=i),
+                    updated_at=start + timedelta(seconds=i),
+                )
+                for i in range(offset, min(offset + chunk, count))
+            ])
+            self.stdout.write(f"\rpopulated {min(offset + chunk, count)}/{count}", ending="")
+        self.stdout.write("")
+        return chat, user
+
+    def _newest_first(self, chat):
+        return Message.objects.filter(chat=chat, deleted_at__isnull=True).order_by("-created_at", "-id")
+
+    def _time_keyset(self, chat, depth, page_size, repeat):
+        before = None
+        if depth:
+            # Locating the cursor is setup, not part of what is measured.
+            row = self._newest_first(chat).values("created_at", "id")[depth - 1]
+            before = encode_cursor(row["created_at"], row["id"])
+
+        timings = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            fetch_history(chat.id, before=before, limit=page_size)
+            timings.append(time.perf_counter() - start)
+        return timings
+
+    def _time_offset(self, chat, depth, page_size, repeat):
+        timings = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            list(self._newest_first(chat).values(*HISTORY_FIELDS)[depth:depth + page_size])
+            timings.append(time.perf_counter() - start)
+        return timings
+
+    @staticmethod
+    def _p95(timings):
+        return sorted(timings)[int(len(timings) * 0.95) - 1] if len(timings) > 1 else timings[0]
+
+    @staticmethod
+    def _ms(seconds):
+        return f"{seconds * 1000:.2f}ms"
@@ -0,0 +1,92 @@
+import asyncio
+import time
+import uuid
+
+from channels.db import database_sync_to_async
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from chat.inbox import update_last_message
+from chat.models import Chat, ChatMember, Message
+from chat.persistence import MessageWriteBehind
+from chat.unread import increment_unread
+from users.models import User
+
+
+class Command(BaseCommand):
+    help = "Compare messages/sec of per-row Message inserts against the write-behind queue."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--messages", type=int, default=5000)
+        parser.add_argument("--senders", type=int, default=50, help="Concurrent senders in the chat.")
+        parser.add_argument("--batch-size", type=int, default=100)
+        parser.add_argument("--flush-interval", type=float, default=0.05)
+
+    def handle(self, *args, **options):
+        chat, users = self._setup(options["senders"])
+        try:
+            per_row = asyncio.run(self._run_per_row(chat, users, options["messages"]))
+            write_behind = asyncio.run(self._run_write_behind(
+                chat, users, options["messages"], options["batch_size"], options["flush_interval"]
+            ))
+        finally:
+            chat.delete()
+            User.objects.filter(id__in=[user.id for user in users]).delete()
+
+        self.stdout.write(f"per-row      : {per_row:10.1f} msg/s")
+        self.stdout.write(f"write-behind : {write_behind:10.1f} msg/s ({write_behind / per_row:.1f}x)")
+
+    def _setup(self, senders):
+        chat = Chat.objects.create(name="bench-persistence", is_group=True)
+        users = User.objects.bulk_create([
+            User(email=f"bench-{uuid.uuid4().hex}@example.com", first_name="Bench", last_name=str(i))
+            for i in range(senders)
+        ])
+        ChatMember.objects.bulk_create([ChatMember(chat=chat, user=user) for user in users])
+        return chat, users
+
+    async def _drive(self, users, total, send):
+        per_sender = total // len(users)
+
+        async def sender(user):
+            for i in range(per_sender):
+                await send(user, f"message {i}")
+
+        start = time.perf_counter()
+        await asyncio.gather(*(sender(user) for user in users))
+        return per_sender * len(users), start
+
+    async def _run_per_row(self, chat, users, total):
+        # The same writes as the consumer without write-behind, and as each
+        # write-behind batch: the message, unread counters and last_message.
+        @database_sync_to_async
+        def create(**kwargs):
+            with transaction.atomic():
+                message = Message.objects.create(**kwargs)
+                increment_unread([message])
+                update_last_message([message])
+
+        async def send(user, content):
+            await create(content=content, sender_id=user.id, chat_id=chat.id)
+
+        sent, start = await self._drive(users, total, send)
+        return sent / (time.perf_counter() - start)
+
+    async def _run_write_behind(self, chat, users, total, batch_size, flush_interval):
+        queue = MessageWriteBehind(batch_size=batch_size, flush_interval=flush_interval)
+
+        async def send(user, content):
+            message = Message(content=content, sender_id=user.id, chat_id=chat.id)
+            message.updated_at = message.created_at
+            await queue.enqueue(message)
+
+        sent, start = await self._drive(users, total, send)
+        await queue.shutdown()
+        elapsed = time.perf_counter() - start
+
+        persisted = await database_sync_to_async(
+            Message.objects.filter(chat_id=chat.id).count
+        )()
+        if persisted != 2 * sent:
+            self.stderr.write(f"write-behind persisted {persisted - sent} of {sent} messages")
+        return sent / elapsed
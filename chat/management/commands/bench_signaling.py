@@ -0,0 +1,117 @@
+import asyncio
+import json
+import statistics
+import time
+import uuid
+
+from channels.db import database_sync_to_async
+from channels.testing import WebsocketCommunicator
+from django.core.management.base import BaseCommand
+from django.test.utils import override_settings
+
+from chat.models import Call, Chat, ChatMember
+from users.models import User
+from users.tokens import UserRefreshToken
+
+
+CANDIDATE = "candidate:{0} 1 udp 2122260223 192.0.2.{0} 5{0:04d} typ host"
+
+
+class Command(BaseCommand):
+    help = "Measure the latency of a full offer/answer/ICE exchange through the signaling consumer."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--exchanges", type=int, default=200)
+        parser.add_argument("--candidates", type=int, default=8, help="Trickled candidates per side.")
+        parser.add_argument(
+            "--configured-layer",
+            action="store_true",
+            help="Use the configured channel layer instead of the in-memory one.",
+        )
+
+    def handle(self, *args, **options):
+        chat, caller, callee = self._setup()
+        try:
+            if options["configured_layer"]:
+                timings, frames = asyncio.run(self._run(chat, caller, callee, options))
+            else:
+                with override_settings(CHANNEL_LAYERS={"default": {"BACKEND": "channels.layers.InMemoryChannelLayer"}}):
+                    timings, frames = asyncio.run(self._run(chat, caller, callee, options))
+        finally:
+            chat.delete()
+            User.objects.filter(id__in=[caller.id, callee.id]).delete()
+
+        timings.sort()
+        self.stdout.write(f"exchanges     : {len(timings)}")
+        self.stdout.write(f"p50           : {statistics.median(timings) * 1000:8.2f} ms")
+        self.stdout.write(f"p95           : {timings[int(len(timings) * 0.95) - 1] * 1000:8.2f} ms")
+        self.stdout.write(f"max           : {timings[-1] * 1000:8.2f} ms")
+        self.stdout.write(
+            f"ICE frames    : {frames / len(timings):8.1f} per exchange "
+            f"for {2 * (options['candidates'] + 1)} candidates"
+        )
+
+    def _setup(self):
+        chat = Chat.objects.create(name="bench-signaling", is_group=False)
+        caller, callee = User.objects.bulk_create([
+            User(email=f"bench-{uuid.uuid4().hex}@example.com", first_name="Bench", last_name=name)
+            for name in ("Caller", "Callee")
+        ])
+        ChatMember.objects.bulk_create([ChatMember(chat=chat, user=user) for user in (caller, callee)])
+        return chat, caller, callee
+
+    async def _run(self, chat, caller, callee, options):
+        from myproject.asgi import application
+
+        path = f"/ws/chat/{chat.id}/call/?call_type={Call.CallType.VIDEO}"
+        tokens = await database_sync_to_async(
+            lambda: [str(UserRefreshToken.for_user(user).access_token) for user in (caller, callee)]
+        )()
+
+        timings = []
+        ice_frames = 0
+        for _ in range(options["exchanges"]):
+            a = WebsocketCommunicator(application, path, subprotocols=["access_token", tokens[0]])
+            b = WebsocketCommunicator(application, path, subprotocols=["access_token", tokens[1]])
+            await a.connect()
+            await a.receive_json_from()
+            await b.connect()
+            await b.receive_json_from()
+            await a.receive_json_from()
+            await b.receive_json_from()
+
+            elapsed, frames = await self._exchange(a, b, str(caller.id), str(callee.id), options["candidates"])
+            timings.append(elapsed)
+            ice_frames += frames
+
+            await b.disconnect()
+            await a.receive_json_from()
+            await a.disconnect()
+        return timings, ice_frames
+
+    async def _exchange(self, a, b, caller_id, callee_id, candidates):
+        """Offer, answer and both sides' trickled candidates, until each side has all of the other's."""
+        start = time.perf_counter()
+
+        await a.send_to(text_data=json.dumps({"type": "offer", "to": callee_id, "sdp": "v=0 offer"}))
+        for i in range(candidates):
+            await a.send_to(text_data=json.dumps({"type": "candidate", "to": callee_id, "candidate": CANDIDATE.format(i)}))
+        await a.send_to(text_data=json.dumps({"type": "candidate", "to": callee_id, "candidate": None}))
+
+        assert (await b.receive_json_from())["type"] == "offer"
+        await b.send_to(text_data=json.dumps({"type": "answer", "to": caller_id, "sdp": "v=0 answer"}))
+        for i in range(candidates):
+            await b.send_to(text_data=json.dumps({"type": "candidate", "to": caller_id, "candidate": CANDIDATE.format(i)}))
+        await b.send_to(text_data=json.dumps({"type": "candidate", "to": caller_id, "candidate": None}))
+
+        frames = 0
+        for receiver in (b, a):
+            received = []
+            while not received or received[-1] is not None:
+                frame = await receiver.receive_json_from()
+                if frame["type"] != "candidates":
+                    continue
+                frames += 1
+                received.extend(frame["candidates"])
+
+        return time.perf_counter() - start, frames
@@ -0,0 +1,12 @@
+import asyncio
+
+from django.core.management.base import BaseCommand
+
+from chat.calls import call_state
+
+
+class Command(BaseCommand):
+    help = "End abandoned live calls, persist calls left mid-finalization and close orphaned ONGOING calls."
+
+    def handle(self, *args, **options):
+        asyncio.run(call_state.reconcile())
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from chat.unread import repair_unread
+
+
+class Command(BaseCommand):
+    help = "Recompute unread counters from the messages table and fix drifted ones. Meant to run periodically (e.g. cron)."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=1000)
+
+    def handle(self, *args, **options):
+        repaired = repair_unread(batch_size=options["batch_size"])
+        self.stdout.write(f"Repaired {repaired} unread counter(s).")
@@ -0,0 +1,35 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from chat.archive import archive_horizon, archive_messages, ensure_partitions, is_partitioned, month_start, next_month
+
+
+class Command(BaseCommand):
+    help = (
+        "Create the upcoming monthly partitions of the message archive (PostgreSQL) and move "
+        "messages older than MESSAGE_ARCHIVE_AFTER_DAYS into it. Meant to run periodically (e.g. daily cron)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--months-ahead", type=int, default=2, help="Partitions to create past the horizon's month.")
+        parser.add_argument("--batch-size", type=int, default=5000)
+
+    def handle(self, *args, **options):
+        horizon = archive_horizon()
+
+        if is_partitioned():
+            last = month_start(horizon)
+            for _ in range(options["months_ahead"]):
+                last = next_month(last)
+            created = ensure_partitions(horizon, last)
+            self.stdout.write(f"Created {len(created)} partition(s){': ' + ', '.join(created) if created else '.'}")
+        else:
+            self.stdout.write("Not PostgreSQL: the archive is a single table, no partitions to create.")
+
+        if not settings.MESSAGE_ARCHIVE_ENABLED:
+            # History would not read the archive, so moving messages would hide them.
+            self.stdout.write("MESSAGE_ARCHIVE_ENABLED is off; not archiving.")
+            return
+
+        moved = archive_messages(horizon, batch_size=options["batch_size"])
+        self.stdout.write(f"Archived {moved} message(s) created before {horizon.isoformat()}.")
@@ -0,0 +1,94 @@
+from channels.db import database_sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+
+from chat.models import ChatMember
+from myproject.metrics import database_calls, membership_cache_lookups
+
+from loguru import logger
+
+
+class MembershipCache:
+    """
+    Answers "is this user a member of this chat" for websocket connects.
+
+    A single ``ChatMember`` lookup covers both chat existence and membership,
+    and the answer is cached until a ``ChatMember`` row for the pair is saved
+    or deleted (see ``chat.signals``).
+    """
+
+    def __init__(self, timeout, negative_timeout, report_every=1000):
+        self.timeout = timeout
+        self.negative_timeout = negative_timeout
+        self.report_every = report_every
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def key(chat_id, user_id):
+        return f"chat_member:{chat_id}:{user_id}"
+
+    async def is_member(self, chat_id, user_id):
+        key = self.key(chat_id, user_id)
+        is_member = await cache.aget(key)
+
+        if is_member is not None:
+            self._record(hit=True)
+            return is_member
+
+        self._record(hit=False)
+        with database_calls.time(call="membership_lookup"):
+            is_member = await database_sync_to_async(self._lookup)(chat_id, user_id)
+        await cache.aset(key, is_member, timeout=self._timeout_for(is_member))
+        return is_member
+
+    def is_member_sync(self, chat_id, user_id):
+        """Same as ``is_member`` for synchronous callers such as DRF views."""
+        key = self.key(chat_id, user_id)
+        is_member = cache.get(key)
+
+        if is_member is not None:
+            self._record(hit=True)
+            return is_member
+
+        self._record(hit=False)
+        is_member = self._lookup(chat_id, user_id)
+        cache.set(key, is_member, timeout=self._timeout_for(is_member))
+        return is_member
+
+    def invalidate(self, chat_id, user_id):
+        cache.delete(self.key(chat_id, user_id))
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
+
+    def _lookup(self, chat_id, user_id):
+        return ChatMember.objects.filter(chat_id=chat_id, user_id=user_id).exists()
+
+    def _timeout_for(self, is_member):
+        return self.timeout if is_member else self.negative_timeout
+
+    def _record(self, hit):
+        if hit:
+            self.hits += 1
+        else:
+            self.misses += 1
+        membership_cache_lookups.inc(result="hit" if hit else "miss")
+
+        if (self.hits + self.misses) % self.report_every == 0:
+            stats = self.stats()
+            logger.info(
+                f"Membership cache: {stats['hits']} hits, {stats['misses']} misses "
+                f"({stats['hit_rate']:.1%} hit rate)."
+            )
+
+
+membership_cache = MembershipCache(
+    timeout=settings.CHAT_MEMBERSHIP_CACHE_TIMEOUT,
+    negative_timeout=settings.CHAT_MEMBERSHIP_CACHE_NEGATIVE_TIMEOUT,
+)
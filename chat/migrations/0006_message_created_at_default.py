@@ -0,0 +1,21 @@
+# Generated by Django 5.2.4 on 2026-10-18 11:12
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("chat", "0005_messagereaction_updated_at"),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="message",
+            name="created_at",
+            field=models.DateTimeField(
+                default=django.utils.timezone.now, editable=False
+            ),
+        ),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 5.2.4 on 2026-10-18 11:17
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("chat", "0006_message_created_at_default"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="message",
+            index=models.Index(
+                fields=["chat", "created_at", "id"], name="msg_chat_history_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="message",
+            index=models.Index(
+                condition=models.Q(("deleted_at__isnull", True)),
+                fields=["chat", "created_at", "id"],
+                name="msg_chat_live_history_idx",
+            ),
+        ),
+    ]
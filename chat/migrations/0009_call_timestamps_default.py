@@ -0,0 +1,28 @@
+# Generated by Django 5.2.4 on 2026-10-18 11:28
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("chat", "0008_chatmember_receipt_watermarks"),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="call",
+            name="started_at",
+            field=models.DateTimeField(
+                default=django.utils.timezone.now, editable=False
+            ),
+        ),
+        migrations.AlterField(
+            model_name="callparticipant",
+            name="joined_at",
+            field=models.DateTimeField(
+                default=django.utils.timezone.now, editable=False
+            ),
+        ),
+    ]
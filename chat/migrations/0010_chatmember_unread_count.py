@@ -0,0 +1,18 @@
+# Generated by Django 5.2.4 on 2026-10-18 11:31
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("chat", "0009_call_timestamps_default"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="chatmember",
+            name="unread_count",
+            field=models.PositiveIntegerField(default=0),
+        ),
+    ]
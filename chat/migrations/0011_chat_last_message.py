@@ -0,0 +1,45 @@
+# Generated by Django 5.2.4 on 2026-10-18 11:32
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery
+
+
+def backfill_last_message(apps, schema_editor):
+    Chat = apps.get_model("chat", "Chat")
+    Message = apps.get_model("chat", "Message")
+
+    latest = Message.objects.filter(chat_id=OuterRef("pk"), deleted_at__isnull=True).order_by(
+        "-created_at", "-id"
+    )
+    Chat.objects.update(
+        last_message_id=Subquery(latest.values("id")[:1]),
+        last_activity_at=Subquery(latest.values("created_at")[:1]),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("chat", "0010_chatmember_unread_count"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="chat",
+            name="last_activity_at",
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name="chat",
+            name="last_message",
+            field=models.ForeignKey(
+                blank=True,
+                null=True,
+                on_delete=django.db.models.deletion.SET_NULL,
+                related_name="+",
+                to="chat.message",
+            ),
+        ),
+        migrations.RunPython(backfill_last_message, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,105 @@
+# Generated by Django 5.2.4 on 2026-10-18 12:05
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+# Recreate the table partitioned by month; the primary key of a partitioned
+# table has to include the partition key. Partitions are added by the
+# roll_message_partitions command, the default one catches the rest.
+POSTGRES_FORWARD = [
+    "DROP TABLE chat_message_archive",
+    """
+    CREATE TABLE chat_message_archive (
+        id uuid NOT NULL,
+        type varchar(10) NOT NULL,
+        content text NULL,
+        reply_to_id uuid NULL,
+        created_at timestamp with time zone NOT NULL,
+        updated_at timestamp with time zone NOT NULL,
+        deleted_at timestamp with time zone NULL,
+        chat_id uuid NOT NULL REFERENCES chat_chat (id) DEFERRABLE INITIALLY DEFERRED,
+        sender_id uuid NOT NULL REFERENCES users_user (id) DEFERRABLE INITIALLY DEFERRED,
+        PRIMARY KEY (id, created_at)
+    ) PARTITION BY RANGE (created_at)
+    """,
+    "CREATE INDEX msg_archive_history_idx ON chat_message_archive (chat_id, created_at, id)",
+    "CREATE INDEX msg_archive_sender_idx ON chat_message_archive (sender_id)",
+    "CREATE TABLE chat_message_archive_default PARTITION OF chat_message_archive DEFAULT",
+]
+
+
+def partition_on_postgres(apps, schema_editor):
+    if schema_editor.connection.vendor == "postgresql":
+        for statement in POSTGRES_FORWARD:
+            schema_editor.execute(statement)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("chat", "0011_chat_last_message"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="ArchivedMessage",
+            fields=[
+                (
+                    "id",
+                    models.UUIDField(editable=False, primary_key=True, serialize=False),
+                ),
+                (
+                    "type",
+                    models.CharField(
+                        choices=[
+                            ("text", "Text"),
+                            ("emoji", "Emoji"),
+                            ("photo", "Photo"),
+                            ("video", "Video"),
+                            ("audio", "Audio"),
+                        ],
+                        max_length=10,
+                    ),
+                ),
+                ("content", models.TextField(blank=True, null=True)),
+                ("reply_to_id", models.UUIDField(blank=True, null=True)),
+                ("created_at", models.DateTimeField()),
+                ("updated_at", models.DateTimeField()),
+                ("deleted_at", models.DateTimeField(blank=True, null=True)),
+                (
+                    "chat",
+                    models.ForeignKey(
+                        db_index=False,
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="archived_messages",
+                        to="chat.chat",
+                    ),
+                ),
+                (
+                    "sender",
+                    models.ForeignKey(
+                        db_index=False,
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="+",
+                        to=settings.AUTH_USER_MODEL,
+                    ),
+                ),
+            ],
+            options={
+                "db_table": "chat_message_archive",
+                "ordering": ["created_at"],
+                "indexes": [
+                    models.Index(
+                        fields=["chat", "created_at", "id"],
+                        name="msg_archive_history_idx",
+                    ),
+                    models.Index(fields=["sender"], name="msg_archive_sender_idx"),
+                ],
+            },
+        ),
+        # Reversing CreateModel drops the partitioned table with its partitions.
+        migrations.RunPython(partition_on_postgres, migrations.RunPython.noop),
+    ]
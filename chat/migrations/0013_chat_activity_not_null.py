@@ -0,0 +1,33 @@
+import django.utils.timezone
+from django.db import migrations, models
+from django.db.models import F
+
+
+def backfill_activity(apps, schema_editor):
+    Chat = apps.get_model("chat", "Chat")
+    Chat.objects.filter(last_activity_at__isnull=True).update(last_activity_at=F("created_at"))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("chat", "0012_message_archive"),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="chat",
+            name="created_at",
+            field=models.DateTimeField(default=django.utils.timezone.now, editable=False),
+        ),
+        migrations.RunPython(backfill_activity, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name="chat",
+            name="last_activity_at",
+            field=models.DateTimeField(editable=False),
+        ),
+        migrations.AddIndex(
+            model_name="chat",
+            index=models.Index(fields=["last_activity_at", "id"], name="chat_activity_idx"),
+        ),
+    ]
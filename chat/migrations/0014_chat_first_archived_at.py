@@ -0,0 +1,24 @@
+from django.db import migrations, models
+
+
+def backfill_first_archived_at(apps, schema_editor):
+    Chat = apps.get_model("chat", "Chat")
+    ArchivedMessage = apps.get_model("chat", "ArchivedMessage")
+    oldest = ArchivedMessage.objects.filter(chat=models.OuterRef("pk")).order_by("created_at").values("created_at")[:1]
+    Chat.objects.filter(models.Exists(oldest)).update(first_archived_at=models.Subquery(oldest))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("chat", "0013_chat_activity_not_null"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="chat",
+            name="first_archived_at",
+            field=models.DateTimeField(blank=True, editable=False, null=True),
+        ),
+        migrations.RunPython(backfill_first_archived_at, migrations.RunPython.noop),
+    ]
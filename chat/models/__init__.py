@@ -1,6 +1,7 @@
 from .chat import Chat
 from .chat_member import ChatMember
 from .message import Message
+from .archived_message import ArchivedMessage
 from .message_reaction import MessageReaction
 from .status import MessageStatusEntry
 from .call import Call
@@ -10,6 +11,7 @@ __all__ = [
     "Chat",
     "ChatMember",
     "Message",
+    "ArchivedMessage",
     "MessageReaction",
     "MessageStatusEntry",
     "Call",
@@ -0,0 +1,32 @@
+from django.db import models
+
+from users.models import User
+from .chat import Chat
+from .message import Message
+
+
+class ArchivedMessage(models.Model):
+    """
+    Cold tier for messages older than ``MESSAGE_ARCHIVE_AFTER_DAYS``, moved
+    here by ``chat.archive.archive_messages``. On PostgreSQL the table is
+    partitioned by month of ``created_at``. Rows are written once and keep
+    the id they had in ``Message``; ``reply_to_id`` may point to either tier.
+    """
+
+    id = models.UUIDField(primary_key=True, editable=False)
+    type = models.CharField(max_length=10, choices=Message.MessageType.choices)
+    content = models.TextField(null=True, blank=True)
+    chat = models.ForeignKey(Chat, on_delete=models.CASCADE, related_name='archived_messages', db_index=False)
+    sender = models.ForeignKey(User, on_delete=models.CASCADE, related_name='+', db_index=False)
+    reply_to_id = models.UUIDField(null=True, blank=True)
+    created_at = models.DateTimeField()
+    updated_at = models.DateTimeField()
+    deleted_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        db_table = 'chat_message_archive'
+        ordering = ['created_at']
+        indexes = [
+            models.Index(fields=['chat', 'created_at', 'id'], name='msg_archive_history_idx'),
+            models.Index(fields=['sender'], name='msg_archive_sender_idx'),
+        ]
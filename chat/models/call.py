@@ -1,4 +1,5 @@
 from django.db import models
+from django.utils import timezone
 from django.utils.translation import gettext_lazy as _
 
 from users.models import User
@@ -20,7 +21,9 @@ class Call(models.Model):
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
     chat = models.ForeignKey(Chat, on_delete=models.CASCADE, related_name='calls')
     initiator = models.ForeignKey(User, on_delete=models.CASCADE, related_name='calls_initiated')
-    started_at = models.DateTimeField(auto_now_add=True)
+    # Set in Python so the call state engine can persist the real start time
+    # when the call ends.
+    started_at = models.DateTimeField(default=timezone.now, editable=False)
     ended_at = models.DateTimeField(null=True, blank=True)
     call_type = models.CharField(max_length=10, choices=CallType.choices)
     call_status = models.CharField(max_length=10, choices=CallStatus.choices)
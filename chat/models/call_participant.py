@@ -1,4 +1,5 @@
 from django.db import models
+from django.utils import timezone
 
 from .call import Call
 from users.models import User
@@ -10,7 +11,7 @@ class CallParticipant(models.Model):
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
     call = models.ForeignKey(Call, on_delete=models.CASCADE, related_name='participants')
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='call_participations')
-    joined_at = models.DateTimeField(auto_now_add=True)
+    joined_at = models.DateTimeField(default=timezone.now, editable=False)
     left_at = models.DateTimeField(null=True, blank=True)
 
     class Meta:
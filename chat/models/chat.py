@@ -1,4 +1,5 @@
 from django.db import models
+from django.utils import timezone
 
 import uuid
 
@@ -6,14 +7,30 @@ class Chat(models.Model):
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
     name = models.CharField(max_length=255, blank=True, null=True)
     is_group = models.BooleanField(default=False)
-    created_at = models.DateTimeField(auto_now_add=True)
+    created_at = models.DateTimeField(default=timezone.now, editable=False)
     updated_at = models.DateTimeField(auto_now=True)
-    
-    
+    # Denormalized for the inbox; see chat.inbox.update_last_message.
+    last_message = models.ForeignKey('Message', null=True, blank=True, on_delete=models.SET_NULL, related_name='+')
+    # Never NULL, so the inbox orders by the column itself; see __init__.
+    last_activity_at = models.DateTimeField(editable=False)
+    # Oldest message moved to the archive; NULL while nothing is archived.
+    # History pages older than this never read the archive.
+    first_archived_at = models.DateTimeField(null=True, blank=True, editable=False)
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # A new chat is active from its creation. Deferred fields are not in
+        # __dict__ and must not be loaded here.
+        if self.__dict__.get("last_activity_at", False) is None:
+            self.last_activity_at = self.created_at
+
     def __str__(self):
         return f"{self.name} ({'Group' if self.is_group else 'Private'})"
     
     class Meta:
         verbose_name = "Chat"
         verbose_name_plural = "Chats"
-        ordering = ['-created_at']
\ No newline at end of file
+        ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['last_activity_at', 'id'], name='chat_activity_idx'),
+        ]
\ No newline at end of file
@@ -3,6 +3,7 @@ from django.utils.translation import gettext_lazy as _
 
 from users.models import User
 from .chat import Chat
+from .message import Message
 
 import uuid
 
@@ -17,6 +18,15 @@ class ChatMember(models.Model):
     role = models.CharField(max_length=20, choices=ChatRoles.choices, blank=True, null=True, default=ChatRoles.MEMBER)
     joined_at = models.DateTimeField(auto_now_add=True)
 
+    # Receipt watermarks: every message in the chat created at or before
+    # these timestamps counts as delivered to / read by this member.
+    last_delivered_message = models.ForeignKey(Message, null=True, blank=True, on_delete=models.SET_NULL, related_name='+')
+    last_delivered_at = models.DateTimeField(null=True, blank=True)
+    last_read_message = models.ForeignKey(Message, null=True, blank=True, on_delete=models.SET_NULL, related_name='+')
+    last_read_at = models.DateTimeField(null=True, blank=True)
+    # Messages after last_read_at not sent by this member; see chat.unread.
+    unread_count = models.PositiveIntegerField(default=0)
+
     class Meta:
         unique_together = ('chat', 'user')
         ordering = ['joined_at']
@@ -27,11 +37,33 @@ class ChatMember(models.Model):
         super().save(*args, **kwargs)
 
     def __str__(self):
+        # Only reads related rows that are already loaded (select_related,
+        # prefetch_private_members()): rendering a list of members must not
+        # cost queries per row.
+        user = self.user.get_full_name() if ChatMember.user.is_cached(self) else f"user {self.user_id}"
+        if not ChatMember.chat.is_cached(self):
+            return f"{user} in chat {self.chat_id}"
         if self.chat.is_group:
-            return f"{self.user.get_full_name()} - {self.role} in {self.chat.name}"
-        
-        other_member = self.chat.members.exclude(user=self.user).first() # type: ignore
+            return f"{user} - {self.role} in {self.chat.name}"
+
+        other_member = self.other_private_member() if hasattr(self.chat, "private_members") else None
         if other_member:
-            return f"{self.user.get_full_name()} in private chat with {other_member.user.get_full_name()}"
-        return f"{self.user.get_full_name()} in private chat"
+            return f"{user} in private chat with {other_member.user.get_full_name()}"
+        return f"{user} in private chat"
+
+    def other_private_member(self):
+        # Lists of members load these with prefetch_private_members()
+        # rather than running this query for every row.
+        members = getattr(self.chat, "private_members", None)
+        if members is None:
+            members = self.chat.members.exclude(user_id=self.user_id).select_related("user")[:1]
+        return next((member for member in members if member.user_id != self.user_id), None)
 
+    @classmethod
+    def prefetch_private_members(cls):
+        """``prefetch_related`` lookup for members listed with ``chat`` selected."""
+        return models.Prefetch(
+            "chat__members",
+            queryset=cls.objects.filter(chat__is_group=False).select_related("user"),
+            to_attr="private_members",
+        )
@@ -1,4 +1,5 @@
 from django.db import models
+from django.utils import timezone
 from django.utils.translation import gettext_lazy as _
 
 from users.models import User
@@ -21,7 +22,9 @@ class Message(models.Model):
     chat = models.ForeignKey(Chat, on_delete=models.CASCADE, related_name='messages')
     sender = models.ForeignKey(User, on_delete=models.CASCADE, related_name='messages_sent')
     reply_to = models.ForeignKey('self', null=True, blank=True, on_delete=models.SET_NULL, related_name='replies')
-    created_at = models.DateTimeField(auto_now_add=True)
+    # Set in Python rather than on insert so write-behind batches keep the
+    # timestamp that was already fanned out to clients.
+    created_at = models.DateTimeField(default=timezone.now, editable=False)
     updated_at = models.DateTimeField(auto_now=True)
     deleted_at = models.DateTimeField(null=True, blank=True)
 
@@ -32,4 +35,10 @@ class Message(models.Model):
             models.Index(fields=['chat']),
             models.Index(fields=['sender']),
             models.Index(fields=['created_at']),
+            models.Index(fields=['chat', 'created_at', 'id'], name='msg_chat_history_idx'),
+            models.Index(
+                fields=['chat', 'created_at', 'id'],
+                condition=models.Q(deleted_at__isnull=True),
+                name='msg_chat_live_history_idx',
+            ),
         ]
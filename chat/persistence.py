@@ -0,0 +1,220 @@
+import asyncio
+import atexit
+import threading
+
+from channels.db import database_sync_to_async
+from channels.layers import get_channel_layer
+from django.conf import settings
+from django.db import DatabaseError, DataError, IntegrityError, transaction
+
+from chat.binary_clients import binary_clients
+from chat.inbox import update_last_message
+from chat.models import Message
+from chat.unread import increment_unread
+from chat.utils import frame_event
+from myproject.metrics import channel_layer_sends, database_calls
+
+from loguru import logger
+
+
+class MessageWriteBehind:
+    """
+    In-process write-behind queue for chat messages.
+
+    Messages are built in Python (id and created_at are generated up front so
+    they can be fanned out immediately) and persisted with ``bulk_create`` once
+    ``batch_size`` messages are pending or ``flush_interval`` seconds have
+    passed since the first one was queued.
+
+    A batch the database fails to take (lost connection, timeout) is queued
+    again as a whole. A message still failing after ``max_retries`` flushes
+    is dropped and a ``message_failed`` frame tells its chat, which has
+    already seen it.
+
+    ``shutdown`` flushes what is left; ``myproject.lifespan`` runs it when
+    the server stops, ahead of the best-effort ``flush_sync`` at exit.
+    """
+
+    def __init__(self, batch_size=100, flush_interval=0.05, max_retries=3):
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_retries = max_retries
+        self._pending = []
+        self._pending_lock = threading.Lock()
+        self._flush_lock = asyncio.Lock()
+        self._timer = None
+
+    def __len__(self):
+        return len(self._pending)
+
+    async def enqueue(self, message):
+        with self._pending_lock:
+            self._pending.append((message, 0))
+            pending = len(self._pending)
+
+        if pending >= self.batch_size:
+            # The sender that fills a batch pays for the INSERT, which keeps
+            # the buffer bounded when the database falls behind.
+            await self.flush()
+        else:
+            self._schedule_flush()
+        return message
+
+    async def has_message(self, chat_id, message_id):
+        """
+        Whether ``message_id`` is a message of ``chat_id`` that a reply can
+        point at: queued here or already saved. A miss is checked again after
+        a couple of flush intervals, in case another worker still holds it.
+        """
+        with self._pending_lock:
+            if any(message.id == message_id and str(message.chat_id) == str(chat_id) for message, _ in self._pending):
+                return True
+
+        for wait in (0, self.flush_interval * 2):
+            await asyncio.sleep(wait)
+            with database_calls.time(call="reply_target"):
+                if await database_sync_to_async(_saved)(chat_id, message_id):
+                    return True
+        return False
+
+    async def flush(self):
+        async with self._flush_lock:
+            batch = self._drain()
+            if not batch:
+                return
+            with database_calls.time(call="message_write_behind"):
+                retry, dropped = await database_sync_to_async(self._write)(batch)
+
+        if retry:
+            with self._pending_lock:
+                self._pending[:0] = retry
+            self._schedule_flush()
+        if dropped:
+            await self._announce_dropped(dropped)
+
+    async def shutdown(self):
+        """Flush until nothing is pending, giving each message its remaining retries."""
+        for _ in range(self.max_retries):
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+            if not self._pending:
+                return
+            await self.flush()
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+
+    def flush_sync(self):
+        """
+        Flush from a synchronous context, e.g. at interpreter exit when there
+        is no running event loop left to schedule on.
+        """
+        for _ in range(self.max_retries):
+            batch = self._drain()
+            if not batch:
+                return
+            retry, _ = self._write(batch)
+            if retry:
+                with self._pending_lock:
+                    self._pending[:0] = retry
+
+        dropped = self._drain()
+        if dropped:
+            logger.error(f"Dropping {len(dropped)} unsaved messages on shutdown.")
+
+    def _drain(self):
+        with self._pending_lock:
+            batch, self._pending = self._pending, []
+        return batch
+
+    def _schedule_flush(self):
+        if self._timer is not None and not self._timer.done():
+            return
+        self._timer = asyncio.ensure_future(self._delayed_flush())
+
+    async def _delayed_flush(self):
+        await asyncio.sleep(self.flush_interval)
+        try:
+            await self.flush()
+        except Exception as e:
+            logger.error(f"Write-behind flush failed: {str(e)}")
+
+    async def _announce_dropped(self, dropped):
+        channel_layer = get_channel_layer()
+        if channel_layer is None:
+            return
+
+        for message in dropped:
+            group = f"chat_{message.chat_id}"
+            binary = await binary_clients.any(group)
+            with channel_layer_sends.time(method="group_send", source="write_behind"):
+                await channel_layer.group_send(
+                    group,
+                    frame_event({
+                        "type": "message_failed",
+                        "id": message.id,
+                        "chat_id": message.chat_id,
+                        "error": "Message could not be saved.",
+                    }, binary=binary),
+                )
+
+    def _write(self, batch):
+        """
+        Persist a batch, falling back to row-by-row inserts if the batch is
+        rejected. Returns the entries that should be retried on the next
+        flush and the messages given up on.
+        """
+        try:
+            with transaction.atomic():
+                messages = Message.objects.bulk_create(
+                    [message for message, _ in batch],
+                    batch_size=self.batch_size,
+                )
+                increment_unread(messages)
+                update_last_message(messages)
+            return [], []
+        except (IntegrityError, DataError) as e:
+            # Usually a reply_to pointing at a message another worker has not
+            # flushed yet; isolate the offending rows instead of losing the batch.
+            logger.warning(f"Batch insert of {len(batch)} messages failed, retrying per row: {str(e)}")
+        except DatabaseError as e:
+            # The database itself failed; rows on their own would fail alike.
+            logger.error(f"Batch insert of {len(batch)} messages failed: {str(e)}")
+            return self._retry_or_drop(batch, e)
+
+        retry, dropped = [], []
+        for entry in batch:
+            message, _ = entry
+            try:
+                with transaction.atomic():
+                    message.save(force_insert=True)
+                    increment_unread([message])
+                    update_last_message([message])
+            except DatabaseError as e:
+                entry_retry, entry_dropped = self._retry_or_drop([entry], e)
+                retry += entry_retry
+                dropped += entry_dropped
+        return retry, dropped
+
+    def _retry_or_drop(self, batch, error):
+        retry, dropped = [], []
+        for message, attempts in batch:
+            if attempts + 1 < self.max_retries:
+                retry.append((message, attempts + 1))
+            else:
+                logger.error(f"Dropping message {message.id} after {attempts + 1} attempts: {str(error)}")
+                dropped.append(message)
+        return retry, dropped
+
+
+def _saved(chat_id, message_id):
+    return Message.objects.filter(id=message_id, chat_id=chat_id).exists()
+
+
+message_write_behind = MessageWriteBehind(
+    batch_size=settings.CHAT_WRITE_BEHIND_BATCH_SIZE,
+    flush_interval=settings.CHAT_WRITE_BEHIND_FLUSH_INTERVAL,
+)
+
+atexit.register(message_write_behind.flush_sync)
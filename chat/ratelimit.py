@@ -0,0 +1,210 @@
+import time
+import uuid
+from collections import deque, namedtuple
+
+import redis.asyncio as redis
+from django.conf import settings
+
+from loguru import logger
+
+
+Decision = namedtuple("Decision", ["allowed", "retry_after"])
+
+
+# Both policies run as one script so the read-modify-write is atomic on the
+# Redis side. Time comes from the Redis server to keep workers consistent.
+RATE_LIMIT_SCRIPT = """
+local key = KEYS[1]
+local policy = ARGV[1]
+local cost = tonumber(ARGV[2])
+local clock = redis.call('TIME')
+local now = tonumber(clock[1]) * 1000 + math.floor(tonumber(clock[2]) / 1000)
+
+if policy == 'token_bucket' then
+    local rate = tonumber(ARGV[3])
+    local capacity = tonumber(ARGV[4])
+    local state = redis.call('HMGET', key, 'tokens', 'ts')
+    local tokens = tonumber(state[1]) or capacity
+    local ts = tonumber(state[2]) or now
+    tokens = math.min(capacity, tokens + (now - ts) * rate / 1000)
+
+    local allowed = 0
+    local retry_after = 0
+    if tokens >= cost then
+        tokens = tokens - cost
+        allowed = 1
+    else
+        retry_after = math.ceil((cost - tokens) * 1000 / rate)
+    end
+
+    redis.call('HSET', key, 'tokens', tostring(tokens), 'ts', now)
+    redis.call('PEXPIRE', key, math.ceil(capacity * 1000 / rate) + 1000)
+    return {allowed, retry_after}
+end
+
+local limit = tonumber(ARGV[3])
+local window = tonumber(ARGV[4])
+local member = ARGV[5]
+redis.call('ZREMRANGEBYSCORE', key, '-inf', now - window)
+
+if redis.call('ZCARD', key) + cost <= limit then
+    for i = 1, cost do
+        redis.call('ZADD', key, now, member .. ':' .. i)
+    end
+    redis.call('PEXPIRE', key, window)
+    return {1, 0}
+end
+
+local oldest = redis.call('ZRANGE', key, 0, 0, 'WITHSCORES')
+local retry_after = window
+if oldest[2] then
+    retry_after = tonumber(oldest[2]) + window - now
+end
+return {0, retry_after}
+"""
+
+
+class TokenBucket:
+    """Allow bursts of ``capacity`` calls, refilled at ``rate`` calls per second."""
+
+    name = "token_bucket"
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+
+    def args(self):
+        return [self.rate, self.capacity]
+
+
+class SlidingWindow:
+    """Allow at most ``limit`` calls in any ``window`` seconds."""
+
+    name = "sliding_window"
+
+    def __init__(self, limit, window):
+        self.limit = limit
+        self.window = window
+
+    def args(self):
+        return [self.limit, int(self.window * 1000), uuid.uuid4().hex]
+
+
+def make_key(event, user_id=None, chat_id=None):
+    """
+    Build a limiter key from the event type and, optionally, the user and chat
+    it is scoped to, e.g. ``rl:chat_message:u:<user>:c:<chat>``.
+    """
+    key = f"rl:{event}"
+    if user_id is not None:
+        key += f":u:{user_id}"
+    if chat_id is not None:
+        key += f":c:{chat_id}"
+    return key
+
+
+class RedisBackend:
+    def __init__(self, url):
+        self.client = redis.Redis.from_url(url)
+        self.script = self.client.register_script(RATE_LIMIT_SCRIPT)
+
+    async def hit(self, key, policy, cost):
+        allowed, retry_after = await self.script(
+            keys=[key],
+            args=[policy.name, cost, *policy.args()],
+        )
+        return Decision(bool(allowed), retry_after / 1000)
+
+
+class MemoryBackend:
+    """
+    Per-process implementation of the same policies, for development and
+    tests. Limits are not shared between workers.
+    """
+
+    def __init__(self, max_keys=100_000):
+        self.max_keys = max_keys
+        self._buckets = {}
+        self._windows = {}
+
+    async def hit(self, key, policy, cost):
+        now = time.monotonic()
+        if policy.name == TokenBucket.name:
+            return self._token_bucket(key, policy, cost, now)
+        return self._sliding_window(key, policy, cost, now)
+
+    def _token_bucket(self, key, policy, cost, now):
+        tokens, ts = self._buckets.get(key, (policy.capacity, now))
+        tokens = min(policy.capacity, tokens + (now - ts) * policy.rate)
+
+        if tokens >= cost:
+            self._store(self._buckets, key, (tokens - cost, now))
+            return Decision(True, 0)
+
+        self._store(self._buckets, key, (tokens, now))
+        return Decision(False, (cost - tokens) / policy.rate)
+
+    def _sliding_window(self, key, policy, cost, now):
+        hits = self._windows.get(key)
+        if hits is None:
+            hits = deque()
+            self._store(self._windows, key, hits)
+
+        while hits and hits[0] <= now - policy.window:
+            hits.popleft()
+
+        if len(hits) + cost <= policy.limit:
+            hits.extend([now] * cost)
+            return Decision(True, 0)
+
+        if not hits:
+            return Decision(False, policy.window)
+        return Decision(False, hits[0] + policy.window - now)
+
+    def _store(self, table, key, value):
+        if key not in table and len(table) >= self.max_keys:
+            table.clear()
+        table[key] = value
+
+
+class RateLimiter:
+    """
+    Async rate limiter. Rejections are remembered in-process until their
+    ``retry_after`` elapses, so a client hammering a limited event is turned
+    away without another round trip to the backend.
+    """
+
+    def __init__(self, backend, max_blocked=100_000):
+        self.backend = backend
+        self.max_blocked = max_blocked
+        self._blocked = {}
+
+    async def hit(self, key, policy, cost=1):
+        now = time.monotonic()
+        blocked_until = self._blocked.get(key)
+        if blocked_until is not None:
+            if now < blocked_until:
+                return Decision(False, blocked_until - now)
+            del self._blocked[key]
+
+        try:
+            decision = await self.backend.hit(key, policy, cost)
+        except redis.RedisError as e:
+            # Fail open: a limiter outage should not take chat down with it.
+            logger.warning(f"Rate limiter backend unavailable: {str(e)}")
+            return Decision(True, 0)
+
+        if not decision.allowed and decision.retry_after > 0:
+            if len(self._blocked) >= self.max_blocked:
+                self._blocked.clear()
+            self._blocked[key] = now + decision.retry_after
+        return decision
+
+
+def get_backend():
+    if settings.RATE_LIMIT_BACKEND == "memory":
+        return MemoryBackend()
+    return RedisBackend(settings.RATE_LIMIT_REDIS_URL)
+
+
+rate_limiter = RateLimiter(get_backend())
@@ -0,0 +1,215 @@
+import asyncio
+import atexit
+import threading
+from functools import reduce
+from operator import or_
+from uuid import UUID
+
+from channels.db import database_sync_to_async
+from channels.layers import get_channel_layer
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Case, CharField, Q, Value, When
+
+from chat.binary_clients import binary_clients
+from chat.models import ChatMember, Message, MessageStatusEntry
+from chat.unread import reset_unread
+from chat.utils import frame_event
+from myproject.metrics import channel_layer_sends, database_calls
+
+from loguru import logger
+
+
+SENT = MessageStatusEntry.Status.SENT.value
+DELIVERED = MessageStatusEntry.Status.DELIVERED.value
+READ = MessageStatusEntry.Status.READ.value
+
+
+class ReceiptCoalescer:
+    """
+    Collects "delivered/read up to message X" watermarks from websocket
+    clients and persists them per ``ChatMember`` every ``flush_interval``
+    seconds.
+
+    Within an interval only the latest watermark per (chat, user, status) is
+    kept, so a reader scrolling through a busy group costs one row update per
+    flush instead of one ``MessageStatusEntry`` per message. Each flush is
+    three queries however many receipts it carries: resolve the messages,
+    lock the member rows, bulk update them; plus one to recount the unread
+    counters of members whose read watermark moved.
+    """
+
+    def __init__(self, flush_interval=1.0, max_attempts=3):
+        self.flush_interval = flush_interval
+        self.max_attempts = max_attempts
+        self._pending = {}
+        self._pending_lock = threading.Lock()
+        self._timer = None
+
+    async def record(self, chat_id, user_id, status, message_id):
+        with self._pending_lock:
+            self._pending.setdefault((str(chat_id), str(user_id)), {})[status] = (str(message_id), 0)
+        self._schedule_flush()
+
+    async def flush(self):
+        pending = self._drain()
+        if not pending:
+            return
+
+        with database_calls.time(call="receipt_write"):
+            applied, retry = await database_sync_to_async(self._write)(pending)
+        if retry:
+            self._requeue(retry)
+            self._schedule_flush()
+
+        if applied:
+            await self._announce(applied)
+
+    def flush_sync(self):
+        pending = self._drain()
+        if pending:
+            self._write(pending)
+
+    def _drain(self):
+        with self._pending_lock:
+            pending, self._pending = self._pending, {}
+        return pending
+
+    def _requeue(self, retry):
+        with self._pending_lock:
+            for key, statuses in retry.items():
+                current = self._pending.setdefault(key, {})
+                for status, entry in statuses.items():
+                    # A newer watermark recorded meanwhile wins.
+                    current.setdefault(status, entry)
+
+    def _schedule_flush(self):
+        if self._timer is not None and not self._timer.done():
+            return
+        self._timer = asyncio.ensure_future(self._delayed_flush())
+
+    async def _delayed_flush(self):
+        await asyncio.sleep(self.flush_interval)
+        try:
+            await self.flush()
+        except Exception as e:
+            logger.error(f"Receipt flush failed: {str(e)}")
+
+    def _write(self, pending):
+        message_ids = {
+            message_id
+            for statuses in pending.values()
+            for message_id, _ in statuses.values()
+        }
+        messages = {
+            str(row["id"]): row
+            for row in Message.objects.filter(id__in=message_ids).values("id", "chat_id", "created_at")
+        }
+
+        applied = {}
+        retry = {}
+        with transaction.atomic():
+            members = ChatMember.objects.select_for_update().filter(
+                reduce(or_, (Q(chat_id=chat_id, user_id=user_id) for chat_id, user_id in pending))
+            )
+
+            changed = []
+            read = []
+            for member in members:
+                key = (str(member.chat_id), str(member.user_id))
+                statuses = pending[key]
+                advanced = {}
+
+                for status, (message_id, attempts) in statuses.items():
+                    message = messages.get(message_id)
+                    if message is None:
+                        # Possibly still in the write-behind queue; try again later.
+                        if attempts + 1 < self.max_attempts:
+                            retry.setdefault(key, {})[status] = (message_id, attempts + 1)
+                        continue
+                    if str(message["chat_id"]) != key[0]:
+                        continue
+                    if self._advance(member, status, message):
+                        advanced[status] = message_id
+
+                    # Reading a message implies it was delivered.
+                    if status == READ and self._advance(member, DELIVERED, message):
+                        advanced.setdefault(DELIVERED, message_id)
+
+                if advanced:
+                    changed.append(member)
+                    applied[key] = advanced
+                if READ in advanced:
+                    read.append(member.pk)
+
+            ChatMember.objects.bulk_update(changed, [
+                "last_delivered_message",
+                "last_delivered_at",
+                "last_read_message",
+                "last_read_at",
+            ])
+            reset_unread(read)
+
+        return applied, retry
+
+    @staticmethod
+    def _advance(member, status, message):
+        """Move the member's watermark forward; watermarks never go back."""
+        current = getattr(member, f"last_{status}_at")
+        if current is not None and current >= message["created_at"]:
+            return False
+        setattr(member, f"last_{status}_message_id", message["id"])
+        setattr(member, f"last_{status}_at", message["created_at"])
+        return True
+
+    async def _announce(self, applied):
+        channel_layer = get_channel_layer()
+        if channel_layer is None:
+            return
+
+        for (chat_id, user_id), statuses in applied.items():
+            group = f"chat_{chat_id}"
+            binary = await binary_clients.any(group)
+            for status, message_id in statuses.items():
+                with channel_layer_sends.time(method="group_send", source="receipts"):
+                    await channel_layer.group_send(
+                        group,
+                        frame_event({
+                            "type": "receipt",
+                            "status": status,
+                            "user_id": UUID(user_id),
+                            "message_id": UUID(message_id),
+                        }, binary=binary),
+                    )
+
+
+def message_status(message, member):
+    """Derive one member's status for ``message`` from their watermarks."""
+    if member.last_read_at is not None and member.last_read_at >= message.created_at:
+        return READ
+    if member.last_delivered_at is not None and member.last_delivered_at >= message.created_at:
+        return DELIVERED
+    return SENT
+
+
+def message_statuses(message):
+    """
+    Per-member statuses for ``message`` in a single query, as
+    ``ChatMember`` rows annotated with ``status``. The sender is excluded.
+    """
+    return (
+        ChatMember.objects
+        .filter(chat_id=message.chat_id)
+        .exclude(user_id=message.sender_id)
+        .annotate(status=Case(
+            When(last_read_at__gte=message.created_at, then=Value(READ)),
+            When(last_delivered_at__gte=message.created_at, then=Value(DELIVERED)),
+            default=Value(SENT),
+            output_field=CharField(),
+        ))
+    )
+
+
+receipt_coalescer = ReceiptCoalescer(flush_interval=settings.CHAT_RECEIPT_FLUSH_INTERVAL)
+
+atexit.register(receipt_coalescer.flush_sync)
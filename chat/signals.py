@@ -0,0 +1,18 @@
+from functools import partial
+
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from chat.membership import membership_cache
+from chat.models import ChatMember
+
+
+# Deleting a Chat cascades to its ChatMember rows, and the collector sends
+# post_delete for each of them, so chat deletion is covered here as well.
+@receiver(post_save, sender=ChatMember)
+@receiver(post_delete, sender=ChatMember)
+def invalidate_membership(sender, instance, using, **kwargs):
+    # After commit: invalidated any earlier, a connect racing the
+    # transaction could cache the old answer again until the timeout.
+    transaction.on_commit(partial(membership_cache.invalidate, instance.chat_id, instance.user_id), using=using)
@@ -1,3 +1,569 @@
-from django.test import TestCase
+import json
+import uuid
+from datetime import timedelta
 
-# Create your tests here.
+from asgiref.testing import ApplicationCommunicator
+from channels.testing import WebsocketCommunicator
+from django.core.cache import cache
+from django.core.exceptions import ImproperlyConfigured
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from redis.exceptions import ConnectionError as RedisConnectionError
+
+from chat.archive import _delete_archivable, archive_horizon, archive_messages
+from chat.binary_clients import binary_clients
+from chat.calls import MemoryCallStateBackend, call_state
+from chat.history import encode_cursor, fetch_history
+from chat.inbox import update_last_message
+from chat.membership import membership_cache
+from chat.models import ArchivedMessage, Chat, ChatMember, Message
+from chat.persistence import message_write_behind
+from chat.typing_roster import MemoryTypingBackend, TypingAggregator
+from chat.utils import MSGPACK_SUBPROTOCOL, decode_binary_frame, encode_binary_frame, encode_frame, rate_limit
+from myproject.metrics import WORKER, registry
+from myproject.testing import QueryBudgetMixin
+from users.models import User
+from users.tokens import UserRefreshToken
+
+
+class ChatConsumerQueryBudgetTests(QueryBudgetMixin, TestCase):
+    """
+    Queries and wall time each ChatConsumer event may cost. Raise a budget
+    only together with the change that needs it.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.chat = Chat.objects.create(name="budget", is_group=True)
+        cls.users = [
+            User.objects.create_user(email=f"member{i}@example.com", password="password123", first_name="Mem", last_name=f"Ber{i}")
+            for i in range(3)
+        ]
+        ChatMember.objects.bulk_create([ChatMember(chat=cls.chat, user=user) for user in cls.users])
+        cls.tokens = [str(UserRefreshToken.for_user(user).access_token) for user in cls.users]
+
+    def setUp(self):
+        cache.clear()
+
+    def communicator(self, index=0):
+        from myproject.asgi import application
+
+        return WebsocketCommunicator(
+            application, f"/ws/chat/{self.chat.id}/", subprotocols=["access_token", self.tokens[index]]
+        )
+
+    async def test_connect(self):
+        client = self.communicator()
+        # Cold membership cache: one lookup, whatever the chat size.
+        async with self.assertBudgetAsync("connect (cold cache)", queries=1, seconds=0.5):
+            connected, _ = await client.connect()
+        self.assertTrue(connected)
+        await client.disconnect()
+
+        client = self.communicator()
+        async with self.assertBudgetAsync("connect (warm cache)", queries=0, seconds=0.25):
+            connected, _ = await client.connect()
+        self.assertTrue(connected)
+        await client.disconnect()
+
+    async def test_chat_message(self):
+        sender, receiver = self.communicator(0), self.communicator(1)
+        await sender.connect()
+        await receiver.connect()
+
+        # INSERT plus the unread and last_message UPDATEs, inside a savepoint.
+        async with self.assertBudgetAsync("chat_message", queries=5, seconds=0.25):
+            await sender.send_json_to({"type": "chat_message", "content": "hello"})
+            frame = await receiver.receive_json_from()
+        self.assertEqual(frame["type"], "chat_message")
+        self.assertEqual(await Message.objects.filter(chat=self.chat).acount(), 1)
+        # Counted in the INSERT's transaction, not deferred to a later flush.
+        receiver_member = await ChatMember.objects.aget(chat=self.chat, user=self.users[1])
+        self.assertEqual(receiver_member.unread_count, 1)
+
+        await sender.disconnect()
+        await receiver.disconnect()
+
+    async def test_typing(self):
+        client = self.communicator()
+        await client.connect()
+        async with self.assertBudgetAsync("typing", queries=0, seconds=0.25):
+            await client.send_json_to({"type": "typing", "is_typing": True})
+            await client.send_json_to({"type": "typing", "is_typing": False})
+        await client.disconnect()
+
+    async def test_history(self):
+        await Message.objects.abulk_create([
+            Message(chat=self.chat, sender=self.users[i % 3], content=f"message {i}") for i in range(30)
+        ])
+        client = self.communicator()
+        await client.connect()
+        # One keyset page query, however many messages or senders.
+        async with self.assertBudgetAsync("history", queries=1, seconds=0.25):
+            await client.send_json_to({"type": "history", "limit": 20})
+            frame = await client.receive_json_from()
+        self.assertEqual(len(frame["messages"]), 20)
+        await client.disconnect()
+
+    async def test_disconnect(self):
+        client = self.communicator()
+        await client.connect()
+        async with self.assertBudgetAsync("disconnect", queries=0, seconds=0.25):
+            await client.disconnect()
+
+
+@override_settings(CHAT_WRITE_BEHIND_ENABLED=True)
+class ChatReplyValidationTests(QueryBudgetMixin, TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.chat = Chat.objects.create(name="replies", is_group=True)
+        cls.other = Chat.objects.create(name="elsewhere", is_group=True)
+        cls.users = [
+            User.objects.create_user(email=f"reply{i}@example.com", password="password123") for i in range(2)
+        ]
+        ChatMember.objects.bulk_create([ChatMember(chat=cls.chat, user=user) for user in cls.users])
+        cls.tokens = [str(UserRefreshToken.for_user(user).access_token) for user in cls.users]
+
+    def setUp(self):
+        cache.clear()
+
+    def communicator(self, index):
+        from myproject.asgi import application
+
+        return WebsocketCommunicator(
+            application, f"/ws/chat/{self.chat.id}/", subprotocols=["access_token", self.tokens[index]]
+        )
+
+    async def test_reply_to_unknown_message_is_not_broadcast(self):
+        elsewhere = await Message.objects.acreate(chat=self.other, sender=self.users[0], content="elsewhere")
+        sender, receiver = self.communicator(0), self.communicator(1)
+        await sender.connect()
+        await receiver.connect()
+
+        for reply_to_id in (uuid.uuid4(), elsewhere.id):
+            await sender.send_json_to({"type": "chat_message", "content": "re", "reply_to_id": str(reply_to_id)})
+            frame = await sender.receive_json_from()
+            self.assertEqual(frame["type"], "validation_error")
+        self.assertTrue(await receiver.receive_nothing())
+
+        await sender.disconnect()
+        await receiver.disconnect()
+        await message_write_behind.flush()
+
+    async def test_reply_to_queued_message(self):
+        sender = self.communicator(0)
+        await sender.connect()
+        await sender.send_json_to({"type": "chat_message", "content": "first"})
+        first = await sender.receive_json_from()
+
+        await sender.send_json_to({"type": "chat_message", "content": "re", "reply_to_id": first["id"]})
+        frame = await sender.receive_json_from()
+        self.assertEqual(frame["reply_to_id"], first["id"])
+
+        await sender.disconnect()
+        await message_write_behind.flush()
+
+    async def test_lifespan_shutdown_flushes_queued_messages(self):
+        from myproject.asgi import application
+
+        message = Message(chat_id=self.chat.id, sender_id=self.users[0].id, content="last words")
+        message.updated_at = message.created_at
+        await message_write_behind.enqueue(message)
+
+        lifespan = ApplicationCommunicator(application, {"type": "lifespan"})
+        await lifespan.send_input({"type": "lifespan.startup"})
+        self.assertEqual((await lifespan.receive_output())["type"], "lifespan.startup.complete")
+        await lifespan.send_input({"type": "lifespan.shutdown"})
+        self.assertEqual((await lifespan.receive_output())["type"], "lifespan.shutdown.complete")
+        self.assertTrue(await Message.objects.filter(id=message.id).aexists())
+        self.assertEqual(len(message_write_behind), 0)
+
+
+class MembershipCacheTests(QueryBudgetMixin, TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(email="membership@example.com", password="password123")
+        cls.chat = Chat.objects.create(name="membership", is_group=True)
+
+    def setUp(self):
+        cache.clear()
+
+    def test_invalidated_on_commit(self):
+        self.assertFalse(membership_cache.is_member_sync(self.chat.id, self.user.id))
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            ChatMember.objects.create(chat=self.chat, user=self.user)
+            # Still the cached answer until the transaction commits.
+            self.assertFalse(membership_cache.is_member_sync(self.chat.id, self.user.id))
+        self.assertEqual(len(callbacks), 1)
+        self.assertTrue(membership_cache.is_member_sync(self.chat.id, self.user.id))
+
+
+class BinaryFrameTests(QueryBudgetMixin, TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.chat = Chat.objects.create(name="binary", is_group=True)
+        cls.users = [
+            User.objects.create_user(email=f"binary{i}@example.com", password="password123") for i in range(2)
+        ]
+        ChatMember.objects.bulk_create([ChatMember(chat=cls.chat, user=user) for user in cls.users])
+        cls.tokens = [str(UserRefreshToken.for_user(user).access_token) for user in cls.users]
+
+    def setUp(self):
+        cache.clear()
+        binary_clients._memo.clear()
+
+    def communicator(self, index, binary=False):
+        from myproject.asgi import application
+
+        subprotocols = ["access_token", self.tokens[index]] + ([MSGPACK_SUBPROTOCOL] if binary else [])
+        return WebsocketCommunicator(application, f"/ws/chat/{self.chat.id}/", subprotocols=subprotocols)
+
+    async def test_msgpack_encoded_only_with_binary_clients(self):
+        group = f"chat_{self.chat.id}"
+        text = self.communicator(0)
+        await text.connect()
+        self.assertFalse(await binary_clients.any(group))
+
+        binary = self.communicator(1, binary=True)
+        await binary.connect()
+        self.assertTrue(await binary_clients.any(group))
+
+        await text.send_json_to({"type": "chat_message", "content": "hello"})
+        frame = decode_binary_frame(await binary.receive_from())
+        self.assertEqual(frame["content"], "hello")
+        self.assertEqual(str(uuid.UUID(frame["id"])), frame["id"])
+
+        await binary.disconnect()
+        binary_clients._memo.clear()
+        self.assertFalse(await binary_clients.any(group))
+        await text.disconnect()
+
+
+    def test_binary_frames_match_text_frames(self):
+        payload = {"id": uuid.uuid4(), "created_at": timezone.now(), "reply_to_id": None, "content": "hi"}
+        self.assertEqual(encode_binary_frame(payload), encode_binary_frame(json.loads(encode_frame(payload))))
+        self.assertEqual(decode_binary_frame(encode_binary_frame(payload)), json.loads(encode_frame(payload)))
+
+
+class FlakyCallStateBackend(MemoryCallStateBackend):
+    down = False
+
+    async def peer_channel(self, call_id, user_id):
+        if self.down:
+            raise RedisConnectionError("Connection refused.")
+        return await super().peer_channel(call_id, user_id)
+
+
+class RateLimitDecoratorTests(TestCase):
+    def test_needs_a_policy_or_interval(self):
+        with self.assertRaises(ImproperlyConfigured):
+            rate_limit("typing_event")
+        with self.assertRaises(ImproperlyConfigured):
+            rate_limit("typing_event", 0)
+        rate_limit("typing_event", 2)
+
+
+class BrokenTypingBackend(MemoryTypingBackend):
+    async def start(self, chat_id, user_id, username, expires_at):
+        raise RedisConnectionError("Connection refused.")
+
+
+class TypingAggregatorTests(TestCase):
+    async def test_backend_errors_are_absorbed(self):
+        aggregator = TypingAggregator(BrokenTypingBackend())
+        await aggregator.update(uuid.uuid4(), uuid.uuid4(), "Typist", True)
+        # Nothing was recorded, so the next keystroke tries again.
+        self.assertEqual(aggregator._refreshed, {})
+        self.assertEqual(aggregator._chats, set())
+
+
+class SignalingConsumerTests(QueryBudgetMixin, TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.chat = Chat.objects.create(name="call", is_group=True)
+        cls.user = User.objects.create_user(email="caller@example.com", password="password123")
+        ChatMember.objects.create(chat=cls.chat, user=cls.user)
+        cls.token = str(UserRefreshToken.for_user(cls.user).access_token)
+
+    def setUp(self):
+        cache.clear()
+        call_state.backend = FlakyCallStateBackend()
+
+    async def test_bad_frames_get_error_replies(self):
+        from myproject.asgi import application
+
+        client = WebsocketCommunicator(
+            application, f"/ws/chat/{self.chat.id}/call/", subprotocols=["access_token", self.token]
+        )
+        connected, _ = await client.connect()
+        self.assertTrue(connected)
+        self.assertEqual((await client.receive_json_from())["type"], "call_joined")
+        self.assertEqual((await client.receive_json_from())["type"], "participant_joined")
+
+        for frame in ({"text_data": "not json"}, {"bytes_data": b"\xff"}, {"text_data": "[]"}):
+            await client.send_to(**frame)
+            self.assertEqual((await client.receive_json_from())["type"], "validation_error")
+
+        # JSON in a binary frame is accepted.
+        await client.send_to(bytes_data=json.dumps({"type": "offer", "to": str(uuid.uuid4())}).encode())
+        reply = await client.receive_json_from()
+        self.assertEqual((reply["type"], reply["message"]), ("signaling_error", "Participant is not in the call."))
+
+        call_state.backend.down = True
+        await client.send_json_to({"type": "offer", "to": str(uuid.uuid4())})
+        reply = await client.receive_json_from()
+        self.assertEqual((reply["type"], reply["message"]), ("signaling_error", "Call state is unavailable, try again."))
+
+        call_state.backend.down = False
+        await client.send_json_to({"type": "heartbeat"})
+        self.assertTrue(await client.receive_nothing())
+        await client.disconnect()
+
+
+class ChatMemberStrTests(QueryBudgetMixin, TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        users = User.objects.bulk_create([
+            User(email=f"str{i}@example.com", first_name="Str", last_name=str(i), password="!") for i in range(10)
+        ])
+        group = Chat.objects.create(name="group", is_group=True)
+        private = Chat.objects.create(name="private", is_group=False)
+        ChatMember.objects.bulk_create(
+            [ChatMember(chat=group, user=user) for user in users]
+            + [ChatMember(chat=private, user=user) for user in users[:2]]
+        )
+
+    def test_str_does_not_query(self):
+        members = ChatMember.objects.select_related("chat", "user").prefetch_related(
+            ChatMember.prefetch_private_members()
+        )
+        with self.assertBudget("ChatMember.__str__ (prefetched)", queries=2, seconds=0.25):
+            labels = [str(member) for member in members]
+        self.assertEqual(len(labels), 12)
+        self.assertIn("Str 0 - member in group", labels)
+        self.assertIn("Str 0 in private chat with Str 1", labels)
+        self.assertIn("Str 1 in private chat with Str 0", labels)
+
+    def test_str_falls_back_to_ids(self):
+        member = ChatMember.objects.get(chat__is_group=False, user__last_name="1")
+        with self.assertBudget("ChatMember.__str__ (bare)", queries=0, seconds=0.25):
+            label = str(member)
+        self.assertEqual(label, f"user {member.user_id} in chat {member.chat_id}")
+
+        member = ChatMember.objects.select_related("chat", "user").get(pk=member.pk)
+        with self.assertBudget("ChatMember.__str__ (select_related)", queries=0, seconds=0.25):
+            label = str(member)
+        self.assertEqual(label, "Str 1 in private chat")
+        self.assertEqual(member.other_private_member().user.get_full_name(), "Str 0")
+
+
+class MetricsTests(QueryBudgetMixin, TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.chat = Chat.objects.create(name="metrics", is_group=True)
+        cls.user = User.objects.create_user(email="metrics@example.com", password="password123")
+        ChatMember.objects.create(chat=cls.chat, user=cls.user)
+        cls.token = str(UserRefreshToken.for_user(cls.user).access_token)
+
+    @override_settings(METRICS_TOKEN="secret")
+    async def test_websocket_traffic_is_exported(self):
+        from myproject.asgi import application
+
+        client = WebsocketCommunicator(
+            application, f"/ws/chat/{self.chat.id}/", subprotocols=["access_token", self.token]
+        )
+        await client.connect()
+        await client.send_json_to({"type": "chat_message", "content": "hello"})
+        await client.receive_json_from()
+
+        body = (await self.async_client.get("/metrics", headers={"authorization": "Bearer secret"})).content.decode()
+        self.assertIn(f'websocket_active_connections{{consumer="chat",worker="{WORKER}"}} 1', body)
+        self.assertIn('websocket_event_seconds_count{consumer="chat",event="chat_message"}', body)
+        self.assertIn('database_call_seconds_count{call="create_message"}', body)
+        self.assertIn('channel_layer_send_seconds_count{method="group_send",source="chat"}', body)
+        self.assertIn('# TYPE chat_membership_cache_lookups_total counter', body)
+        self.assertIn('chat_membership_cache_lookups_total{result="miss"}', body)
+
+        await client.disconnect()
+        body = (await self.async_client.get("/metrics", headers={"authorization": "Bearer secret"})).content.decode()
+        self.assertIn(f'websocket_active_connections{{consumer="chat",worker="{WORKER}"}} 0', body)
+        self.assertIn('http_request_seconds_count{view="metrics",method="GET",status="200"}', body)
+
+    @override_settings(QUERY_PROFILE_SAMPLE_RATE=1.0)
+    async def test_sampled_websocket_events_are_profiled(self):
+        from myproject.asgi import application
+
+        client = WebsocketCommunicator(
+            application, f"/ws/chat/{self.chat.id}/", subprotocols=["access_token", self.token]
+        )
+        await client.connect()
+        await client.send_json_to({"type": "chat_message", "content": "hello"})
+        await client.receive_json_from()
+        await client.disconnect()
+
+        body = registry.render()
+        for event in ("websocket.connect", "websocket.receive", "frame_event", "websocket.disconnect"):
+            self.assertIn(f'profiled_queries_count{{protocol="websocket",handler="{event}"}}', body)
+
+    @override_settings(METRICS_TOKEN="secret")
+    def test_token_required(self):
+        self.assertEqual(self.client.get("/metrics").status_code, 403)
+        self.assertEqual(self.client.get("/metrics", HTTP_AUTHORIZATION="Bearer wrong").status_code, 403)
+        response = self.client.get("/metrics", HTTP_AUTHORIZATION="Bearer secret")
+        self.assertEqual(response.status_code, 200)
+
+    def test_not_public_without_a_token(self):
+        self.assertEqual(self.client.get("/metrics").status_code, 403)
+        with self.settings(DEBUG=True):
+            self.assertEqual(self.client.get("/metrics").status_code, 200)
+
+
+class AdminQueryBudgetTests(QueryBudgetMixin, TestCase):
+    """Changelists must cost the same number of queries however many rows they show."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_superuser(email="admin@example.com", password="password123")
+        users = User.objects.bulk_create([
+            User(email=f"admin-list{i}@example.com", first_name="List", last_name=str(i), password="!") for i in range(20)
+        ])
+        chats = Chat.objects.bulk_create([Chat(name=f"admin-{i}", is_group=i % 2 == 0) for i in range(10)])
+        ChatMember.objects.bulk_create([
+            ChatMember(chat=chat, user=user) for chat in chats for user in users[:5]
+        ])
+        Message.objects.bulk_create([
+            Message(chat=chats[i % 10], sender=users[i % 20], content=f"message {i}") for i in range(200)
+        ])
+
+    def setUp(self):
+        self.client.force_login(self.admin)
+
+    def test_message_changelist(self):
+        # Session, user, capped count, page, and the date hierarchy's MIN/MAX
+        # twice (start level, then choices).
+        with self.assertBudget("message changelist", queries=6, seconds=0.5) as captured:
+            response = self.client.get("/admin/chat/message/")
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, "200 messages")
+        self.assertFalse(any("COUNT(*)" in q["sql"] and "LIMIT" not in q["sql"] for q in captured.captured_queries))
+        self.assertFalse(any("DISTINCT" in q["sql"] for q in captured.captured_queries))
+
+    def test_message_date_hierarchy_drilldown(self):
+        today = timezone.localdate()
+        with self.assertBudget("message changelist by month", queries=6, seconds=0.5) as captured:
+            response = self.client.get(
+                "/admin/chat/message/", {"created_at__year": today.year, "created_at__month": today.month}
+            )
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, f"created_at__day={today.day}")
+        self.assertFalse(any("DISTINCT" in q["sql"] for q in captured.captured_queries))
+
+    def test_user_autocomplete(self):
+        params = {"app_label": "chat", "model_name": "message", "field_name": "sender"}
+        # The first search of a process looks up whether the FTS mirror exists.
+        self.client.get("/admin/autocomplete/", {"term": "warm", **params})
+
+        # Session, user, capped count and page: no LIKE '%term%' over every column.
+        with self.assertBudget("user autocomplete", queries=4, seconds=0.5) as captured:
+            response = self.client.get("/admin/autocomplete/", {"term": "admin-list1", **params})
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(any(result["text"].startswith("admin-list1@") for result in response.json()["results"]))
+        self.assertFalse(any("LIKE '%" in q["sql"] for q in captured.captured_queries))
+
+    def test_chat_member_changelist(self):
+        with self.assertBudget("chat member changelist", queries=5, seconds=0.5):
+            response = self.client.get("/admin/chat/chatmember/")
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, "50 chat members")
+
+    def test_message_change_form(self):
+        message = Message.objects.first()
+        # The autocomplete widgets load only the selected chat and sender.
+        with self.assertBudget("message change form", queries=6, seconds=0.5):
+            response = self.client.get(f"/admin/chat/message/{message.pk}/change/")
+        self.assertEqual(response.status_code, 200)
+        self.assertNotContains(response, "admin-list19@example.com")
+
+
+@override_settings(MESSAGE_ARCHIVE_ENABLED=True, MESSAGE_ARCHIVE_AFTER_DAYS=30)
+class MessageArchiveTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(email="archive@example.com", password="password123")
+        cls.chat = Chat.objects.create(name="archive", is_group=True)
+        now = timezone.now()
+        cls.messages = Message.objects.bulk_create([
+            Message(chat=cls.chat, sender=cls.user, content=f"message {i}", created_at=now - timedelta(days=60 - i, hours=12))
+            for i in range(60)
+        ])
+        # Replied to by a recent message: stays hot although old.
+        Message.objects.create(chat=cls.chat, sender=cls.user, content="reply", reply_to=cls.messages[0])
+
+    def test_archive_and_read_through(self):
+        self.assertEqual(archive_messages(batch_size=7), 30)
+        self.assertEqual(ArchivedMessage.objects.count(), 30)
+        self.assertTrue(Message.objects.filter(pk=self.messages[0].pk).exists())
+
+        expected = ["reply"] + [f"message {i}" for i in range(59, -1, -1)]
+        contents, before = [], None
+        while True:
+            page, before = fetch_history(self.chat.id, before=before, limit=13)
+            contents += [row["content"] for row in page]
+            if before is None:
+                break
+        self.assertEqual(contents, expected)
+
+    def test_recent_pages_skip_the_archive(self):
+        archive_messages()
+        with self.assertNumQueries(1):
+            page, _ = fetch_history(self.chat.id, limit=10)
+        self.assertEqual(page[0]["content"], "reply")
+
+    def test_pages_before_the_archive_skip_it(self):
+        short = Chat.objects.create(name="short", is_group=True)
+        Message.objects.create(chat=short, sender=self.user, content="only")
+        archive_messages()
+        self.chat.refresh_from_db()
+        self.assertEqual(self.chat.first_archived_at, self.messages[1].created_at)
+
+        # Nothing of this chat was ever archived.
+        with self.assertNumQueries(1):
+            page, _ = fetch_history(short.id, limit=10)
+        self.assertEqual([row["content"] for row in page], ["only"])
+
+        # Past everything archived, onto the hot message kept by its reply.
+        cursor = encode_cursor(self.messages[1].created_at - timedelta(microseconds=1), self.messages[1].id)
+        with self.assertNumQueries(1):
+            page, next_cursor = fetch_history(self.chat.id, before=cursor, limit=10)
+        self.assertEqual([row["content"] for row in page], ["message 0"])
+        self.assertIsNone(next_cursor)
+
+    def test_references_made_after_selection_keep_the_message(self):
+        old, replied = self.messages[2], self.messages[3]
+        reply = Message.objects.create(chat=self.chat, sender=self.user, content="late reply", reply_to=replied)
+
+        self.assertEqual(_delete_archivable([old.id, replied.id], archive_horizon()), {old.id})
+        reply.refresh_from_db()
+        self.assertEqual(reply.reply_to_id, replied.id)
+
+
+class InboxTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(email="inbox@example.com", password="password123")
+        cls.chat = Chat.objects.create(name="media", is_group=True)
+        cls.empty = Chat.objects.create(name="empty", is_group=True)
+        ChatMember.objects.bulk_create([ChatMember(chat=cls.chat, user=cls.user), ChatMember(chat=cls.empty, user=cls.user)])
+        photo = Message.objects.create(chat=cls.chat, sender=cls.user, type=Message.MessageType.PHOTO, content=None)
+        update_last_message([photo])
+
+    def test_media_message_without_content(self):
+        self.client.defaults["HTTP_AUTHORIZATION"] = f"Bearer {UserRefreshToken.for_user(self.user).access_token}"
+        response = self.client.get("/api/chats/")
+        self.assertEqual(response.status_code, 200)
+        chats = response.json()["Result"]["chats"]
+        self.assertEqual([chat["name"] for chat in chats], ["media", "empty"])
+        self.assertEqual(chats[0]["last_message"]["preview"], "")
+
+    def test_new_chat_is_active_from_creation(self):
+        self.assertEqual(self.empty.last_activity_at, self.empty.created_at)
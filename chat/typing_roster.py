@@ -0,0 +1,201 @@
+import asyncio
+import time
+from uuid import UUID
+
+import redis.asyncio as redis
+from channels.layers import get_channel_layer
+from django.conf import settings
+
+from chat.binary_clients import binary_clients
+from chat.utils import frame_event
+from myproject.metrics import channel_layer_sends
+
+from loguru import logger
+
+
+# KEYS: typists zset (score = expiry), names hash, last broadcast roster
+# ARGV: now, ttl of the last roster key in seconds
+# Returns {changed, id1, name1, ...}. The compare-and-set makes exactly one
+# worker report each change, no matter how many of them tick the same chat.
+TICK_SCRIPT = """
+redis.call('ZREMRANGEBYSCORE', KEYS[1], '-inf', ARGV[1])
+local typists = redis.call('ZRANGE', KEYS[1], 0, -1)
+table.sort(typists)
+
+local changed = 0
+local signature = table.concat(typists, ',')
+if signature ~= (redis.call('GET', KEYS[3]) or '') then
+    redis.call('SET', KEYS[3], signature, 'EX', tonumber(ARGV[2]))
+    changed = 1
+end
+
+local result = {changed}
+if #typists > 0 then
+    local names = redis.call('HMGET', KEYS[2], unpack(typists))
+    for i, user_id in ipairs(typists) do
+        table.insert(result, user_id)
+        table.insert(result, names[i] or '')
+    end
+end
+return result
+"""
+
+
+class RedisTypingBackend:
+    def __init__(self, url):
+        self.client = redis.Redis.from_url(url, decode_responses=True)
+        self.tick_script = self.client.register_script(TICK_SCRIPT)
+
+    @staticmethod
+    def keys(chat_id):
+        return [f"typing:{chat_id}", f"typing:names:{chat_id}", f"typing:last:{chat_id}"]
+
+    async def start(self, chat_id, user_id, username, expires_at):
+        typists, names, _ = self.keys(chat_id)
+        async with self.client.pipeline(transaction=True) as pipe:
+            pipe.zadd(typists, {user_id: expires_at})
+            pipe.hset(names, user_id, username)
+            pipe.expire(typists, 3600)
+            pipe.expire(names, 3600)
+            await pipe.execute()
+
+    async def stop(self, chat_id, user_id):
+        await self.client.zrem(self.keys(chat_id)[0], user_id)
+
+    async def tick(self, chat_id, now):
+        result = await self.tick_script(keys=self.keys(chat_id), args=[now, 3600])
+        pairs = result[1:]
+        return bool(result[0]), list(zip(pairs[0::2], pairs[1::2]))
+
+
+class MemoryTypingBackend:
+    """Per-process typing state for development and tests."""
+
+    def __init__(self):
+        self.typists = {}
+        self.last = {}
+
+    async def start(self, chat_id, user_id, username, expires_at):
+        self.typists.setdefault(chat_id, {})[user_id] = (username, expires_at)
+
+    async def stop(self, chat_id, user_id):
+        self.typists.get(chat_id, {}).pop(user_id, None)
+
+    async def tick(self, chat_id, now):
+        typists = self.typists.get(chat_id, {})
+        for user_id, (_, expires_at) in list(typists.items()):
+            if expires_at <= now:
+                del typists[user_id]
+
+        roster = sorted((user_id, username) for user_id, (username, _) in typists.items())
+        signature = ",".join(user_id for user_id, _ in roster)
+        changed = signature != self.last.get(chat_id, "")
+
+        self.last[chat_id] = signature
+        if not typists:
+            self.typists.pop(chat_id, None)
+        return changed, roster
+
+
+class TypingAggregator:
+    """
+    Per-chat "who is typing" roster.
+
+    Typing frames only refresh a typist's expiry; every ``tick`` seconds the
+    roster of each chat this worker has seen typing in is evaluated, and one
+    ``typing_roster`` frame is sent to the chat group only if its membership
+    changed. Typists drop out ``ttl`` seconds after their last typing frame,
+    so clients never need to send ``is_typing: false`` (though it is honoured).
+    """
+
+    def __init__(self, backend, ttl=5, tick=0.5):
+        self.backend = backend
+        self.ttl = ttl
+        self.tick = tick
+        self._refreshed = {}
+        self._chats = set()
+        self._ticker = None
+
+    async def update(self, chat_id, user_id, username, is_typing):
+        chat_id, user_id = str(chat_id), str(user_id)
+        now = time.time()
+
+        if is_typing:
+            # Keystrokes arrive far more often than the expiry needs refreshing.
+            if now - self._refreshed.get((chat_id, user_id), 0) < self.ttl / 3:
+                return
+            self._refreshed[(chat_id, user_id)] = now
+            if not await self._call(self.backend.start(chat_id, user_id, username, now + self.ttl)):
+                # Let the next keystroke try again.
+                self._refreshed.pop((chat_id, user_id), None)
+                return
+        else:
+            self._refreshed.pop((chat_id, user_id), None)
+            if not await self._call(self.backend.stop(chat_id, user_id)):
+                return
+
+        self._chats.add(chat_id)
+        self._ensure_ticker()
+
+    async def _call(self, operation):
+        # Typing indicators are best effort; a Redis hiccup must not fail the socket.
+        try:
+            await operation
+        except redis.RedisError as e:
+            logger.warning(f"Typing backend unavailable: {str(e)}")
+            return False
+        return True
+
+    def _ensure_ticker(self):
+        if self._ticker is None or self._ticker.done():
+            self._ticker = asyncio.ensure_future(self._tick_forever())
+
+    async def _tick_forever(self):
+        while self._chats:
+            await asyncio.sleep(self.tick)
+            try:
+                await self._tick_once()
+            except Exception as e:
+                logger.error(f"Typing roster tick failed: {str(e)}")
+
+    async def _tick_once(self):
+        now = time.time()
+        channel_layer = get_channel_layer()
+
+        for chat_id in list(self._chats):
+            changed, roster = await self.backend.tick(chat_id, now)
+
+            if not roster:
+                # Nobody left typing; stop ticking this chat until the next frame.
+                self._chats.discard(chat_id)
+                for key in [key for key in self._refreshed if key[0] == chat_id]:
+                    del self._refreshed[key]
+
+            if changed and channel_layer is not None:
+                group = f"chat_{chat_id}"
+                binary = await binary_clients.any(group)
+                with channel_layer_sends.time(method="group_send", source="typing"):
+                    await channel_layer.group_send(
+                        group,
+                        frame_event({
+                            "type": "typing_roster",
+                            "chat_id": UUID(chat_id),
+                            "users": [
+                                {"user_id": UUID(user_id), "username": username}
+                                for user_id, username in roster
+                            ],
+                        }, binary=binary),
+                    )
+
+
+def get_backend():
+    if settings.TYPING_BACKEND == "memory":
+        return MemoryTypingBackend()
+    return RedisTypingBackend(settings.TYPING_REDIS_URL)
+
+
+typing_aggregator = TypingAggregator(
+    get_backend(),
+    ttl=settings.TYPING_TTL,
+    tick=settings.TYPING_TICK,
+)
@@ -0,0 +1,96 @@
+from datetime import datetime, timezone as dt_timezone
+
+from django.db.models import Count, F, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+from chat.models import ChatMember, Message
+
+
+EPOCH = datetime(1970, 1, 1, tzinfo=dt_timezone.utc)
+
+
+def unread_expression(**message_filter):
+    """
+    Number of messages in a member's chat newer than their read watermark and
+    not sent by them, as an expression over ``ChatMember`` rows. The count is
+    a range scan of ``msg_chat_live_history_idx`` starting at the watermark.
+    """
+    messages = (
+        Message.objects
+        .filter(
+            chat_id=OuterRef("chat_id"),
+            deleted_at__isnull=True,
+            created_at__gt=Coalesce(OuterRef("last_read_at"), Value(EPOCH)),
+            **message_filter,
+        )
+        .exclude(sender_id=OuterRef("user_id"))
+        .order_by()
+        .values("chat_id")
+        .annotate(count=Count("id"))
+        .values("count")
+    )
+    return Coalesce(Subquery(messages), Value(0))
+
+
+def increment_unread(messages):
+    """
+    Add freshly persisted ``messages`` to their chats' unread counters in one
+    UPDATE. Each member only counts the messages that are newer than their
+    read watermark and were not sent by them, so a read that lands before the
+    increment is not undone by it.
+
+    Call it in the transaction that inserts the messages: once they are
+    committed, ``reset_unread`` may recount them, and a later increment
+    would count them twice.
+    """
+    if not messages:
+        return 0
+    return ChatMember.objects.filter(
+        chat_id__in={message.chat_id for message in messages}
+    ).update(
+        unread_count=F("unread_count") + unread_expression(id__in=[message.id for message in messages])
+    )
+
+
+def reset_unread(member_ids):
+    """Recount unread messages after the members' (just advanced) read watermarks."""
+    if not member_ids:
+        return 0
+    return ChatMember.objects.filter(pk__in=member_ids).update(unread_count=unread_expression())
+
+
+def repair_unread(batch_size=1000):
+    """
+    Recompute every counter from the messages table and fix the ones that
+    drifted. Returns the number of members corrected.
+    """
+    repaired = 0
+    last_pk = None
+    while True:
+        members = ChatMember.objects.order_by("pk")
+        if last_pk is not None:
+            members = members.filter(pk__gt=last_pk)
+        batch = list(
+            members.annotate(expected=unread_expression()).values_list("pk", "unread_count", "expected")[:batch_size]
+        )
+        if not batch:
+            return repaired
+
+        last_pk = batch[-1][0]
+        drifted = [pk for pk, unread_count, expected in batch if unread_count != expected]
+        if drifted:
+            repaired += reset_unread(drifted)
+
+
+def unread_counts(user_id):
+    """
+    ``{chat_id: unread}`` for every chat of the user with unread messages,
+    read straight from the counters. ``unread_count`` is deliberately not
+    indexed (it changes on every message); the user_id index bounds the scan.
+    """
+    return {
+        str(chat_id): unread_count
+        for chat_id, unread_count in ChatMember.objects.filter(
+            user_id=user_id, unread_count__gt=0
+        ).order_by().values_list("chat_id", "unread_count")
+    }
@@ -0,0 +1,8 @@
+from django.urls import path
+from . import views
+
+urlpatterns = [
+    path('', views.InboxView.as_view(), name='inbox'),
+    path('unread/', views.UnreadCountsView.as_view(), name='unread_counts'),
+    path('<uuid:chat_id>/messages/', views.MessageHistoryView.as_view(), name='message_history'),
+]
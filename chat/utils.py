@@ -1,16 +1,96 @@
-import time
-from django.core.cache import cache
+import json
+from datetime import datetime
 from functools import wraps
+from uuid import UUID
 
-def rate_limit(key_prefix: str, limit_seconds: int):
+import msgpack
+from django.core.exceptions import ImproperlyConfigured
+
+from chat.ratelimit import SlidingWindow, make_key, rate_limiter
+
+
+# Clients that offer this websocket subprotocol exchange MessagePack binary
+# frames instead of JSON text. Outgoing frames carry the same values as JSON
+# ones (UUIDs and datetimes as strings), however they were produced; clients
+# may send UUIDs as ext type ``UUID_EXT_TYPE`` (16 raw bytes).
+MSGPACK_SUBPROTOCOL = "msgpack"
+UUID_EXT_TYPE = 1
+
+
+def _json_default(obj):
+    if isinstance(obj, UUID):
+        return str(obj)
+    if isinstance(obj, datetime):
+        return obj.isoformat()
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+
+def _msgpack_ext_hook(code, data):
+    if code == UUID_EXT_TYPE:
+        return UUID(bytes=data)
+    return msgpack.ExtType(code, data)
+
+
+def encode_frame(payload):
+    """Encode an outgoing websocket text frame. UUIDs and datetimes become strings."""
+    return json.dumps(payload, separators=(",", ":"), default=_json_default)
+
+
+def encode_binary_frame(payload):
+    """
+    Encode an outgoing websocket frame for ``MSGPACK_SUBPROTOCOL`` clients,
+    with the values ``encode_frame`` would give: encoding ``payload`` or
+    the decoded text frame of it gives the same bytes.
+    """
+    return msgpack.packb(payload, default=_json_default)
+
+
+def decode_binary_frame(data):
+    return msgpack.unpackb(data, ext_hook=_msgpack_ext_hook, timestamp=3)
+
+
+def frame_event(payload, binary=True):
+    """
+    Channel layer event carrying ``payload`` encoded once for each protocol,
+    for fan-out to chat consumers, which forward whichever their client speaks.
+    Pass ``binary=False`` when the group has no ``MSGPACK_SUBPROTOCOL``
+    client (see ``chat.binary_clients``) to skip the MessagePack encoding.
+    """
+    event = {"type": "frame_event", "text": encode_frame(payload)}
+    if binary:
+        event["bytes"] = encode_binary_frame(payload)
+    return event
+
+
+def parse_uuid(value):
+    """``UUID`` from a client supplied value: a string in JSON frames, ext type in binary ones."""
+    return value if isinstance(value, UUID) else UUID(value)
+
+
+def rate_limit(key_prefix: str, limit_seconds: int = None, policy=None, scope=("user",)):
     """
-    Decorator to rate limit a method per user.
+    Decorator to rate limit a consumer method.
+
+    Without an explicit ``policy`` the method may run once per
+    ``limit_seconds``; one of the two is required. ``scope`` picks what the
+    limit is keyed on besides the event type: "user", "chat" or both.
 
     Usage:
       @rate_limit("typing_event", 2)
       async def handle_typing(self, ...):
           ...
+
+      @rate_limit("chat_message", policy=TokenBucket(rate=5, capacity=20), scope=("user", "chat"))
+      async def handle_chat_message(self, ...):
+          ...
     """
+    if policy is None:
+        if not limit_seconds or limit_seconds <= 0:
+            raise ImproperlyConfigured(
+                f"rate_limit({key_prefix!r}) needs a policy or a positive limit_seconds, got {limit_seconds!r}."
+            )
+        policy = SlidingWindow(limit=1, window=limit_seconds)
+
     def decorator(func):
         @wraps(func)
         async def wrapper(self, *args, **kwargs):
@@ -18,14 +98,15 @@ def rate_limit(key_prefix: str, limit_seconds: int):
             if not user_id:
                 return await func(self, *args, **kwargs)
 
-            cache_key = f"{key_prefix}:{user_id}"
-            last_time = cache.get(cache_key)
-            now = time.time()
-
-            if last_time and now - last_time < limit_seconds:
+            key = make_key(
+                key_prefix,
+                user_id=user_id if "user" in scope else None,
+                chat_id=getattr(self, "chat_id", None) if "chat" in scope else None,
+            )
+            decision = await rate_limiter.hit(key, policy)
+            if not decision.allowed:
                 return
 
-            cache.set(cache_key, now, timeout=limit_seconds)
             return await func(self, *args, **kwargs)
         return wrapper
     return decorator
@@ -1,3 +1,169 @@
-from django.shortcuts import render
+from rest_framework import status
+from rest_framework.permissions import IsAuthenticated
+from rest_framework.views import APIView
+from rest_framework_simplejwt.authentication import JWTAuthentication
 
-# Create your views here.
+from drf_yasg.utils import swagger_auto_schema
+from drf_yasg import openapi
+
+from myproject.responses import api_response
+
+from chat.history import InvalidCursor, clamp_page_size, fetch_history
+from chat.inbox import fetch_inbox
+from chat.membership import membership_cache
+from chat.unread import unread_counts
+
+from loguru import logger
+
+
+class InboxView(APIView):
+    permission_classes = [IsAuthenticated]
+    authentication_classes = [JWTAuthentication]
+
+    @swagger_auto_schema(
+        operation_description=(
+            "Get the user's chats, most recently active first, with the last "
+            "message preview, unread count and, for private chats, the other "
+            "participant. Pass the returned 'next_cursor' as 'before' for the next page."
+        ),
+        manual_parameters=[
+            openapi.Parameter(
+                'before', openapi.IN_QUERY,
+                description="Cursor returned by the previous page",
+                type=openapi.TYPE_STRING
+            ),
+            openapi.Parameter(
+                'limit', openapi.IN_QUERY,
+                description="Page size (1-100, default 50)",
+                type=openapi.TYPE_INTEGER
+            ),
+        ],
+        responses={
+            200: openapi.Response(description="Chats retrieved successfully."),
+            400: openapi.Response(description="Invalid cursor"),
+            500: openapi.Response(description="Internal server error"),
+        },
+        tags=["Chat"],
+    )
+    def get(self, request):
+        try:
+            chats, next_cursor = fetch_inbox(
+                request.user.id,
+                before=request.query_params.get("before"),
+                limit=clamp_page_size(request.query_params.get("limit")),
+            )
+            return api_response(
+                is_success=True,
+                status_code=status.HTTP_200_OK,
+                result={
+                    "chats": chats,
+                    "next_cursor": next_cursor,
+                }
+            )
+        except InvalidCursor as e:
+            return api_response(
+                is_success=False,
+                error_message=str(e),
+                status_code=status.HTTP_400_BAD_REQUEST,
+            )
+        except Exception as e:
+            logger.error(f"Error in InboxView: {str(e)}")
+            return api_response(
+                is_success=False,
+                error_message="Internal Server Error",
+                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            )
+
+
+class MessageHistoryView(APIView):
+    permission_classes = [IsAuthenticated]
+    authentication_classes = [JWTAuthentication]
+
+    @swagger_auto_schema(
+        operation_description=(
+            "Get a page of chat messages, newest first. Pass the returned "
+            "'next_cursor' as 'before' to load older messages."
+        ),
+        manual_parameters=[
+            openapi.Parameter(
+                'before', openapi.IN_QUERY,
+                description="Cursor returned by the previous page",
+                type=openapi.TYPE_STRING
+            ),
+            openapi.Parameter(
+                'limit', openapi.IN_QUERY,
+                description="Page size (1-100, default 50)",
+                type=openapi.TYPE_INTEGER
+            ),
+        ],
+        responses={
+            200: openapi.Response(description="Messages retrieved successfully."),
+            400: openapi.Response(description="Invalid cursor"),
+            404: openapi.Response(description="Chat not found"),
+            500: openapi.Response(description="Internal server error"),
+        },
+        tags=["Chat"],
+    )
+    def get(self, request, chat_id):
+        try:
+            if not membership_cache.is_member_sync(chat_id, request.user.id):
+                return api_response(
+                    is_success=False,
+                    error_message="Chat not found.",
+                    status_code=status.HTTP_404_NOT_FOUND,
+                )
+
+            messages, next_cursor = fetch_history(
+                chat_id,
+                before=request.query_params.get("before"),
+                limit=clamp_page_size(request.query_params.get("limit")),
+            )
+            return api_response(
+                is_success=True,
+                status_code=status.HTTP_200_OK,
+                result={
+                    "messages": messages,
+                    "next_cursor": next_cursor,
+                }
+            )
+        except InvalidCursor as e:
+            return api_response(
+                is_success=False,
+                error_message=str(e),
+                status_code=status.HTTP_400_BAD_REQUEST,
+            )
+        except Exception as e:
+            logger.error(f"Error in MessageHistoryView: {str(e)}")
+            return api_response(
+                is_success=False,
+                error_message="Internal Server Error",
+                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            )
+
+
+class UnreadCountsView(APIView):
+    permission_classes = [IsAuthenticated]
+    authentication_classes = [JWTAuthentication]
+
+    @swagger_auto_schema(
+        operation_description="Get the unread message count of every chat with unread messages.",
+        responses={
+            200: openapi.Response(description="Unread counts retrieved successfully."),
+            500: openapi.Response(description="Internal server error"),
+        },
+        tags=["Chat"],
+    )
+    def get(self, request):
+        try:
+            return api_response(
+                is_success=True,
+                status_code=status.HTTP_200_OK,
+                result={"unread": unread_counts(request.user.id)},
+            )
+        except Exception as e:
+            logger.error(f"Error in UnreadCountsView: {str(e)}")
+            return api_response(
+                is_success=False,
+                error_message="Internal Server Error",
+                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            )
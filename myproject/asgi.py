@@ -11,18 +11,26 @@ import os
 
 from django.core.asgi import get_asgi_application
 from channels.routing import ProtocolTypeRouter, URLRouter
-from channels.auth import AuthMiddlewareStack
-import chat.routing
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'myproject.settings')
 
 django_asgi_app = get_asgi_application()
 
+from myproject.lifespan import install_reactor_shutdown, lifespan  # noqa: E402
+from myproject.profiling import QueryProfilingMiddleware  # noqa: E402
+from users.middleware import JWTAuthMiddlewareStack  # noqa: E402
+import chat.routing  # noqa: E402
+
 application = ProtocolTypeRouter({
     "http": django_asgi_app,
-    "websocket": AuthMiddlewareStack(
-        URLRouter(
-            chat.routing.websocket_urlpatterns
+    "lifespan": lifespan,
+    "websocket": QueryProfilingMiddleware(
+        JWTAuthMiddlewareStack(
+            URLRouter(
+                chat.routing.websocket_urlpatterns
+            )
         )
     )
 })
+
+install_reactor_shutdown()
@@ -0,0 +1,46 @@
+import asyncio
+import sys
+
+from loguru import logger
+
+
+async def shutdown():
+    """Flush the in-process buffers that would otherwise only get the best-effort atexit flush."""
+    from chat.persistence import message_write_behind
+
+    try:
+        await message_write_behind.shutdown()
+    except Exception as e:
+        logger.error(f"Write-behind flush at shutdown failed: {str(e)}")
+
+
+async def lifespan(scope, receive, send):
+    """ASGI lifespan protocol, for servers that speak it (uvicorn, hypercorn)."""
+    while True:
+        message = await receive()
+        if message["type"] == "lifespan.startup":
+            await send({"type": "lifespan.startup.complete"})
+        elif message["type"] == "lifespan.shutdown":
+            await shutdown()
+            await send({"type": "lifespan.shutdown.complete"})
+            return
+
+
+def install_reactor_shutdown():
+    """
+    Daphne does not speak the lifespan protocol; run ``shutdown`` as a
+    "before shutdown" trigger of its asyncio reactor instead, the last phase
+    in which the event loop still runs. Daphne cancels the open connections
+    in the same phase; anything they queue after the flush is left to the
+    exit-time ``flush_sync``.
+    """
+    reactor = sys.modules.get("twisted.internet.reactor")
+    loop = getattr(reactor, "_asyncioEventloop", None)
+    if loop is None:
+        return
+
+    from twisted.internet import defer
+
+    reactor.addSystemEventTrigger(
+        "before", "shutdown", lambda: defer.Deferred.fromFuture(asyncio.ensure_future(shutdown(), loop=loop))
+    )
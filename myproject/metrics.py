@@ -0,0 +1,240 @@
+import functools
+import hmac
+import os
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+
+from asgiref.sync import iscoroutinefunction
+from django.conf import settings
+from django.http import HttpResponse, HttpResponseForbidden
+from django.utils.decorators import sync_and_async_middleware
+
+# Upper bounds in seconds; tuned for websocket handlers and queries.
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names, values, extra=()):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    pairs.extend(f'{name}="{_escape(value)}"' for name, value in extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class Metric:
+    type = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels):
+        return tuple(labels.get(name, "") for name in self.labelnames)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.type}"]
+        lines.extend(self._samples())
+        return lines
+
+    def _samples(self):
+        with self._lock:
+            values = list(self._values.items())
+        return [f"{self.name}{_format_labels(self.labelnames, key)} {value}" for key, value in values]
+
+
+class Counter(Metric):
+    type = "counter"
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+
+class Gauge(Metric):
+    type = "gauge"
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+    def set(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+
+class Histogram(Metric):
+    """
+    Fixed-bucket histogram. ``observe`` is a bisect and three additions under
+    an uncontended lock; cumulative counts are only computed when scraped.
+    """
+
+    type = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._values.get(key)
+            if series is None:
+                # Per-bucket counts (the last one is +Inf), then the sum.
+                series = self._values[key] = [0] * (len(self.buckets) + 1) + [0.0]
+            series[index] += 1
+            series[-1] += value
+
+    @contextmanager
+    def time(self, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def track(self, **labels):
+        """Decorator timing every call of a sync or async function."""
+        def decorator(func):
+            if iscoroutinefunction(func):
+                @functools.wraps(func)
+                async def wrapper(*args, **kwargs):
+                    with self.time(**labels):
+                        return await func(*args, **kwargs)
+            else:
+                @functools.wraps(func)
+                def wrapper(*args, **kwargs):
+                    with self.time(**labels):
+                        return func(*args, **kwargs)
+            return wrapper
+        return decorator
+
+    def _samples(self):
+        with self._lock:
+            values = [(key, list(series)) for key, series in self._values.items()]
+
+        lines = []
+        for key, series in values:
+            cumulative = 0
+            for bound, count in zip(self.buckets + ("+Inf",), series):
+                cumulative += count
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, [('le', bound)])} {cumulative}")
+            labels = _format_labels(self.labelnames, key)
+            lines.append(f"{self.name}_sum{labels} {series[-1]}")
+            lines.append(f"{self.name}_count{labels} {cumulative}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self.metrics = []
+        self.collectors = []
+
+    def register(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def counter(self, *args, **kwargs):
+        return self.register(Counter(*args, **kwargs))
+
+    def gauge(self, *args, **kwargs):
+        return self.register(Gauge(*args, **kwargs))
+
+    def histogram(self, *args, **kwargs):
+        return self.register(Histogram(*args, **kwargs))
+
+    def collector(self, func):
+        """Register ``func`` to refresh gauges from other state right before a scrape."""
+        self.collectors.append(func)
+        return func
+
+    def render(self):
+        for collect in self.collectors:
+            collect()
+        lines = []
+        for metric in self.metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+# Metrics are per process: with several workers, scrape each one (the
+# ``worker`` label on active connections tells them apart).
+registry = Registry()
+WORKER = f"{os.uname().nodename}:{os.getpid()}" if hasattr(os, "uname") else str(os.getpid())
+
+websocket_connections = registry.gauge(
+    "websocket_active_connections", "Open websocket connections in this worker.", ["consumer", "worker"]
+)
+websocket_events = registry.histogram(
+    "websocket_event_seconds", "Time spent handling websocket events.", ["consumer", "event"]
+)
+database_calls = registry.histogram(
+    "database_call_seconds", "Time spent in database_sync_to_async calls, thread hop included.", ["call"]
+)
+channel_layer_sends = registry.histogram(
+    "channel_layer_send_seconds", "Time spent in channel layer send/group_send.", ["method", "source"]
+)
+http_requests = registry.histogram(
+    "http_request_seconds", "HTTP request latency by view.", ["view", "method", "status"]
+)
+membership_cache_lookups = registry.counter(
+    "chat_membership_cache_lookups_total", "Chat membership cache lookups.", ["result"]
+)
+
+
+def _observe_request(request, response, start):
+    match = request.resolver_match
+    http_requests.observe(
+        time.perf_counter() - start,
+        view=match.view_name if match else "unmatched",
+        method=request.method,
+        status=response.status_code,
+    )
+
+
+@sync_and_async_middleware
+def metrics_middleware(get_response):
+    """Times every HTTP request, labelled by URL name rather than path to keep series bounded."""
+    if iscoroutinefunction(get_response):
+        async def middleware(request):
+            start = time.perf_counter()
+            response = await get_response(request)
+            _observe_request(request, response, start)
+            return response
+    else:
+        def middleware(request):
+            start = time.perf_counter()
+            response = get_response(request)
+            _observe_request(request, response, start)
+            return response
+    return middleware
+
+
+def metrics_view(request):
+    """
+    Prometheus text exposition of this worker's metrics, for scrapers sending
+    ``METRICS_TOKEN`` as a bearer token. Without a token configured it is
+    only served with ``DEBUG`` on.
+    """
+    token = settings.METRICS_TOKEN
+    if not token:
+        if not settings.DEBUG:
+            return HttpResponseForbidden()
+    elif not hmac.compare_digest(request.headers.get("Authorization", "").encode(), f"Bearer {token}".encode()):
+        return HttpResponseForbidden()
+    return HttpResponse(registry.render(), content_type=CONTENT_TYPE)
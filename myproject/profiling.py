@@ -0,0 +1,224 @@
+import contextvars
+import os
+import random
+import re
+import time
+import traceback
+from collections import Counter, defaultdict
+from contextlib import contextmanager
+
+from asgiref.sync import iscoroutinefunction
+from channels.middleware import BaseMiddleware
+from django.conf import settings
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.utils.decorators import sync_and_async_middleware
+
+from myproject.metrics import registry
+
+from loguru import logger
+
+
+# Stacks kept per query shape; the first few calls are enough to find the loop.
+STACKS_PER_FINGERPRINT = 3
+
+_IN_LIST = re.compile(r"\bIN \((?:%s, )*%s\)")
+_STRING = re.compile(r"'(?:[^']|'')*'")
+_NUMBER = re.compile(r"\b\d+(?:\.\d+)?\b")
+
+profiled_queries = registry.histogram(
+    "profiled_queries",
+    "Queries per profiled HTTP request or websocket event.",
+    ["protocol", "handler"],
+    buckets=(0, 1, 2, 3, 5, 10, 20, 50, 100, 250),
+)
+repeated_queries = registry.counter(
+    "profiled_repeated_queries_total",
+    "Query shapes run QUERY_PROFILE_REPEAT_THRESHOLD times or more (likely N+1).",
+    ["protocol", "handler"],
+)
+
+_current = contextvars.ContextVar("query_profile", default=None)
+
+
+def fingerprint(sql):
+    """``sql`` with literals and ``IN`` lists collapsed, so repeats of one query shape compare equal."""
+    sql = _IN_LIST.sub("IN (...)", sql)
+    return _NUMBER.sub("?", _STRING.sub("?", sql))
+
+
+def _project_frames(limit=3):
+    """The innermost ``limit`` frames of project code on the current stack."""
+    prefix = os.path.join(str(settings.BASE_DIR), "")
+    frames = []
+    for frame, lineno in traceback.walk_stack(None):
+        filename = frame.f_code.co_filename
+        if filename.startswith(prefix) and filename != __file__ and "site-packages" not in filename:
+            frames.append(f"{os.path.relpath(filename, prefix)}:{lineno} in {frame.f_code.co_name}")
+            if len(frames) == limit:
+                break
+    return " <- ".join(frames) or "(no project frame)"
+
+
+class QueryProfile:
+    """Queries run while a sampled HTTP request or websocket event is handled."""
+
+    def __init__(self, protocol, handler=""):
+        self.protocol = protocol
+        self.handler = handler
+        self.count = 0
+        self.db_time = 0.0
+        self.fingerprints = Counter()
+        self.locations = defaultdict(Counter)
+
+    def record(self, sql, duration):
+        shape = fingerprint(sql)
+        self.count += 1
+        self.db_time += duration
+        self.fingerprints[shape] += 1
+        if self.fingerprints[shape] <= STACKS_PER_FINGERPRINT:
+            self.locations[shape][_project_frames()] += 1
+
+    def repeated(self, threshold):
+        return [(shape, count) for shape, count in self.fingerprints.most_common() if count >= threshold]
+
+    def finish(self, where=""):
+        """
+        Record the profile and log it if it went over one of the thresholds,
+        listing each repeated query shape with where it was issued from.
+        Returns whether it was reported.
+        """
+        profiled_queries.observe(self.count, protocol=self.protocol, handler=self.handler)
+        repeated = self.repeated(settings.QUERY_PROFILE_REPEAT_THRESHOLD)
+        db_ms = self.db_time * 1000
+        if not repeated and self.count <= settings.QUERY_PROFILE_MAX_QUERIES and db_ms <= settings.QUERY_PROFILE_MAX_DB_MS:
+            return False
+
+        label = " ".join(part for part in (self.protocol, self.handler, where) if part)
+        logger.warning(
+            f"{label}: {self.count} queries, "
+            f"{len(self.fingerprints)} distinct, {db_ms:.1f}ms in the database."
+        )
+        for shape, count in repeated:
+            repeated_queries.inc(protocol=self.protocol, handler=self.handler)
+            locations = "\n".join(f"    at {location}" for location in self.locations[shape])
+            logger.warning(f"Possible N+1: {count}x {shape}\n{locations}")
+        return True
+
+
+class _Session:
+    """Mutable slot for the active profile, shared with the threads and tasks that inherit the context."""
+
+    def __init__(self, profile=None):
+        self.profile = profile
+
+
+@contextmanager
+def profile_queries(protocol, handler=""):
+    """Profile the queries run in this block, including from ``sync_to_async`` threads it awaits."""
+    profile = QueryProfile(protocol, handler)
+    token = _current.set(_Session(profile))
+    try:
+        yield profile
+    finally:
+        _current.reset(token)
+
+
+def _execute_hook(execute, sql, params, many, context):
+    session = _current.get()
+    profile = session.profile if session is not None else None
+    if profile is None:
+        return execute(sql, params, many, context)
+
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        profile.record(sql, time.perf_counter() - start)
+
+
+def install(connection):
+    if _execute_hook not in connection.execute_wrappers:
+        connection.execute_wrappers.append(_execute_hook)
+
+
+def _install_on_connect(sender, connection, **kwargs):
+    install(connection)
+
+
+# Every thread has its own connection; hook each one as it connects. The
+# hook only costs a context variable lookup outside sampled requests.
+connection_created.connect(_install_on_connect)
+for _connection in connections.all(initialized_only=True):
+    install(_connection)
+
+
+def sampled():
+    rate = settings.QUERY_PROFILE_SAMPLE_RATE
+    return rate > 0 and random.random() < rate
+
+
+def _finish_request(profile, request):
+    match = request.resolver_match
+    profile.handler = match.view_name if match else "unmatched"
+    profile.finish(f"{request.method} {request.path}")
+
+
+@sync_and_async_middleware
+def query_profiling_middleware(get_response):
+    """Profiles a ``QUERY_PROFILE_SAMPLE_RATE`` fraction of HTTP requests."""
+    if iscoroutinefunction(get_response):
+        async def middleware(request):
+            if not sampled():
+                return await get_response(request)
+            with profile_queries("http") as profile:
+                response = await get_response(request)
+            _finish_request(profile, request)
+            return response
+    else:
+        def middleware(request):
+            if not sampled():
+                return get_response(request)
+            with profile_queries("http") as profile:
+                response = get_response(request)
+            _finish_request(profile, request)
+            return response
+    return middleware
+
+
+class QueryProfilingMiddleware(BaseMiddleware):
+    """
+    Samples a ``QUERY_PROFILE_SAMPLE_RATE`` fraction of websocket
+    connections. Consumers with ``ProfiledDispatchMixin`` profile every
+    event of a sampled connection separately.
+    """
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "websocket" or not sampled():
+            return await super().__call__(scope, receive, send)
+
+        token = _current.set(_Session())
+        try:
+            return await super().__call__(scope, receive, send)
+        finally:
+            _current.reset(token)
+
+
+class ProfiledDispatchMixin:
+    """
+    Profiles each event a consumer dispatches on a connection sampled by
+    ``QueryProfilingMiddleware``, from the client or the channel layer
+    alike, from the start of its handler until the handler returns.
+    """
+
+    async def dispatch(self, message):
+        session = _current.get()
+        if session is None:
+            return await super().dispatch(message)
+
+        session.profile = QueryProfile("websocket", message["type"])
+        try:
+            return await super().dispatch(message)
+        finally:
+            profile, session.profile = session.profile, None
+            profile.finish(self.scope.get("path", ""))
@@ -65,6 +65,8 @@ LOCAL_APPS = [
 INSTALLED_APPS = DJANGO_CHANNELS_APPS + DJANGO_APPS + THIRD_PARTY_APPS + LOCAL_APPS
 
 MIDDLEWARE = [
+    'myproject.metrics.metrics_middleware',
+    'myproject.profiling.query_profiling_middleware',
     'corsheaders.middleware.CorsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
@@ -185,6 +187,16 @@ REST_FRAMEWORK = {
     'DEFAULT_FILTER_BACKENDS': (
         'django_filters.rest_framework.DjangoFilterBackend',
     ),
+    # orjson-backed when installed, stdlib json otherwise.
+    'DEFAULT_RENDERER_CLASSES': (
+        'myproject.renderers.FastJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ),
+    'DEFAULT_PARSER_CLASSES': (
+        'myproject.renderers.FastJSONParser',
+        'rest_framework.parsers.FormParser',
+        'rest_framework.parsers.MultiPartParser',
+    ),
     'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.PageNumberPagination',
     'PAGE_SIZE': 10,
     "EXCEPTION_HANDLER": "myproject.exceptions.custom_exception_handler",
@@ -225,4 +237,102 @@ CHANNEL_LAYERS = {
     },
 }
 
+# Shared cache, so invalidations made by one worker are seen by all of them.
+USE_REDIS_CACHE = config("USE_REDIS_CACHE", cast=bool, default=True)
+if USE_REDIS_CACHE:
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.redis.RedisCache",
+            "LOCATION": f'redis://{config("REDIS_HOST", default="127.0.0.1")}:{config("REDIS_PORT", default=6379)}/1',
+        }
+    }
+else:
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+        }
+    }
+
 
+# Chat message persistence
+# When enabled, ChatConsumer queues messages in-process and writes them with
+# bulk_create once the batch fills up or the flush interval elapses.
+CHAT_WRITE_BEHIND_ENABLED = config("CHAT_WRITE_BEHIND_ENABLED", cast=bool, default=False)
+CHAT_WRITE_BEHIND_BATCH_SIZE = config("CHAT_WRITE_BEHIND_BATCH_SIZE", cast=int, default=100)
+CHAT_WRITE_BEHIND_FLUSH_INTERVAL = config("CHAT_WRITE_BEHIND_FLUSH_INTERVAL", cast=float, default=0.05)
+
+# Seconds between flushes of coalesced delivery/read receipts.
+CHAT_RECEIPT_FLUSH_INTERVAL = config("CHAT_RECEIPT_FLUSH_INTERVAL", cast=float, default=1.0)
+
+# Chat membership cache (seconds). Negative results expire sooner so a user
+# added to a chat by another process is never locked out for long.
+CHAT_MEMBERSHIP_CACHE_TIMEOUT = config("CHAT_MEMBERSHIP_CACHE_TIMEOUT", cast=int, default=60 * 60)
+CHAT_MEMBERSHIP_CACHE_NEGATIVE_TIMEOUT = config("CHAT_MEMBERSHIP_CACHE_NEGATIVE_TIMEOUT", cast=int, default=30)
+
+# Rate limiting. "redis" shares limits across workers; "memory" keeps them
+# per process and is meant for development and tests.
+RATE_LIMIT_BACKEND = config("RATE_LIMIT_BACKEND", default="redis")
+RATE_LIMIT_REDIS_URL = config(
+    "RATE_LIMIT_REDIS_URL",
+    default=f'redis://{config("REDIS_HOST", default="127.0.0.1")}:{config("REDIS_PORT", default=6379)}/2',
+)
+
+# Presence. Users count as online while any of their websocket connections
+# has heartbeated within PRESENCE_TTL seconds; changes are written to the
+# users table every PRESENCE_FLUSH_INTERVAL seconds.
+PRESENCE_BACKEND = config("PRESENCE_BACKEND", default="redis")
+PRESENCE_REDIS_URL = config(
+    "PRESENCE_REDIS_URL",
+    default=f'redis://{config("REDIS_HOST", default="127.0.0.1")}:{config("REDIS_PORT", default=6379)}/3',
+)
+PRESENCE_TTL = config("PRESENCE_TTL", cast=int, default=60)
+PRESENCE_FLUSH_INTERVAL = config("PRESENCE_FLUSH_INTERVAL", cast=float, default=10)
+
+# Typing indicators. Typists expire TYPING_TTL seconds after their last
+# typing frame; rosters are re-evaluated every TYPING_TICK seconds.
+TYPING_BACKEND = config("TYPING_BACKEND", default="redis")
+TYPING_REDIS_URL = config(
+    "TYPING_REDIS_URL",
+    default=f'redis://{config("REDIS_HOST", default="127.0.0.1")}:{config("REDIS_PORT", default=6379)}/4',
+)
+TYPING_TTL = config("TYPING_TTL", cast=float, default=5)
+TYPING_TICK = config("TYPING_TICK", cast=float, default=0.5)
+
+# Live call state. Participants that have not heartbeated for CALL_STATE_TTL
+# seconds are considered gone; abandoned calls are swept and persisted every
+# CALL_STATE_SWEEP_INTERVAL seconds.
+CALL_STATE_BACKEND = config("CALL_STATE_BACKEND", default="redis")
+CALL_STATE_REDIS_URL = config(
+    "CALL_STATE_REDIS_URL",
+    default=f'redis://{config("REDIS_HOST", default="127.0.0.1")}:{config("REDIS_PORT", default=6379)}/5',
+)
+CALL_STATE_TTL = config("CALL_STATE_TTL", cast=int, default=60)
+CALL_STATE_SWEEP_INTERVAL = config("CALL_STATE_SWEEP_INTERVAL", cast=float, default=30)
+
+# Profile images are resized on a small thread pool after the upload commits.
+PROFILE_IMAGE_WORKERS = config("PROFILE_IMAGE_WORKERS", cast=int, default=2)
+
+# Logins hash passwords on a pool of this many threads (0: one per core).
+PASSWORD_HASH_WORKERS = config("PASSWORD_HASH_WORKERS", cast=int, default=0)
+
+# /metrics serves Prometheus text to scrapers sending this bearer token. Left
+# empty, the endpoint is only served with DEBUG on.
+METRICS_TOKEN = config("METRICS_TOKEN", default="")
+
+# Fraction of HTTP requests and websocket connections whose queries are
+# profiled (0 disables). A profiled request or websocket event is logged,
+# with the location of repeated queries, once it runs more queries or spends
+# more time in the database than these, or runs one query shape
+# QUERY_PROFILE_REPEAT_THRESHOLD times or more.
+QUERY_PROFILE_SAMPLE_RATE = config("QUERY_PROFILE_SAMPLE_RATE", cast=float, default=0.0)
+QUERY_PROFILE_MAX_QUERIES = config("QUERY_PROFILE_MAX_QUERIES", cast=int, default=25)
+QUERY_PROFILE_MAX_DB_MS = config("QUERY_PROFILE_MAX_DB_MS", cast=float, default=100)
+QUERY_PROFILE_REPEAT_THRESHOLD = config("QUERY_PROFILE_REPEAT_THRESHOLD", cast=int, default=5)
+
+# Message archive. roll_message_partitions moves messages older than
+# MESSAGE_ARCHIVE_AFTER_DAYS to chat_message_archive (monthly partitions on
+# PostgreSQL) and history pages read through to it. History relies on the
+# archive holding nothing newer than this age, so never raise it once
+# messages have been archived.
+MESSAGE_ARCHIVE_ENABLED = config("MESSAGE_ARCHIVE_ENABLED", cast=bool, default=False)
+MESSAGE_ARCHIVE_AFTER_DAYS = config("MESSAGE_ARCHIVE_AFTER_DAYS", cast=int, default=180)
@@ -0,0 +1,104 @@
+import time
+from contextlib import asynccontextmanager, contextmanager
+
+from asgiref.sync import sync_to_async
+from decouple import config
+from django.db import connection
+from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
+
+
+# Run tests against SQLite, local memory caches, the in-memory channel layer
+# and the per-process state backends, so no Redis is needed.
+TEST_SETTINGS = {
+    "CACHES": {"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}},
+    "CHANNEL_LAYERS": {"default": {"BACKEND": "channels.layers.InMemoryChannelLayer"}},
+    "RATE_LIMIT_BACKEND": "memory",
+    "PRESENCE_BACKEND": "memory",
+    "TYPING_BACKEND": "memory",
+    "CALL_STATE_BACKEND": "memory",
+    "CHAT_WRITE_BEHIND_ENABLED": False,
+    # Budgets are about our code, not the cost of PBKDF2.
+    "PASSWORD_HASHERS": ["django.contrib.auth.hashers.MD5PasswordHasher"],
+}
+
+# Multiplies every wall-time budget, for slow or shared CI machines. Query
+# budgets are never scaled.
+TEST_TIME_BUDGET_SCALE = config("TEST_TIME_BUDGET_SCALE", cast=float, default=1.0)
+
+
+class QueryBudgetMixin:
+    """
+    Test case helpers asserting that a block stays within a number of SQL
+    queries and a wall-time budget. A failure lists the captured SQL.
+    Wall-time budgets are loose bounds against gross regressions and are
+    scaled by ``TEST_TIME_BUDGET_SCALE``; query counts are the real check.
+
+    The state singletons (presence, typing, rate limits, calls) pick their
+    backend at import time, so they are switched to memory backends for the
+    duration of the test class as well.
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        from chat.calls import MemoryCallStateBackend, call_state
+        from chat.ratelimit import MemoryBackend, rate_limiter
+        from chat.typing_roster import MemoryTypingBackend, typing_aggregator
+        from users.presence import MemoryPresenceBackend, presence
+
+        cls._settings = override_settings(**TEST_SETTINGS)
+        cls._settings.enable()
+        cls._backends = [
+            (tracker, tracker.backend)
+            for tracker in (call_state, rate_limiter, typing_aggregator, presence)
+        ]
+        call_state.backend = MemoryCallStateBackend()
+        rate_limiter.backend = MemoryBackend()
+        typing_aggregator.backend = MemoryTypingBackend()
+        presence.backend = MemoryPresenceBackend()
+        super().setUpClass()
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        for tracker, backend in cls._backends:
+            tracker.backend = backend
+        cls._settings.disable()
+
+    def _check_budget(self, label, captured, elapsed, queries, seconds):
+        sql = "\n".join(
+            f"  {number}. {query['sql']}" for number, query in enumerate(captured, start=1)
+        ) or "  (none)"
+        self.assertLessEqual(
+            len(captured), queries, f"{label}: {len(captured)} queries, budget is {queries}:\n{sql}"
+        )
+        seconds *= TEST_TIME_BUDGET_SCALE
+        self.assertLessEqual(
+            elapsed, seconds, f"{label}: took {elapsed * 1000:.1f}ms, budget is {seconds * 1000:.0f}ms:\n{sql}"
+        )
+
+    @contextmanager
+    def assertBudget(self, label, queries, seconds):
+        start = time.perf_counter()
+        with CaptureQueriesContext(connection) as captured:
+            yield captured
+        self._check_budget(label, captured.captured_queries, time.perf_counter() - start, queries, seconds)
+
+    @asynccontextmanager
+    async def assertBudgetAsync(self, label, queries, seconds):
+        """
+        ``assertBudget`` for async tests. Database work from consumers runs
+        on the test's main thread (``database_sync_to_async`` is thread
+        sensitive), so the capture is set up and read there too; the event
+        loop thread has a connection of its own.
+        """
+        captured = CaptureQueriesContext(connection)
+        await sync_to_async(captured.__enter__)()
+        start = time.perf_counter()
+        try:
+            yield captured
+        finally:
+            elapsed = time.perf_counter() - start
+            await sync_to_async(captured.__exit__)(None, None, None)
+        executed = await sync_to_async(lambda: captured.captured_queries)()
+        self._check_budget(label, executed, elapsed, queries, seconds)
@@ -25,6 +25,8 @@ from rest_framework import permissions
 from drf_yasg.views import get_schema_view
 from drf_yasg import openapi
 
+from myproject.metrics import metrics_view
+
 
 schema_view = get_schema_view(
     openapi.Info(
@@ -41,6 +43,8 @@ urlpatterns = [
     path("", schema_view.with_ui("swagger", cache_timeout=0), name="schema-swagger-ui"),
     path("redoc/", schema_view.with_ui("redoc", cache_timeout=0), name="schema-redoc"),
     path('api/users/', include('users.urls')),
+    path('api/chats/', include('chat.urls')),
+    path('metrics', metrics_view, name='metrics'),
     
 ]
 
@@ -0,0 +1,141 @@
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.db import close_old_connections
+from PIL import Image, ImageOps
+
+from loguru import logger
+
+
+# Square bounding boxes rendered for every profile image, largest first so
+# each size is thumbnailed from the previous one rather than the original.
+PROFILE_IMAGE_SIZES = (320, 160, 64)
+RENDITION_DIR = "profile_images/sizes"
+
+_executor = None
+
+
+def get_executor():
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(
+            max_workers=settings.PROFILE_IMAGE_WORKERS,
+            thread_name_prefix="profile-images",
+        )
+    return _executor
+
+
+def render_sizes(fp, sizes=PROFILE_IMAGE_SIZES):
+    """
+    Yield ``(size, key, extension, data)`` for every size: the image in a
+    widely supported format (JPEG, or PNG when it has transparency) under
+    ``"image"`` and a WebP copy under ``"webp"``.
+
+    JPEGs are decoded in draft mode, so the decoder downscales by up to 8x
+    while reading instead of materialising the full-resolution bitmap.
+    """
+    with Image.open(fp) as img:
+        largest = max(sizes)
+        img.draft("RGB", (largest, largest))
+        img = ImageOps.exif_transpose(img)
+
+        has_alpha = img.mode in ("RGBA", "LA") or (img.mode == "P" and "transparency" in img.info)
+        img = img.convert("RGBA" if has_alpha else "RGB")
+        fallback_format, fallback_extension = ("PNG", "png") if has_alpha else ("JPEG", "jpg")
+
+        for size in sorted(sizes, reverse=True):
+            img.thumbnail((size, size), Image.Resampling.LANCZOS)
+            for key, image_format, extension, options in (
+                ("image", fallback_format, fallback_extension, {"quality": 85, "optimize": True}),
+                ("webp", "WEBP", "webp", {"quality": 80, "method": 4}),
+            ):
+                buffer = BytesIO()
+                img.save(buffer, format=image_format, **options)
+                yield size, key, extension, buffer.getvalue()
+
+
+def build_renditions(user_id, name):
+    """
+    Render and store every size of the image at ``name``, then record them on
+    the user unless the image was replaced in the meantime. Returns the
+    stored sizes, or ``None`` when they were discarded.
+    """
+    from users.models import User
+
+    storage = User._meta.get_field("profile_image").storage
+    prefix = f"{RENDITION_DIR}/{user_id}/{uuid.uuid4().hex[:12]}"
+
+    stored = {}
+    try:
+        with storage.open(name, "rb") as fp:
+            for size, key, extension, data in render_sizes(fp):
+                stored.setdefault(str(size), {})[key] = storage.save(
+                    f"{prefix}_{size}.{extension}", ContentFile(data)
+                )
+
+        # Conditional on the image still being the one we rendered, so a slow
+        # worker never overwrites the sizes of a newer upload.
+        recorded = User.objects.filter(pk=user_id, profile_image=name).update(profile_image_sizes=stored)
+    except Exception:
+        # Nothing will ever point at the sizes saved so far.
+        delete_renditions(stored)
+        raise
+
+    if not recorded:
+        delete_renditions(stored)
+        return None
+    return stored
+
+
+def delete_renditions(sizes):
+    from users.models import User
+
+    storage = User._meta.get_field("profile_image").storage
+    for formats in (sizes or {}).values():
+        for name in formats.values():
+            storage.delete(name)
+
+
+def process_profile_image(user_id, name, previous=None):
+    """
+    Build the sizes of a new upload, then delete the ``previous`` image's
+    sizes. ``User.save`` stopped pointing at those when the image changed,
+    so they go whether or not the new ones could be built.
+    """
+    close_old_connections()
+    try:
+        if name:
+            build_renditions(user_id, name)
+    except Exception as e:
+        logger.error(f"Failed to process profile image {name} of user {user_id}: {str(e)}")
+    finally:
+        try:
+            delete_renditions(previous)
+        except Exception as e:
+            logger.error(f"Failed to delete the previous profile image sizes of user {user_id}: {str(e)}")
+        close_old_connections()
+
+
+def schedule_profile_image(user_id, name, previous=None):
+    """Process a new (or removed, when ``name`` is empty) profile image on the worker pool."""
+    get_executor().submit(process_profile_image, user_id, name, previous)
+
+
+def rendition_name(sizes, size, webp=False):
+    """Stored name of the smallest rendition at least ``size`` pixels, else the largest one."""
+    if not sizes:
+        return None
+    available = sorted(int(s) for s in sizes)
+    chosen = next((s for s in available if s >= size), available[-1])
+    return sizes[str(chosen)]["webp" if webp else "image"]
+
+
+def rendition_urls(sizes, url):
+    """``{size: {"image": url, "webp": url}}`` with ``url`` turning stored names into URLs."""
+    return {
+        size: {key: url(name) for key, name in formats.items()}
+        for size, formats in (sizes or {}).items()
+    }
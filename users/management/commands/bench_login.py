@@ -0,0 +1,128 @@
+import asyncio
+import json
+import statistics
+import threading
+import time
+import uuid
+
+from django.contrib.auth import authenticate
+from django.core.management.base import BaseCommand
+from django.test import AsyncClient, Client
+from rest_framework.test import APIRequestFactory
+
+from users.models import User
+from users.serializers import UserResponseSerializer
+from users.tokens import UserRefreshToken
+
+
+DOMAIN = "bench-login.example.com"
+PASSWORD = "bench-password-123"
+
+
+class Command(BaseCommand):
+    help = (
+        "Measure logins/sec: the previous pipeline (serializer check_password, "
+        "then authenticate() hashing again) against the login endpoint, single "
+        "threaded (per core), with concurrent WSGI clients and with concurrent "
+        "requests to the ASGI app, where a sync view is timed alongside."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--seconds", type=float, default=5.0, help="Duration of each measurement.")
+        parser.add_argument("--threads", type=int, default=4, help="Concurrent clients for the parallel runs.")
+
+    def handle(self, *args, **options):
+        email = f"bench-{uuid.uuid4().hex[:8]}@{DOMAIN}"
+        user = User.objects.create_user(email=email, password=PASSWORD, first_name="Bench", last_name="User")
+        body = json.dumps({"email": email, "password": PASSWORD})
+        try:
+            seconds = options["seconds"]
+            before = self._rate(lambda: self._previous_login(email), seconds)
+            after = self._rate(lambda: self._login(Client(), body), seconds)
+            self.stdout.write(f"previous pipeline, 1 thread : {before:7.1f} logins/s")
+            self.stdout.write(f"login endpoint,    1 thread : {after:7.1f} logins/s ({after / before:.2f}x)")
+
+            threads = options["threads"]
+            parallel = self._parallel_rate(lambda: self._login(Client(), body), seconds, threads)
+            self.stdout.write(f"login endpoint, {threads:>2} threads : {parallel:7.1f} logins/s (WSGI)")
+
+            access = str(UserRefreshToken.for_user(user).access_token)
+            rate, alone, loaded = asyncio.run(self._asgi(body, access, seconds, threads))
+            self.stdout.write(f"login endpoint, {threads:>2} tasks   : {rate:7.1f} logins/s (ASGI)")
+            self.stdout.write(
+                f"sync /me/ p50 alongside     : {alone * 1000:7.2f}ms idle, {loaded * 1000:.2f}ms during the logins"
+            )
+        finally:
+            User.objects.filter(email__endswith=f"@{DOMAIN}").delete()
+
+    @staticmethod
+    def _previous_login(email):
+        """What UserLoginView did before: look up and verify, then authenticate() again."""
+        user = User.objects.get(email=email)
+        assert user.check_password(PASSWORD)
+        request = APIRequestFactory().post("/api/users/login/")
+        user = authenticate(request, email=email, password=PASSWORD)
+        UserResponseSerializer(user).data
+        refresh = UserRefreshToken.for_user(user)
+        return str(refresh), str(refresh.access_token)
+
+    @staticmethod
+    def _login(client, body):
+        response = client.post("/api/users/login/", body, content_type="application/json")
+        assert response.status_code == 200, response.content
+
+    @staticmethod
+    async def _asgi(body, access, seconds, tasks):
+        """
+        Drive the ASGI handler with ``tasks`` concurrent logins while timing
+        a sync view, which shares the one thread sync views run on.
+        """
+        deadline = time.perf_counter() + seconds
+        logins = 0
+
+        async def login():
+            nonlocal logins
+            client = AsyncClient()
+            while time.perf_counter() < deadline:
+                response = await client.post("/api/users/login/", body, content_type="application/json")
+                assert response.status_code == 200, response.content
+                logins += 1
+
+        async def profile(until):
+            client = AsyncClient()
+            timings = []
+            while time.perf_counter() < until:
+                start = time.perf_counter()
+                response = await client.get("/api/users/me/", headers={"authorization": f"Bearer {access}"})
+                assert response.status_code == 200, response.content
+                timings.append(time.perf_counter() - start)
+            return statistics.median(timings)
+
+        alone = await profile(time.perf_counter() + min(seconds, 1.0))
+        deadline = time.perf_counter() + seconds
+        start = time.perf_counter()
+        *_, loaded = await asyncio.gather(*(login() for _ in range(tasks)), profile(deadline))
+        return logins / (time.perf_counter() - start), alone, loaded
+
+    @staticmethod
+    def _rate(run, seconds):
+        calls = 0
+        start = time.perf_counter()
+        while time.perf_counter() - start < seconds:
+            run()
+            calls += 1
+        return calls / (time.perf_counter() - start)
+
+    @classmethod
+    def _parallel_rate(cls, run, seconds, threads):
+        rates = [0] * threads
+
+        def worker(index):
+            rates[index] = cls._rate(run, seconds)
+
+        workers = [threading.Thread(target=worker, args=(i,)) for i in range(threads)]
+        for thread in workers:
+            thread.start()
+        for thread in workers:
+            thread.join()
+        return sum(rates)
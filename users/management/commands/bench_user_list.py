@@ -0,0 +1,80 @@
+import time
+import uuid
+
+from django.core.management.base import BaseCommand
+from django.test import Client
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory
+
+from myproject.renderers import FastJSONRenderer, orjson
+from users.models import User
+from users.serializers import UserResponseSerializer
+from users.tokens import UserRefreshToken
+
+
+DOMAIN = "bench-list.example.com"
+
+
+class Command(BaseCommand):
+    help = (
+        "Measure users list throughput: serializing and rendering pages with the "
+        "ModelSerializer + stdlib renderer against the .values() fast path + orjson "
+        "renderer, then requests/sec of the users list endpoint."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--users", type=int, default=5000)
+        parser.add_argument("--page-size", type=int, default=500, help="Rows per serialized page.")
+        parser.add_argument("--seconds", type=float, default=3.0, help="Duration of each measurement.")
+
+    def handle(self, *args, **options):
+        users = self._populate(options["users"])
+        try:
+            self.stdout.write(f"orjson: {'yes' if orjson else 'no (stdlib fallback)'}")
+            request = Request(APIRequestFactory().get("/api/users/"))
+            queryset = User.objects.filter(email__endswith=f"@{DOMAIN}")[: options["page_size"]]
+            rows = list(queryset.values(*UserResponseSerializer.Meta.fields))
+            instances = list(queryset)
+
+            def stock():
+                data = UserResponseSerializer(instances, many=True, context={"request": request}).data
+                return JSONRenderer().render(data)
+
+            def fast():
+                data = UserResponseSerializer.serialize_rows(rows, {"request": request})
+                return FastJSONRenderer().render(data)
+
+            stock_rate = self._rate(stock, options["seconds"]) * len(rows)
+            fast_rate = self._rate(fast, options["seconds"]) * len(rows)
+            self.stdout.write(f"serialize+render, stock : {stock_rate:12.0f} users/s")
+            self.stdout.write(f"serialize+render, fast  : {fast_rate:12.0f} users/s ({fast_rate / stock_rate:.1f}x)")
+
+            client = Client()
+            token = UserRefreshToken.for_user(users[0]).access_token
+            headers = {"HTTP_AUTHORIZATION": f"Bearer {token}"}
+            for query in ("", "?count=false", "?search=bench&count=false"):
+                rate = self._rate(lambda: client.get(f"/api/users/{query}", **headers), options["seconds"])
+                self.stdout.write(f"GET /api/users/{query:<24}: {rate:8.0f} req/s")
+        finally:
+            User.objects.filter(email__endswith=f"@{DOMAIN}").delete()
+
+    def _populate(self, count):
+        return User.objects.bulk_create([
+            User(
+                email=f"bench-{uuid.uuid4().hex}@{DOMAIN}",
+                first_name="Bench",
+                last_name=f"User {i}",
+                password="!",
+            )
+            for i in range(count)
+        ], batch_size=1000)
+
+    @staticmethod
+    def _rate(run, seconds):
+        calls = 0
+        start = time.perf_counter()
+        while time.perf_counter() - start < seconds:
+            run()
+            calls += 1
+        return calls / (time.perf_counter() - start)
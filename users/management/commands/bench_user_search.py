@@ -0,0 +1,113 @@
+import itertools
+import statistics
+import time
+
+from django.core.management.base import BaseCommand
+from django.db.models import Q
+
+from users.models import User
+from users.search import search_users
+
+
+FIRST_NAMES = [
+    "James", "Mary", "John", "Patricia", "Robert", "Jennifer", "Michael", "Linda", "William", "Elizabeth",
+    "David", "Barbara", "Richard", "Susan", "Joseph", "Jessica", "Thomas", "Sarah", "Charles", "Karen",
+    "Maria", "Ahmed", "Wei", "Yuki", "Olga", "Carlos", "Fatima", "Ivan", "Aisha", "Mateo",
+]
+LAST_NAMES = [
+    "Smith", "Johnson", "Williams", "Brown", "Jones", "Garcia", "Miller", "Davis", "Rodriguez", "Martinez",
+    "Hernandez", "Lopez", "Gonzalez", "Wilson", "Anderson", "Thomas", "Taylor", "Moore", "Jackson", "Martin",
+    "Nguyen", "Kim", "Patel", "Khan", "Ivanova", "Silva", "Rossi", "Muller", "Sato", "Cohen",
+]
+DOMAIN = "bench-search.example.com"
+
+
+class Command(BaseCommand):
+    help = (
+        "Measure user search latency on a large users table: the old icontains "
+        "OR across columns with a COUNT, against the indexed search with and without COUNT."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--users", type=int, default=1_000_000)
+        parser.add_argument("--page-size", type=int, default=10)
+        parser.add_argument("--repeat", type=int, default=10)
+        parser.add_argument("--terms", default="jo,joh,smith,maria gar,ngu,mat,zzzz")
+        parser.add_argument("--keep", action="store_true", help="Keep the generated users for later runs.")
+        parser.add_argument("--skip-baseline", action="store_true", help="Only measure the indexed search.")
+
+    def handle(self, *args, **options):
+        existing = User.objects.filter(email__endswith=f"@{DOMAIN}").count()
+        if existing < options["users"]:
+            self._populate(existing, options["users"])
+
+        try:
+            self.stdout.write(f"{User.objects.count()} users, page size {options['page_size']}")
+            self.stdout.write(
+                f"{'term':>12} {'matches':>9} {'old+count':>11} {'indexed+count':>14} {'indexed':>10}"
+            )
+            for term in options["terms"].split(","):
+                matches = search_users(User.objects.all(), term).count()
+                baseline = None if options["skip_baseline"] else self._time(
+                    lambda: self._page(self._baseline(term), options["page_size"], count=True), options["repeat"]
+                )
+                counted = self._time(
+                    lambda: self._page(search_users(User.objects.all(), term), options["page_size"], count=True),
+                    options["repeat"],
+                )
+                uncounted = self._time(
+                    lambda: self._page(search_users(User.objects.all(), term), options["page_size"], count=False),
+                    options["repeat"],
+                )
+                self.stdout.write(
+                    f"{term:>12} {matches:>9} {self._ms(baseline) if baseline else '-':>11} "
+                    f"{self._ms(counted):>14} {self._ms(uncounted):>10}"
+                )
+        finally:
+            if not options["keep"]:
+                User.objects.filter(email__endswith=f"@{DOMAIN}").delete()
+
+    def _populate(self, start, count, chunk=10_000):
+        names = list(itertools.product(FIRST_NAMES, LAST_NAMES))
+        for offset in range(start, count, chunk):
+            users = []
+            for i in range(offset, min(offset + chunk, count)):
+                first, last = names[i % len(names)]
+                users.append(User(
+                    email=f"{first.lower()}.{last.lower()}{i}@{DOMAIN}",
+                    first_name=first,
+                    last_name=last,
+                    password="!",
+                ))
+            User.objects.bulk_create(users)
+            self.stdout.write(f"\rpopulated {min(offset + chunk, count)}/{count}", ending="")
+        self.stdout.write("")
+
+    @staticmethod
+    def _baseline(term):
+        """What DRF's SearchFilter produced: every word icontains-ed across all three columns."""
+        queryset = User.objects.all()
+        for word in term.split():
+            queryset = queryset.filter(
+                Q(first_name__icontains=word) | Q(last_name__icontains=word) | Q(email__icontains=word)
+            )
+        return queryset
+
+    @staticmethod
+    def _page(queryset, page_size, count):
+        if count:
+            queryset.count()
+        return list(queryset.values("id", "first_name", "last_name", "email")[: page_size + 1])
+
+    @staticmethod
+    def _time(run, repeat):
+        timings = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            run()
+            timings.append(time.perf_counter() - start)
+        return statistics.median(timings)
+
+    @staticmethod
+    def _ms(seconds):
+        return f"{seconds * 1000:.2f}ms"
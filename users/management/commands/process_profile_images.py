@@ -0,0 +1,28 @@
+from django.core.management.base import BaseCommand
+
+from users.images import build_renditions, delete_renditions
+from users.models import User
+
+from loguru import logger
+
+
+class Command(BaseCommand):
+    help = "Render the sizes of profile images that have none yet, e.g. uploads from before sizes existed."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--all", action="store_true", help="Re-render every profile image.")
+
+    def handle(self, *args, **options):
+        users = User.objects.exclude(profile_image="").exclude(profile_image__isnull=True)
+        if not options["all"]:
+            users = users.filter(profile_image_sizes={})
+
+        processed = 0
+        for user_id, name, previous in users.values_list("id", "profile_image", "profile_image_sizes").iterator():
+            try:
+                if build_renditions(user_id, name) is not None:
+                    delete_renditions(previous)
+                    processed += 1
+            except Exception as e:
+                logger.error(f"Failed to process profile image {name} of user {user_id}: {str(e)}")
+        self.stdout.write(f"Processed {processed} profile image(s).")
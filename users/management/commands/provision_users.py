@@ -0,0 +1,38 @@
+import json
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+
+from users.provisioning import provision_users, read_rows
+
+
+class Command(BaseCommand):
+    help = (
+        "Create users in bulk from a CSV (header: email,password,first_name,last_name) "
+        "or NDJSON file. Invalid rows are reported and skipped."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("path", help="File to import, or - for stdin.")
+        parser.add_argument("--format", choices=["csv", "ndjson"], help="Defaults to the file extension.")
+        parser.add_argument("--batch-size", type=int, default=1000)
+        parser.add_argument("--workers", type=int, default=None, help="Hashing processes (default: one per core).")
+
+    def handle(self, *args, **options):
+        path = options["path"]
+        fmt = options["format"] or ("ndjson" if path.endswith((".ndjson", ".jsonl")) else "csv")
+        try:
+            stream = sys.stdin if path == "-" else open(path, newline="", encoding="utf-8-sig")
+        except OSError as e:
+            raise CommandError(str(e))
+
+        with stream:
+            result = provision_users(
+                read_rows(stream, fmt),
+                batch_size=options["batch_size"],
+                workers=options["workers"],
+            )
+
+        for error in result.errors:
+            self.stderr.write(f"row {error['row']}: {json.dumps(error['errors'])}")
+        self.stdout.write(f"Created {len(result.created)} user(s), rejected {len(result.errors)} row(s).")
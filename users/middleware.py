@@ -0,0 +1,77 @@
+from urllib.parse import parse_qs
+
+from channels.middleware import BaseMiddleware
+from django.contrib.auth import get_user_model
+from django.contrib.auth.models import AnonymousUser
+from rest_framework_simplejwt.exceptions import TokenError
+from rest_framework_simplejwt.models import TokenUser
+from rest_framework_simplejwt.tokens import AccessToken
+
+from loguru import logger
+
+
+User = get_user_model()
+
+# Browsers cannot set an Authorization header on websockets, so clients offer
+# ``Sec-WebSocket-Protocol: access_token, <jwt>`` and the consumer accepts
+# with ``access_token``.
+TOKEN_SUBPROTOCOL = "access_token"
+
+
+class WebSocketUser(TokenUser):
+    """
+    Stateless user built from access token claims. The ``User`` row is only
+    loaded when a caller explicitly asks for it via ``aget_user``.
+    """
+
+    def __init__(self, token):
+        super().__init__(token)
+        self._user = None
+
+    def get_full_name(self):
+        return self.token.get("full_name", "")
+
+    async def aget_user(self):
+        if self._user is None:
+            self._user = await User.objects.aget(pk=self.id)
+        return self._user
+
+
+class JWTAuthMiddleware(BaseMiddleware):
+    """
+    Populates ``scope["user"]`` from a SimpleJWT access token passed either as
+    the ``token`` query string parameter or through the subprotocol header.
+    Validation is purely cryptographic; no session or user lookup is made.
+    """
+
+    async def __call__(self, scope, receive, send):
+        scope = dict(scope)
+        raw_token, subprotocol = self.get_raw_token(scope)
+        scope["user"] = self.authenticate(raw_token) if raw_token else AnonymousUser()
+        if subprotocol:
+            scope["auth_subprotocol"] = subprotocol
+        return await super().__call__(scope, receive, send)
+
+    @staticmethod
+    def get_raw_token(scope):
+        subprotocols = scope.get("subprotocols") or []
+        if TOKEN_SUBPROTOCOL in subprotocols:
+            index = subprotocols.index(TOKEN_SUBPROTOCOL)
+            if index + 1 < len(subprotocols):
+                return subprotocols[index + 1], TOKEN_SUBPROTOCOL
+
+        query = parse_qs(scope.get("query_string", b"").decode())
+        token = query.get("token")
+        return (token[0], None) if token else (None, None)
+
+    @staticmethod
+    def authenticate(raw_token):
+        try:
+            return WebSocketUser(AccessToken(raw_token))
+        except TokenError as e:
+            logger.warning(f"Rejected websocket token: {str(e)}")
+            return AnonymousUser()
+
+
+def JWTAuthMiddlewareStack(inner):
+    return JWTAuthMiddleware(inner)
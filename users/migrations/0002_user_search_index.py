@@ -0,0 +1,74 @@
+from django.db import migrations
+
+
+POSTGRES_FORWARD = [
+    "CREATE EXTENSION IF NOT EXISTS pg_trgm",
+    # Match the UPPER(col::text) LIKE UPPER(...) that icontains/istartswith emit.
+    'CREATE INDEX IF NOT EXISTS users_user_first_name_trgm ON users_user USING gin ((UPPER("first_name"::text)) gin_trgm_ops)',
+    'CREATE INDEX IF NOT EXISTS users_user_last_name_trgm ON users_user USING gin ((UPPER("last_name"::text)) gin_trgm_ops)',
+    'CREATE INDEX IF NOT EXISTS users_user_email_trgm ON users_user USING gin ((UPPER("email"::text)) gin_trgm_ops)',
+]
+
+POSTGRES_REVERSE = [
+    "DROP INDEX IF EXISTS users_user_first_name_trgm",
+    "DROP INDEX IF EXISTS users_user_last_name_trgm",
+    "DROP INDEX IF EXISTS users_user_email_trgm",
+]
+
+SQLITE_FORWARD = [
+    """
+    CREATE VIRTUAL TABLE IF NOT EXISTS users_user_fts USING fts5(
+        first_name, last_name, email,
+        content='users_user', content_rowid='rowid', prefix='2 3'
+    )
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS users_user_fts_ai AFTER INSERT ON users_user BEGIN
+        INSERT INTO users_user_fts(rowid, first_name, last_name, email)
+        VALUES (new.rowid, new.first_name, new.last_name, new.email);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS users_user_fts_ad AFTER DELETE ON users_user BEGIN
+        INSERT INTO users_user_fts(users_user_fts, rowid, first_name, last_name, email)
+        VALUES ('delete', old.rowid, old.first_name, old.last_name, old.email);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS users_user_fts_au AFTER UPDATE OF first_name, last_name, email ON users_user BEGIN
+        INSERT INTO users_user_fts(users_user_fts, rowid, first_name, last_name, email)
+        VALUES ('delete', old.rowid, old.first_name, old.last_name, old.email);
+        INSERT INTO users_user_fts(rowid, first_name, last_name, email)
+        VALUES (new.rowid, new.first_name, new.last_name, new.email);
+    END
+    """,
+    "INSERT INTO users_user_fts(users_user_fts) VALUES ('rebuild')",
+]
+
+SQLITE_REVERSE = [
+    "DROP TRIGGER IF EXISTS users_user_fts_ai",
+    "DROP TRIGGER IF EXISTS users_user_fts_ad",
+    "DROP TRIGGER IF EXISTS users_user_fts_au",
+    "DROP TABLE IF EXISTS users_user_fts",
+]
+
+
+def run_for_vendor(statements):
+    def run(apps, schema_editor):
+        for statement in statements.get(schema_editor.connection.vendor, []):
+            schema_editor.execute(statement)
+    return run
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("users", "0001_initial"),
+    ]
+
+    operations = [
+        migrations.RunPython(
+            run_for_vendor({"postgresql": POSTGRES_FORWARD, "sqlite": SQLITE_FORWARD}),
+            run_for_vendor({"postgresql": POSTGRES_REVERSE, "sqlite": SQLITE_REVERSE}),
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 5.2.4 on 2026-10-18 11:46
+
+from importlib import import_module
+
+from django.db import migrations, models
+
+
+search_index = import_module("users.migrations.0002_user_search_index")
+
+
+def restore_search_mirror(apps, schema_editor):
+    # SQLite applies this AddField (and its reverse) by rebuilding users_user,
+    # which drops the FTS triggers and renumbers rowids.
+    if schema_editor.connection.vendor == "sqlite":
+        for statement in search_index.SQLITE_FORWARD:
+            schema_editor.execute(statement)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("users", "0002_user_search_index"),
+    ]
+
+    operations = [
+        migrations.RunPython(migrations.RunPython.noop, restore_search_mirror),
+        migrations.AddField(
+            model_name="user",
+            name="profile_image_sizes",
+            field=models.JSONField(blank=True, default=dict, editable=False),
+        ),
+        migrations.RunPython(restore_search_mirror, migrations.RunPython.noop),
+    ]
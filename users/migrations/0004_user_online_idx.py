@@ -0,0 +1,19 @@
+# Generated by Django 5.2.4 on 2026-10-18 18:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("users", "0003_user_profile_image_sizes"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="user",
+            index=models.Index(
+                condition=models.Q(("is_online", True)), fields=["-created_at"], name="user_online_idx"
+            ),
+        ),
+    ]
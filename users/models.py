@@ -1,11 +1,10 @@
-from django.db import models
+from functools import partial
+
+from django.db import models, transaction
 from django.contrib.auth.models import AbstractUser
 from django.utils.translation import gettext_lazy as _
-from django.core.files.base import ContentFile
-
-from PIL import Image
-from io import BytesIO
 
+from .images import rendition_name, schedule_profile_image
 from .managers import CustomUserManager
 
 import uuid
@@ -18,6 +17,9 @@ class User(AbstractUser):
     first_name = models.CharField(max_length=255, blank=True, null=True)
     last_name = models.CharField(max_length=255, blank=True, null=True)
     profile_image = models.ImageField(upload_to='profile_images/', blank=True, null=True)
+    # {"64": {"image": name, "webp": name}, ...}, filled in by users.images
+    # once the current profile_image has been processed.
+    profile_image_sizes = models.JSONField(default=dict, blank=True, editable=False)
     is_online = models.BooleanField(default=False)
     last_seen = models.DateTimeField(null=True, blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
@@ -36,28 +38,54 @@ class User(AbstractUser):
         verbose_name = "User"
         verbose_name_plural = "Users"
         ordering = ['-created_at']
+        indexes = [
+            # ?is_online=true lists, newest first; online users are a small slice.
+            models.Index(fields=['-created_at'], condition=models.Q(is_online=True), name='user_online_idx'),
+        ]
         
     def get_full_name(self):
         return f"{self.first_name} {self.last_name}"
 
-    def save(self, *args, **kwargs):
-        if self.profile_image:
-            img = Image.open(self.profile_image)
-
-            max_size = (320, 320)
-            if img.height > 320 or img.width > 320:
-                img.thumbnail(max_size)
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Remember the stored image so save() can tell whether it changed.
+        instance._loaded_profile_image = instance.__dict__.get("profile_image") or ""
+        return instance
 
-                img_io = BytesIO()
-                img_format = img.format if img.format else 'JPEG'
-                img.save(img_io, format=img_format, quality=85)
+    def profile_image_changed(self):
+        if "profile_image" in self.get_deferred_fields():
+            return False
+        image = self.profile_image
+        if image and not image._committed:
+            return True
+        return (image.name or "") != getattr(self, "_loaded_profile_image", "")
 
-               
-                self.profile_image = ContentFile(img_io.getvalue(), self.profile_image.name)
-
-        super().save(*args, **kwargs)
-            
+    def profile_image_url(self, size=320, webp=False):
+        """URL of the smallest processed size covering ``size``; the upload itself until it is processed."""
+        if not self.profile_image:
+            return None
+        name = rendition_name(self.profile_image_sizes, size, webp)
+        return self.profile_image.storage.url(name) if name else self.profile_image.url
 
+    def save(self, *args, **kwargs):
+        update_fields = kwargs.get("update_fields")
+        image_changed = (
+            update_fields is None or "profile_image" in update_fields
+        ) and self.profile_image_changed()
 
+        if image_changed:
+            # Resizing happens on the worker pool after commit; until then
+            # the API serves the upload as is.
+            previous, self.profile_image_sizes = self.profile_image_sizes, {}
+            if update_fields is not None:
+                kwargs["update_fields"] = {*update_fields, "profile_image_sizes"}
 
+        super().save(*args, **kwargs)
 
+        if image_changed:
+            self._loaded_profile_image = self.profile_image.name or ""
+            transaction.on_commit(
+                partial(schedule_profile_image, self.pk, self.profile_image.name, previous),
+                using=kwargs.get("using"),
+            )
@@ -0,0 +1,70 @@
+import asyncio
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+from channels.db import database_sync_to_async
+from django.conf import settings
+from django.contrib.auth.hashers import check_password, make_password
+
+_pool = None
+
+
+def get_pool():
+    """
+    Bounded pool password hashes are computed on. PBKDF2 releases the GIL,
+    so up to ``PASSWORD_HASH_WORKERS`` logins hash in parallel while a burst
+    of them can never occupy every thread serving other requests.
+    """
+    global _pool
+    if _pool is None:
+        _pool = ThreadPoolExecutor(max_workers=pool_size(), thread_name_prefix="password-hash")
+    return _pool
+
+
+def pool_size():
+    return settings.PASSWORD_HASH_WORKERS or os.cpu_count()
+
+
+def _verify(raw_password, encoded):
+    """Return ``(valid, must_update)`` for ``raw_password`` against ``encoded``."""
+    upgrade = []
+    valid = check_password(raw_password, encoded, setter=lambda _: upgrade.append(True))
+    return valid, bool(upgrade)
+
+
+def _upgrade(user, raw_password, result):
+    valid, must_update = result
+    if valid and must_update:
+        # Same as AbstractBaseUser.check_password: rehash with the preferred
+        # hasher (or iteration count) now that the raw password is at hand.
+        user.set_password(raw_password)
+        user._password = None
+        user.save(update_fields=["password"])
+    return valid
+
+
+def make_passwords(raw_passwords):
+    """
+    ``make_password`` for each of ``raw_passwords`` on the bounded pool,
+    ``pool_size()`` at a time so that logins queued meanwhile wait for one
+    round of hashes rather than for the whole list.
+    """
+    size = pool_size()
+    hashes = []
+    for start in range(0, len(raw_passwords), size):
+        hashes.extend(get_pool().map(make_password, raw_passwords[start:start + size]))
+    return hashes
+
+
+async def averify_password(user, raw_password):
+    """
+    ``user.check_password`` with the hashing done on the bounded pool. The
+    caller awaits it instead of blocking a thread on the result: under ASGI
+    every sync view shares one thread, which a login would hold for the
+    whole hash.
+    """
+    result = await asyncio.wrap_future(get_pool().submit(_verify, raw_password, user.password))
+    if result[1]:
+        return await database_sync_to_async(_upgrade)(user, raw_password, result)
+    return result[0]
+
@@ -0,0 +1,333 @@
+import asyncio
+import time
+from datetime import datetime, timezone as dt_timezone
+
+import redis
+import redis.asyncio as aredis
+from channels.db import database_sync_to_async
+from django.conf import settings
+from django.contrib.auth import get_user_model
+
+from loguru import logger
+
+
+User = get_user_model()
+
+
+# KEYS: users zset, connections hash of the user, dirty set
+# ARGV: user id, channel name, now, ttl
+CONNECT_SCRIPT = """
+local previous = tonumber(redis.call('ZSCORE', KEYS[1], ARGV[1]))
+local now = tonumber(ARGV[3])
+local ttl = tonumber(ARGV[4])
+
+redis.call('HSET', KEYS[2], ARGV[2], ARGV[3])
+redis.call('EXPIRE', KEYS[2], ttl * 2)
+redis.call('ZADD', KEYS[1], now, ARGV[1])
+
+if not previous or previous < now - ttl then
+    redis.call('SADD', KEYS[3], ARGV[1])
+    return 1
+end
+return 0
+"""
+
+# KEYS: users zset, connections hash of the user, dirty set, last seen hash
+# ARGV: user id, channel name, now, ttl
+DISCONNECT_SCRIPT = """
+local now = tonumber(ARGV[3])
+local ttl = tonumber(ARGV[4])
+redis.call('HDEL', KEYS[2], ARGV[2])
+
+local connections = redis.call('HGETALL', KEYS[2])
+for i = 1, #connections, 2 do
+    if tonumber(connections[i + 1]) < now - ttl then
+        redis.call('HDEL', KEYS[2], connections[i])
+    end
+end
+
+if redis.call('HLEN', KEYS[2]) == 0 then
+    redis.call('ZREM', KEYS[1], ARGV[1])
+    redis.call('HSET', KEYS[4], ARGV[1], ARGV[3])
+    redis.call('SADD', KEYS[3], ARGV[1])
+    return 1
+end
+return 0
+"""
+
+# Users whose every connection stopped heartbeating (e.g. a worker crashed
+# before running disconnect) are moved offline here.
+# KEYS: users zset, dirty set, last seen hash
+# ARGV: now, ttl, connections key prefix, batch size
+SWEEP_SCRIPT = """
+local cutoff = tonumber(ARGV[1]) - tonumber(ARGV[2])
+local stale = redis.call('ZRANGEBYSCORE', KEYS[1], '-inf', cutoff, 'WITHSCORES', 'LIMIT', 0, tonumber(ARGV[4]))
+for i = 1, #stale, 2 do
+    redis.call('ZREM', KEYS[1], stale[i])
+    redis.call('HSET', KEYS[3], stale[i], stale[i + 1])
+    redis.call('SADD', KEYS[2], stale[i])
+    redis.call('DEL', ARGV[3] .. stale[i])
+end
+return #stale / 2
+"""
+
+
+class RedisPresenceBackend:
+    USERS_KEY = "presence:users"
+    DIRTY_KEY = "presence:dirty"
+    LAST_SEEN_KEY = "presence:last_seen"
+    CONNECTIONS_PREFIX = "presence:conns:"
+
+    def __init__(self, url):
+        self.client = aredis.Redis.from_url(url, decode_responses=True)
+        self.sync_client = redis.Redis.from_url(url, decode_responses=True)
+        self.connect_script = self.client.register_script(CONNECT_SCRIPT)
+        self.disconnect_script = self.client.register_script(DISCONNECT_SCRIPT)
+        self.sweep_script = self.client.register_script(SWEEP_SCRIPT)
+
+    async def connect(self, user_id, channel_name, now, ttl):
+        return bool(await self.connect_script(
+            keys=[self.USERS_KEY, self.CONNECTIONS_PREFIX + user_id, self.DIRTY_KEY],
+            args=[user_id, channel_name, now, ttl],
+        ))
+
+    async def disconnect(self, user_id, channel_name, now, ttl):
+        return bool(await self.disconnect_script(
+            keys=[self.USERS_KEY, self.CONNECTIONS_PREFIX + user_id, self.DIRTY_KEY, self.LAST_SEEN_KEY],
+            args=[user_id, channel_name, now, ttl],
+        ))
+
+    async def sweep(self, now, ttl, batch_size):
+        return await self.sweep_script(
+            keys=[self.USERS_KEY, self.DIRTY_KEY, self.LAST_SEEN_KEY],
+            args=[now, ttl, self.CONNECTIONS_PREFIX, batch_size],
+        )
+
+    async def pop_dirty(self, batch_size):
+        """Pop up to ``batch_size`` changed users as (user_id, last heartbeat or None, last seen)."""
+        user_ids = await self.client.spop(self.DIRTY_KEY, batch_size)
+        if not user_ids:
+            return []
+
+        async with self.client.pipeline(transaction=False) as pipe:
+            pipe.zmscore(self.USERS_KEY, user_ids)
+            pipe.hmget(self.LAST_SEEN_KEY, user_ids)
+            pipe.hdel(self.LAST_SEEN_KEY, *user_ids)
+            heartbeats, last_seen, _ = await pipe.execute()
+
+        return [
+            (user_id, heartbeat, float(seen) if seen else None)
+            for user_id, heartbeat, seen in zip(user_ids, heartbeats, last_seen)
+        ]
+
+    async def requeue(self, changes):
+        """Mark popped users dirty again, keeping any last seen recorded since."""
+        async with self.client.pipeline(transaction=False) as pipe:
+            pipe.sadd(self.DIRTY_KEY, *[user_id for user_id, _, _ in changes])
+            for user_id, _, seen in changes:
+                if seen is not None:
+                    pipe.hsetnx(self.LAST_SEEN_KEY, user_id, seen)
+            await pipe.execute()
+
+    def heartbeats(self, user_ids):
+        return dict(zip(user_ids, self.sync_client.zmscore(self.USERS_KEY, user_ids)))
+
+    def online_since(self, cutoff):
+        return self.sync_client.zrangebyscore(self.USERS_KEY, cutoff, "+inf")
+
+
+class MemoryPresenceBackend:
+    """Per-process presence for development and tests."""
+
+    def __init__(self):
+        self.users = {}
+        self.connections = {}
+        self.dirty = set()
+        self.last_seen = {}
+
+    async def connect(self, user_id, channel_name, now, ttl):
+        previous = self.users.get(user_id)
+        self.connections.setdefault(user_id, {})[channel_name] = now
+        self.users[user_id] = now
+        if previous is None or previous < now - ttl:
+            self.dirty.add(user_id)
+            return True
+        return False
+
+    async def disconnect(self, user_id, channel_name, now, ttl):
+        connections = self.connections.get(user_id, {})
+        connections.pop(channel_name, None)
+        for name, heartbeat in list(connections.items()):
+            if heartbeat < now - ttl:
+                del connections[name]
+
+        if connections:
+            return False
+
+        self.connections.pop(user_id, None)
+        self.users.pop(user_id, None)
+        self.last_seen[user_id] = now
+        self.dirty.add(user_id)
+        return True
+
+    async def sweep(self, now, ttl, batch_size):
+        stale = [user_id for user_id, heartbeat in self.users.items() if heartbeat < now - ttl][:batch_size]
+        for user_id in stale:
+            self.last_seen[user_id] = self.users.pop(user_id)
+            self.connections.pop(user_id, None)
+            self.dirty.add(user_id)
+        return len(stale)
+
+    async def pop_dirty(self, batch_size):
+        popped = []
+        while self.dirty and len(popped) < batch_size:
+            user_id = self.dirty.pop()
+            popped.append((user_id, self.users.get(user_id), self.last_seen.pop(user_id, None)))
+        return popped
+
+    async def requeue(self, changes):
+        for user_id, _, seen in changes:
+            self.dirty.add(user_id)
+            if seen is not None:
+                self.last_seen.setdefault(user_id, seen)
+
+    def heartbeats(self, user_ids):
+        return {user_id: self.users.get(user_id) for user_id in user_ids}
+
+    def online_since(self, cutoff):
+        return [user_id for user_id, heartbeat in self.users.items() if heartbeat >= cutoff]
+
+
+class PresenceTracker:
+    """
+    Tracks which users are online from websocket connect, heartbeat and
+    disconnect events. A user is online while any of their connections
+    (tabs, devices, chats) has sent a heartbeat within ``ttl`` seconds.
+
+    Only online/offline transitions mark a user dirty, and dirty users are
+    written to ``User.is_online``/``last_seen`` in one bulk update every
+    ``flush_interval`` seconds, so steady heartbeats never touch the database.
+    """
+
+    def __init__(self, backend, ttl=60, flush_interval=10, batch_size=500):
+        self.backend = backend
+        self.ttl = ttl
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        self._touched = {}
+        self._flusher = None
+
+    async def connect(self, user_id, channel_name):
+        user_id = str(user_id)
+        now = time.time()
+        self._touched[(user_id, channel_name)] = now
+        await self._call(self.backend.connect(user_id, channel_name, now, self.ttl))
+        self.ensure_flusher()
+
+    async def heartbeat(self, user_id, channel_name):
+        """
+        Refresh the connection's liveness. Calls within a third of ``ttl`` of
+        the previous refresh are absorbed locally.
+        """
+        user_id = str(user_id)
+        now = time.time()
+        if now - self._touched.get((user_id, channel_name), 0) < self.ttl / 3:
+            return
+        self._touched[(user_id, channel_name)] = now
+        await self._call(self.backend.connect(user_id, channel_name, now, self.ttl))
+
+    async def disconnect(self, user_id, channel_name):
+        user_id = str(user_id)
+        self._touched.pop((user_id, channel_name), None)
+        await self._call(self.backend.disconnect(user_id, channel_name, time.time(), self.ttl))
+
+    async def _call(self, operation):
+        # Presence is best effort; a Redis hiccup must not fail the socket.
+        try:
+            return await operation
+        except redis.RedisError as e:
+            logger.warning(f"Presence backend unavailable: {str(e)}")
+
+    def is_online_many(self, user_ids):
+        """
+        Return the subset of ``user_ids`` (as strings) that is currently
+        online, or that ``User.is_online`` says is when the backend is down.
+        """
+        user_ids = [str(user_id) for user_id in user_ids]
+        cutoff = time.time() - self.ttl
+        try:
+            heartbeats = self.backend.heartbeats(user_ids)
+        except redis.RedisError as e:
+            logger.warning(f"Presence backend unavailable, using the stored status: {str(e)}")
+            return {str(user_id) for user_id in User.objects.filter(id__in=user_ids, is_online=True).values_list("id", flat=True)}
+        return {user_id for user_id, heartbeat in heartbeats.items() if heartbeat and heartbeat >= cutoff}
+
+    def online_ids(self):
+        """Ids of every user online right now, or None when the backend is down."""
+        try:
+            return self.backend.online_since(time.time() - self.ttl)
+        except redis.RedisError as e:
+            logger.warning(f"Presence backend unavailable: {str(e)}")
+            return None
+
+    def ensure_flusher(self):
+        if self._flusher is None or self._flusher.done():
+            self._flusher = asyncio.ensure_future(self._flush_forever())
+
+    async def _flush_forever(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            try:
+                await self.flush()
+            except Exception as e:
+                logger.error(f"Presence flush failed: {str(e)}")
+
+    async def flush(self):
+        await self.backend.sweep(time.time(), self.ttl, self.batch_size)
+
+        while True:
+            changes = await self.backend.pop_dirty(self.batch_size)
+            if not changes:
+                return
+            try:
+                await database_sync_to_async(self._write)(changes)
+            except Exception:
+                # Popped transitions exist nowhere else; keep them for the next flush.
+                await self.backend.requeue(changes)
+                raise
+            if len(changes) < self.batch_size:
+                return
+
+    def _write(self, changes):
+        cutoff = time.time() - self.ttl
+        users = []
+        offline_unknown = []
+        for user_id, heartbeat, last_seen in changes:
+            is_online = heartbeat is not None and heartbeat >= cutoff
+            seen = heartbeat if is_online else (last_seen or heartbeat)
+            if seen is None:
+                offline_unknown.append(user_id)
+                continue
+            users.append(User(
+                id=user_id,
+                is_online=is_online,
+                last_seen=datetime.fromtimestamp(seen, tz=dt_timezone.utc),
+            ))
+
+        if users:
+            User.objects.bulk_update(users, ["is_online", "last_seen"], batch_size=self.batch_size)
+        if offline_unknown:
+            User.objects.filter(id__in=offline_unknown).update(is_online=False)
+
+
+def get_backend():
+    if settings.PRESENCE_BACKEND == "memory":
+        return MemoryPresenceBackend()
+    return RedisPresenceBackend(settings.PRESENCE_REDIS_URL)
+
+
+presence = PresenceTracker(
+    get_backend(),
+    ttl=settings.PRESENCE_TTL,
+    flush_interval=settings.PRESENCE_FLUSH_INTERVAL,
+)
@@ -0,0 +1,206 @@
+import csv
+import json
+import os
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+
+import django
+from django.contrib.auth.hashers import make_password
+from django.db import DatabaseError, IntegrityError, transaction
+
+from .models import User
+from .passwords import make_passwords
+from .serializers import UserCreateSerializer
+
+from loguru import logger
+
+
+# Below this many passwords a process pool costs more to start than it saves.
+MIN_PARALLEL_HASHES = 32
+
+ProvisionResult = namedtuple("ProvisionResult", ["created", "errors"])
+
+
+class UserProvisionSerializer(UserCreateSerializer):
+    """
+    ``UserCreateSerializer`` rules for one row of a bulk import, minus the
+    per-row uniqueness query: ``provision_users`` checks emails for a whole
+    chunk at once.
+    """
+
+    def validate_email(self, value):
+        return User.objects.normalize_email(value)
+
+
+def read_rows(stream, fmt):
+    """Yield dicts from a text ``stream`` of CSV (with a header row) or NDJSON."""
+    if fmt == "csv":
+        yield from csv.DictReader(stream)
+    elif fmt == "ndjson":
+        for line in stream:
+            if line.strip():
+                try:
+                    yield json.loads(line)
+                except ValueError as e:
+                    # Keep the row so it is reported against its line number.
+                    yield {"__error__": f"Invalid JSON: {str(e)}"}
+    else:
+        raise ValueError(f"Unsupported format: {fmt}")
+
+
+def _init_worker(settings_module):
+    # Spawned workers start without Django; forked ones already have it.
+    os.environ.setdefault("DJANGO_SETTINGS_MODULE", settings_module)
+    django.setup()
+
+
+class PasswordHasher:
+    """
+    ``make_password`` for lists of passwords, spread over a process pool of
+    ``workers`` (default: one per core) that is started on first use and
+    reused until ``close``. Meant for the provision_users command; web
+    workers use ``PooledPasswordHasher``.
+    """
+
+    def __init__(self, workers=None):
+        self.workers = workers
+        self._pool = None
+
+    def hash(self, passwords):
+        if self.workers == 1 or len(passwords) < MIN_PARALLEL_HASHES:
+            return [make_password(password) for password in passwords]
+
+        if self._pool is None:
+            self._pool = ProcessPoolExecutor(
+                max_workers=self.workers,
+                initializer=_init_worker,
+                initargs=(os.environ.get("DJANGO_SETTINGS_MODULE", "myproject.settings"),),
+            )
+        chunksize = max(1, len(passwords) // ((self.workers or os.cpu_count()) * 4))
+        return list(self._pool.map(make_password, passwords, chunksize=chunksize))
+
+    def close(self):
+        if self._pool is not None:
+            self._pool.shutdown()
+            self._pool = None
+
+
+class PooledPasswordHasher:
+    """
+    ``PasswordHasher`` for web requests: hashes on the bounded thread pool
+    logins use (see ``users.passwords``) instead of forking processes from
+    the web worker.
+    """
+
+    def hash(self, passwords):
+        return make_passwords(passwords)
+
+    def close(self):
+        pass
+
+
+def provision_users(rows, batch_size=1000, workers=None, hasher=None):
+    """
+    Create users from an iterable of dicts with ``email``, ``password``,
+    ``first_name`` and ``last_name``.
+
+    Rows are validated one by one, then handled ``batch_size`` at a time: one
+    query finds which emails already exist, the passwords are hashed in
+    parallel and the users are inserted with ``bulk_create``. Invalid rows,
+    and rows the database rejects, are reported and skipped; they never
+    abort the import.
+
+    Passwords are hashed by ``hasher``, by default a ``PasswordHasher``
+    process pool of ``workers``.
+
+    Returns a ``ProvisionResult`` with ``(row, email, id)`` for the created
+    users and ``{"row": n, "errors": {...}}`` for the rejected ones, rows
+    being numbered from 1.
+    """
+    created, errors = [], []
+    pending = []
+    hasher = hasher or PasswordHasher(workers)
+    try:
+        for number, row in _validated(rows, errors):
+            pending.append((number, row))
+            if len(pending) >= batch_size:
+                _provision_batch(pending, hasher, created, errors)
+                pending = []
+
+        if pending:
+            _provision_batch(pending, hasher, created, errors)
+    finally:
+        hasher.close()
+
+    errors.sort(key=lambda error: error["row"])
+    return ProvisionResult(created, errors)
+
+
+def _validated(rows, errors):
+    seen = set()
+    for number, row in enumerate(rows, start=1):
+        if not isinstance(row, dict):
+            row = {"__error__": "Each row must be an object."}
+        if "__error__" in row:
+            errors.append({"row": number, "errors": {"non_field_errors": [row["__error__"]]}})
+            continue
+
+        serializer = UserProvisionSerializer(data=row)
+        if not serializer.is_valid():
+            errors.append({"row": number, "errors": serializer.errors})
+            continue
+
+        data = serializer.validated_data
+        if data["email"] in seen:
+            errors.append({"row": number, "errors": {"email": ["Duplicate email in this import."]}})
+            continue
+        seen.add(data["email"])
+        yield number, data
+
+
+def _provision_batch(pending, hasher, created, errors):
+    existing = set(
+        User.objects.filter(email__in=[data["email"] for _, data in pending]).values_list("email", flat=True)
+    )
+    batch = []
+    for number, data in pending:
+        if data["email"] in existing:
+            errors.append({"row": number, "errors": {"email": ["A user with this email already exists."]}})
+        else:
+            batch.append((number, data))
+    if not batch:
+        return
+
+    hashes = hasher.hash([data["password"] for _, data in batch])
+    users = [
+        (number, User(
+            email=data["email"],
+            first_name=data.get("first_name", ""),
+            last_name=data.get("last_name", ""),
+            password=encoded,
+        ))
+        for (number, data), encoded in zip(batch, hashes)
+    ]
+
+    try:
+        with transaction.atomic():
+            User.objects.bulk_create([user for _, user in users])
+    except DatabaseError as e:
+        # Someone registered one of these emails since the check above, or a
+        # row the serializer let through does not fit its columns; find out
+        # which by inserting the chunk row by row.
+        logger.warning(f"Bulk user insert failed ({e.__class__.__name__}); retrying the chunk row by row.")
+        for number, user in users:
+            try:
+                with transaction.atomic():
+                    user.save(force_insert=True)
+            except IntegrityError:
+                errors.append({"row": number, "errors": {"email": ["A user with this email already exists."]}})
+            except DatabaseError as e:
+                logger.warning(f"Provisioning row {number} failed: {e}")
+                errors.append({"row": number, "errors": {"non_field_errors": ["The row could not be saved."]}})
+            else:
+                created.append((number, user.email, user.id))
+        return
+
+    created.extend((number, user.email, user.id) for number, user in users)
@@ -0,0 +1,87 @@
+import re
+
+from django.db import connections
+from django.db.models import Case, IntegerField, Q, Value, When
+from django.db.models.expressions import RawSQL
+from rest_framework import filters
+
+
+SEARCH_FIELDS = ("first_name", "last_name", "email")
+
+# SQLite mirror of the searchable columns, kept in sync by triggers created in
+# users/migrations/0002_user_search_index.py. Django rebuilds SQLite tables on
+# most ALTERs, which drops those triggers: a migration that alters users_user
+# has to recreate them and rebuild the mirror.
+FTS_TABLE = "users_user_fts"
+
+# Trigram indexes cannot serve a substring match shorter than a trigram, so
+# shorter terms only match at the start of a field.
+MIN_SUBSTRING_LENGTH = 3
+
+_fts_tables = {}
+
+
+def has_fts_mirror(alias):
+    if alias not in _fts_tables:
+        connection = connections[alias]
+        _fts_tables[alias] = connection.vendor == "sqlite" and FTS_TABLE in connection.introspection.table_names()
+    return _fts_tables[alias]
+
+
+def fts_query(term):
+    """Turn user input into an FTS5 query: every word must prefix-match some token."""
+    return " ".join(f'"{word}"*' for word in re.findall(r"\w+", term))
+
+
+def search_users(queryset, term):
+    """
+    Filter ``queryset`` to users matching ``term`` and rank them: first name
+    prefix matches first, then last name, then email, then other matches.
+
+    On PostgreSQL the ``icontains``/``istartswith`` lookups are served by the
+    trigram indexes; on SQLite matching goes through the FTS5 mirror. Every
+    whitespace separated word has to match, as with DRF's ``SearchFilter``.
+
+    The two do not match the same rows: PostgreSQL keeps ``SearchFilter``'s
+    substring semantics (for words of ``MIN_SUBSTRING_LENGTH`` or more),
+    while FTS5 matches the start of any token, so "son" finds "Jackson" on
+    PostgreSQL only and "sm" finds "ann.smith@example.com" on SQLite only.
+    """
+    words = term.split()
+    if not words:
+        return queryset
+
+    if has_fts_mirror(queryset.db):
+        match = fts_query(term)
+        if not match:
+            return queryset.none()
+        queryset = queryset.alias(
+            search_rowid=RawSQL(f'"{queryset.model._meta.db_table}"."rowid"', (), output_field=IntegerField())
+        ).filter(
+            search_rowid__in=RawSQL(f"SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s", (match,))
+        )
+    else:
+        for word in words:
+            lookup = "icontains" if len(word) >= MIN_SUBSTRING_LENGTH else "istartswith"
+            condition = Q()
+            for field in SEARCH_FIELDS:
+                condition |= Q(**{f"{field}__{lookup}": word})
+            queryset = queryset.filter(condition)
+
+    first = words[0]
+    return queryset.annotate(
+        search_rank=Case(
+            When(first_name__istartswith=first, then=Value(0)),
+            When(last_name__istartswith=first, then=Value(1)),
+            When(email__istartswith=first, then=Value(2)),
+            default=Value(3),
+            output_field=IntegerField(),
+        )
+    ).order_by("search_rank", "first_name", "last_name", "id")
+
+
+class UserSearchFilter(filters.SearchFilter):
+    """``SearchFilter`` drop-in that searches through the indexed backend."""
+
+    def filter_queryset(self, request, queryset, view):
+        return search_users(queryset, request.query_params.get(self.search_param, ""))
@@ -1,17 +1,82 @@
 from rest_framework import serializers
+from .images import rendition_name, rendition_urls
 from .models import User
 
 
+# Shared by UserResponseSerializer.serialize_rows; stateless once built.
+_datetime_field = serializers.DateTimeField()
+
+
+def _media_url(name, request, storage):
+    url = storage.url(name)
+    return request.build_absolute_uri(url) if request is not None else url
 
 
 class UserResponseSerializer(serializers.ModelSerializer):
-    profile_image = serializers.ImageField(allow_null=True, required=False)
+    # ``profile_image`` is the 320px rendition once processed (the upload
+    # until then); ``profile_image_sizes`` lists every size and format.
+    profile_image = serializers.SerializerMethodField()
+    profile_image_sizes = serializers.SerializerMethodField()
+    is_online = serializers.SerializerMethodField()
     
     class Meta:
         model = User
-        fields = ['id', 'email', 'first_name', 'last_name', 'profile_image', 'is_online', 'last_seen', 'created_at', 'updated_at']
+        fields = ['id', 'email', 'first_name', 'last_name', 'profile_image', 'profile_image_sizes', 'is_online', 'last_seen', 'created_at', 'updated_at']
         read_only_fields = ['id','last_seen' ,'created_at', 'updated_at']
 
+    def get_profile_image(self, obj):
+        if not obj.profile_image:
+            return None
+        name = rendition_name(obj.profile_image_sizes, 320) or obj.profile_image.name
+        return _media_url(name, self.context.get("request"), obj.profile_image.storage)
+
+    def get_profile_image_sizes(self, obj):
+        storage, request = obj.profile_image.storage, self.context.get("request")
+        return rendition_urls(obj.profile_image_sizes, lambda name: _media_url(name, request, storage))
+
+    def get_is_online(self, obj):
+        # Views that know live presence pass the online ids in the context;
+        # otherwise fall back to the periodically flushed column.
+        online_ids = self.context.get("online_ids")
+        if online_ids is None:
+            return obj.is_online
+        return str(obj.id) in online_ids
+
+    @classmethod
+    def serialize_rows(cls, rows, context=None):
+        """
+        Read-only fast path producing the same representation from
+        ``.values(*Meta.fields)`` rows, without model instances or per-field
+        serializer calls.
+        """
+        context = context or {}
+        request = context.get("request")
+        online_ids = context.get("online_ids")
+        storage = User._meta.get_field("profile_image").storage
+        to_datetime = _datetime_field.to_representation
+
+        url = lambda name: _media_url(name, request, storage)
+
+        data = []
+        for row in rows:
+            profile_image = row["profile_image"]
+            if profile_image:
+                profile_image = url(rendition_name(row["profile_image_sizes"], 320) or profile_image)
+
+            data.append({
+                "id": str(row["id"]),
+                "email": row["email"],
+                "first_name": row["first_name"],
+                "last_name": row["last_name"],
+                "profile_image": profile_image or None,
+                "profile_image_sizes": rendition_urls(row["profile_image_sizes"], url),
+                "is_online": row["is_online"] if online_ids is None else str(row["id"]) in online_ids,
+                "last_seen": to_datetime(row["last_seen"]),
+                "created_at": to_datetime(row["created_at"]),
+                "updated_at": to_datetime(row["updated_at"]),
+            })
+        return data
+
 
 class UserCreateSerializer(serializers.ModelSerializer):
     password = serializers.CharField(write_only=True, required=True)
@@ -19,6 +84,9 @@ class UserCreateSerializer(serializers.ModelSerializer):
     class Meta:
         model = User
         fields = ['email', 'first_name', 'last_name', 'password']
+        # Keeps the model field's max_length but not the UniqueValidator
+        # unique=True adds: validate_email's query is enough.
+        extra_kwargs = {'email': {'validators': []}}
 
     def validate_email(self, value):
         if User.objects.filter(email=value).exists():
@@ -64,15 +132,13 @@ class UserLoginSerializer(serializers.Serializer):
 
     def validate(self, attrs):
         email = attrs.get('email')
-        password = attrs.get('password')
 
         try:
             user = User.objects.get(email=email)
         except User.DoesNotExist:
             raise serializers.ValidationError({"email": "User with this email does not exist."})
 
-        if not user.check_password(password):
-            raise serializers.ValidationError({"password": "Incorrect password."})
-
+        # The password is verified by UserLoginView, which awaits the hash
+        # rather than computing it on the request thread.
         attrs['user'] = user
         return attrs
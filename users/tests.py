@@ -1,3 +1,225 @@
-from django.test import TestCase
+import time
+from io import BytesIO
+
+from asgiref.sync import async_to_sync
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import InMemoryStorage, default_storage
+from django.test import TestCase, override_settings
+from PIL import Image
+from rest_framework.test import APIClient
+
+from myproject.metrics import registry
+from myproject.profiling import profile_queries
+from myproject.testing import QueryBudgetMixin
+from users.images import RENDITION_DIR, process_profile_image
+from users.models import User
+from users.presence import presence
+from users.tokens import UserRefreshToken
+
+
+class UserEndpointQueryBudgetTests(QueryBudgetMixin, TestCase):
+    """
+    Queries and wall time each users endpoint may cost. Raise a budget only
+    together with the change that needs it.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(
+            email="budget@example.com", password="password123", first_name="Budget", last_name="User"
+        )
+
+    def setUp(self):
+        self.client = APIClient()
+
+    def authenticate(self):
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {UserRefreshToken.for_user(self.user).access_token}")
+
+    def add_users(self, count, first_name="Search"):
+        User.objects.bulk_create([
+            User(email=f"{first_name.lower()}{i}@example.com", first_name=first_name, last_name=f"Person{i}", password="!")
+            for i in range(count)
+        ])
+
+    def test_register(self):
+        payload = {"email": "new@example.com", "password": "password123", "first_name": "New", "last_name": "User"}
+        # One uniqueness check and the INSERT, inside a savepoint.
+        with self.assertBudget("register", queries=4, seconds=0.25):
+            response = self.client.post("/api/users/register/", payload, format="json")
+        self.assertEqual(response.status_code, 201)
+
+    def test_register_overlong_email(self):
+        payload = {"email": f"{'a' * 250}@example.com", "password": "password123", "first_name": "New", "last_name": "User"}
+        response = self.client.post("/api/users/register/", payload, format="json")
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(User.objects.filter(email=payload["email"]).exists())
+
+    def test_login(self):
+        payload = {"email": "budget@example.com", "password": "password123"}
+        # One user lookup (the password is verified once) and the refresh
+        # token's OutstandingToken row for the blacklist.
+        with self.assertBudget("login", queries=2, seconds=0.25):
+            response = self.client.post("/api/users/login/", payload, format="json")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["Result"]["user"]["email"], "budget@example.com")
+
+    def test_login_wrong_password(self):
+        payload = {"email": "budget@example.com", "password": "wrong"}
+        response = self.client.post("/api/users/login/", payload, format="json")
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json()["ErrorMessage"], {"password": ["Incorrect password."]})
+
+    def test_online_filter(self):
+        self.authenticate()
+        self.add_users(30)
+        for user_id in User.objects.filter(email__in=["search1@example.com", "search2@example.com"]).values_list("id", flat=True):
+            async_to_sync(presence.backend.connect)(str(user_id), f"channel-{user_id}", time.time(), presence.ttl)
+        # Flushed as online but gone since: live presence wins.
+        User.objects.filter(email="search3@example.com").update(is_online=True)
+
+        # Authentication, COUNT and the page.
+        with self.assertBudget("online users", queries=3, seconds=0.25):
+            response = self.client.get("/api/users/", {"is_online": "true"})
+        data = response.json()["Result"]["data"]
+        self.assertEqual(data["count"], 2)
+        self.assertTrue(all(user["is_online"] for user in data["results"]))
+
+        response = self.client.get("/api/users/", {"is_online": "false"})
+        data = response.json()["Result"]["data"]
+        self.assertEqual(data["count"], 29)
+        self.assertFalse(any(user["is_online"] for user in data["results"]))
+
+    def test_bulk_provision(self):
+        admin = User.objects.create_user(email="bulk-admin@example.com", password="password123", is_staff=True)
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {UserRefreshToken.for_user(admin).access_token}")
+        rows = [{"email": f"bulk{i}@example.com", "password": "password123"} for i in range(40)]
+        # Authentication, the existing-email check and one INSERT in a
+        # savepoint, however many rows; hashed on the login pool.
+        with self.assertBudget("bulk provision (40 rows)", queries=5, seconds=2.0):
+            response = self.client.post("/api/users/bulk/", {"users": rows}, format="json")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json()["Result"]["created"]), 40)
+        self.assertTrue(User.objects.get(email="bulk39@example.com").check_password("password123"))
+
+    def test_bulk_provision_reports_bad_rows(self):
+        admin = User.objects.create_user(email="bulk-admin@example.com", password="password123", is_staff=True)
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {UserRefreshToken.for_user(admin).access_token}")
+        rows = [
+            {"email": "bulk-ok@example.com", "password": "password123"},
+            {"email": f"{'a' * 250}@example.com", "password": "password123"},
+        ]
+        response = self.client.post("/api/users/bulk/", {"users": rows}, format="json")
+        self.assertEqual(response.status_code, 200)
+        result = response.json()["Result"]
+        self.assertEqual(len(result["created"]), 1)
+        self.assertEqual([error["row"] for error in result["errors"]], [2])
+        self.assertIn("email", result["errors"][0]["errors"])
+
+    def test_me(self):
+        self.authenticate()
+        with self.assertBudget("me", queries=1, seconds=0.25):
+            response = self.client.get("/api/users/me/")
+        self.assertEqual(response.status_code, 200)
+
+    def test_search(self):
+        self.authenticate()
+        self.add_users(3)
+        # The first search of a process looks up whether the FTS mirror exists.
+        self.client.get("/api/users/", {"search": "warm"})
+
+        # Authentication, COUNT and the page.
+        with self.assertBudget("search (3 matches)", queries=3, seconds=0.25):
+            response = self.client.get("/api/users/", {"search": "sea"})
+        self.assertEqual(response.json()["Result"]["data"]["count"], 3)
+
+        self.add_users(30, first_name="Seal")
+        with self.assertBudget("search (33 matches)", queries=3, seconds=0.25):
+            response = self.client.get("/api/users/", {"search": "sea"})
+        self.assertEqual(response.json()["Result"]["data"]["count"], 33)
+
+        with self.assertBudget("search without count", queries=2, seconds=0.25):
+            response = self.client.get("/api/users/", {"search": "sea", "count": "false"})
+        self.assertNotIn("count", response.json()["Result"]["data"])
+
+
+@override_settings(QUERY_PROFILE_REPEAT_THRESHOLD=5)
+class QueryProfilerTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.users = User.objects.bulk_create([
+            User(email=f"profile{i}@example.com", first_name="Pro", last_name=f"File{i}", password="!") for i in range(6)
+        ])
+
+    def test_repeated_queries_are_located(self):
+        with profile_queries("test") as profile:
+            for user in self.users:
+                User.objects.get(pk=user.pk)
+            User.objects.filter(pk__in=[user.pk for user in self.users]).count()
+
+        self.assertEqual(profile.count, 7)
+        [(shape, count)] = profile.repeated(5)
+        self.assertEqual(count, 6)
+        self.assertIn("WHERE", shape)
+        [location] = profile.locations[shape]
+        self.assertTrue(location.startswith("users/tests.py:"), location)
+        self.assertTrue(profile.finish())
+
+    def test_queries_under_thresholds_are_not_reported(self):
+        with profile_queries("test") as profile:
+            User.objects.get(pk=self.users[0].pk)
+        self.assertFalse(profile.finish())
+
+    @override_settings(QUERY_PROFILE_SAMPLE_RATE=1.0)
+    def test_sampled_requests_are_profiled(self):
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION=f"Bearer {UserRefreshToken.for_user(self.users[0]).access_token}")
+        self.assertEqual(client.get("/api/users/me/").status_code, 200)
+        self.assertIn('profiled_queries_count{protocol="http",handler="profile"}', registry.render())
+
+
+class FlakyStorage(InMemoryStorage):
+    """In-memory storage whose saves start failing after ``saves_left`` more."""
+
+    saves_left = None
+
+    def _save(self, name, content):
+        if FlakyStorage.saves_left is not None:
+            if FlakyStorage.saves_left <= 0:
+                raise OSError("Disk full.")
+            FlakyStorage.saves_left -= 1
+        return super()._save(name, content)
+
+
+@override_settings(STORAGES={**settings.STORAGES, "default": {"BACKEND": "users.tests.FlakyStorage"}})
+class ProfileImageTests(TestCase):
+    def setUp(self):
+        FlakyStorage.saves_left = None
+        self.user = User.objects.create_user(email="pictured@example.com", password="password123")
+        buffer = BytesIO()
+        Image.new("RGB", (400, 300), "teal").save(buffer, format="PNG")
+        self.upload = default_storage.save("profile_images/pictured.png", ContentFile(buffer.getvalue()))
+        User.objects.filter(pk=self.user.pk).update(profile_image=self.upload)
+        self.previous = {"64": {
+            "image": default_storage.save("profile_images/sizes/old_64.jpg", ContentFile(b"old")),
+            "webp": default_storage.save("profile_images/sizes/old_64.webp", ContentFile(b"old")),
+        }}
+
+    def renditions(self):
+        return default_storage.listdir(f"{RENDITION_DIR}/{self.user.id}")[1]
+
+    def test_previous_sizes_are_replaced(self):
+        process_profile_image(self.user.id, self.upload, self.previous)
+        sizes = User.objects.get(pk=self.user.pk).profile_image_sizes
+        self.assertEqual(sorted(sizes, key=int), ["64", "160", "320"])
+        self.assertEqual(len(self.renditions()), 6)
+        self.assertFalse(any(default_storage.exists(name) for name in self.previous["64"].values()))
+
+    def test_failed_build_leaves_no_files(self):
+        FlakyStorage.saves_left = 3
+        process_profile_image(self.user.id, self.upload, self.previous)
+        self.assertEqual(User.objects.get(pk=self.user.pk).profile_image_sizes, {})
+        self.assertEqual(self.renditions(), [])
+        # Unreferenced since the upload replaced them.
+        self.assertFalse(any(default_storage.exists(name) for name in self.previous["64"].values()))
 
-# Create your tests here.
@@ -0,0 +1,16 @@
+from rest_framework_simplejwt.tokens import RefreshToken
+
+
+class UserRefreshToken(RefreshToken):
+    """
+    Refresh token carrying the profile claims the websocket stack needs, so
+    consumers can identify the user without loading the row. The claims are
+    copied into every access token derived from it.
+    """
+
+    @classmethod
+    def for_user(cls, user):
+        token = super().for_user(user)
+        token["email"] = user.email
+        token["full_name"] = user.get_full_name()
+        return token
@@ -6,6 +6,7 @@ from . import views
 urlpatterns = [
     path('', views.UserSearchView.as_view(), name='user_search'),
     path('register/', views.RegisterUserView.as_view(), name='register'),
+    path('bulk/', views.BulkProvisionUsersView.as_view(), name='bulk_provision'),
     path('login/', views.UserLoginView.as_view(), name='login'),
     path('me/', views.UserProfileView.as_view(), name='profile'),
     path('token/refresh/', TokenRefreshView.as_view(), name='token_refresh'),
@@ -1,26 +1,34 @@
+import io
+
 from rest_framework import status, generics
 
 from rest_framework.permissions import AllowAny
+from rest_framework.response import Response
 
-from rest_framework_simplejwt.views import TokenObtainPairView
-from rest_framework_simplejwt.tokens import RefreshToken
 from rest_framework_simplejwt.authentication import JWTAuthentication
-from rest_framework.permissions import IsAuthenticated
+from rest_framework.permissions import IsAdminUser, IsAuthenticated
+from rest_framework.views import APIView
 
-from django.contrib.auth import authenticate
+from channels.db import database_sync_to_async
 from django.db import transaction
 
+from myproject.pagination import OptionalCountPagination
 from myproject.responses import api_response
+from myproject.views import AsyncAPIView
 from django.contrib.auth import get_user_model
 
 
 from .serializers import (UserCreateSerializer, UserLoginSerializer, UserResponseSerializer)
+from .passwords import averify_password
+from .presence import presence
+from .provisioning import PooledPasswordHasher, provision_users, read_rows
+from .search import UserSearchFilter
+from .tokens import UserRefreshToken
 
 from drf_yasg.utils import swagger_auto_schema
 from drf_yasg import openapi
 
 from django_filters.rest_framework import DjangoFilterBackend
-from rest_framework import filters
 
 from loguru import logger
 
@@ -73,13 +81,23 @@ class RegisterUserView(generics.CreateAPIView):
           
           
           
-class UserLoginView(TokenObtainPairView):
+class UserLoginView(AsyncAPIView):
+    """
+    Login user and obtain tokens.
+
+    Async: under ASGI every sync view runs on one shared thread, and a login
+    holding it for the whole password hash stalls every other sync request.
+    Here the lookup and token issue take that thread briefly and the hash is
+    awaited on the bounded pool in between.
+    """
+
     permission_classes = [AllowAny]
     authentication_classes = [JWTAuthentication]
     serializer_class = UserLoginSerializer
-    
+
     @swagger_auto_schema(
         operation_description="Login user and obtain tokens.",
+        request_body=UserLoginSerializer,
         responses={
             200: openapi.Response(description="Login successful."),
             400: openapi.Response(description="Bad request"),
@@ -88,50 +106,53 @@ class UserLoginView(TokenObtainPairView):
         },
         tags=["User"],
     )
-
-    def post(self, request, *args, **kwargs):
+    async def post(self, request, *args, **kwargs):
         try:
             serializer = self.serializer_class(data=request.data)
-            if serializer.is_valid():
-                email = serializer.validated_data.get('email')
-                password = serializer.validated_data.get('password')
-
-                user = authenticate(request, email=email, password=password)
+            if not await database_sync_to_async(serializer.is_valid)():
+                return api_response(
+                    is_success=False,
+                    error_message=serializer.errors,
+                    status_code=status.HTTP_400_BAD_REQUEST,
+                )
 
-                if user is not None:
-                    user_data = UserResponseSerializer(user).data
+            user = serializer.validated_data['user']
+            if not await averify_password(user, serializer.validated_data['password']):
+                return api_response(
+                    is_success=False,
+                    error_message={"password": ["Incorrect password."]},
+                    status_code=status.HTTP_400_BAD_REQUEST,
+                )
 
-                    refresh = RefreshToken.for_user(user)
-                    refresh_token = str(refresh)
-                    access_token = str(refresh.access_token)
+            if not user.is_active:
+                return api_response(
+                    is_success=False,
+                    error_message="Invalid email or password.",
+                    status_code=status.HTTP_401_UNAUTHORIZED,
+                )
 
-                    return api_response(
-                        is_success=True,
-                        status_code=status.HTTP_200_OK,
-                        result={
-                            "user": user_data,
-                            "refresh_token": refresh_token,
-                            "access_token": access_token,
-                        }
-                    )
-                else:
-                    return api_response(
-                        is_success=False,
-                        error_message="Invalid email or password.",
-                        status_code=status.HTTP_401_UNAUTHORIZED,
-                    )
             return api_response(
-                is_success=False,
-                error_message=serializer.errors,
-                status_code=status.HTTP_400_BAD_REQUEST,
+                is_success=True,
+                status_code=status.HTTP_200_OK,
+                result=await database_sync_to_async(self.issue_tokens)(user),
             )
         except Exception as e:
+            logger.error(f"Error in UserLoginView: {str(e)}")
             return api_response(
                 is_success=False,
                 error_message="Internal Server Error",
                 status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             )
 
+    @staticmethod
+    def issue_tokens(user):
+        refresh = UserRefreshToken.for_user(user)
+        return {
+            "user": UserResponseSerializer(user).data,
+            "refresh_token": str(refresh),
+            "access_token": str(refresh.access_token),
+        }
+
 
 class UserProfileView(generics.RetrieveAPIView):
     permission_classes = [IsAuthenticated]
@@ -177,22 +198,73 @@ class UserProfileView(generics.RetrieveAPIView):
 class UserSearchView(generics.ListAPIView):
     permission_classes = [IsAuthenticated]
     serializer_class = UserResponseSerializer
-    
-    filter_backends = [filters.SearchFilter, DjangoFilterBackend]
+    pagination_class = OptionalCountPagination
+
+    # ?search matches differently per database (see search_users): on
+    # PostgreSQL any substring of a name or email, on SQLite (FTS5) only
+    # the start of a word in them. "son" finds "Jackson" on PostgreSQL but
+    # not on SQLite; "smith" finds "ann.smith@example.com" on both.
+    filter_backends = [UserSearchFilter, DjangoFilterBackend]
     search_fields = ['first_name', 'last_name', 'email']
-    filterset_fields = ['is_online', 'last_seen', 'is_active']
+    filterset_fields = ['last_seen', 'is_active']
     
     def get_queryset(self):
-        return User.objects.all()
+        queryset = User.objects.all()
+
+        # Filtered on live presence, like the is_online the page reports. The
+        # id list grows with the users online at once, not the user base; if
+        # presence is down, the flushed column is used instead.
+        is_online = self.request.query_params.get('is_online')
+        if is_online in ('true', 'True', '1', 'false', 'False', '0'):
+            online = is_online in ('true', 'True', '1')
+            online_ids = presence.online_ids()
+            if online_ids is None:
+                queryset = queryset.filter(is_online=online)
+            elif online:
+                queryset = queryset.filter(id__in=online_ids)
+            else:
+                queryset = queryset.exclude(id__in=online_ids)
+        return queryset
+
+    def paginate_queryset(self, queryset):
+        page = super().paginate_queryset(queryset)
+        if page is not None:
+            self.online_ids = presence.is_online_many([row["id"] for row in page])
+        return page
+
+    def get_serializer_context(self):
+        context = super().get_serializer_context()
+        online_ids = getattr(self, 'online_ids', None)
+        if online_ids is not None:
+            context['online_ids'] = online_ids
+        return context
+
+    def list(self, request, *args, **kwargs):
+        # Read-only listing: serialize straight from .values() rows.
+        queryset = self.filter_queryset(self.get_queryset()).values(*UserResponseSerializer.Meta.fields)
+        page = self.paginate_queryset(queryset)
+        if page is not None:
+            return self.get_paginated_response(
+                UserResponseSerializer.serialize_rows(page, self.get_serializer_context())
+            )
+        return Response(UserResponseSerializer.serialize_rows(queryset, self.get_serializer_context()))
 
     @swagger_auto_schema(
         operation_description="Search users by first name, last name, or email (using 'search'). Filter by is_online, last_seen, and is_active.",
         manual_parameters=[
             openapi.Parameter(
                 'search', openapi.IN_QUERY,
-                description="Search by first name, last name, or email (partial matches allowed)",
+                description=(
+                    "Search by first name, last name, or email (every word must match, prefix matches ranked first). "
+                    "PostgreSQL matches any part of a field, SQLite only the start of a word in it."
+                ),
                 type=openapi.TYPE_STRING
             ),
+            openapi.Parameter(
+                'count', openapi.IN_QUERY,
+                description="Pass false to skip the total count (no 'count' in the response)",
+                type=openapi.TYPE_BOOLEAN
+            ),
             openapi.Parameter(
                 'is_online', openapi.IN_QUERY,
                 description="Filter users by online status (true/false)",
@@ -230,4 +302,86 @@ class UserSearchView(generics.ListAPIView):
                 is_success=False,
                 error_message="Internal Server Error",
                 status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-            )
\ No newline at end of file
+            )
+
+
+class BulkProvisionUsersView(APIView):
+    permission_classes = [IsAdminUser]
+    authentication_classes = [JWTAuthentication]
+
+    # Every row costs a full password hash; larger imports belong in the
+    # provision_users management command.
+    MAX_ROWS = 1000
+
+    @swagger_auto_schema(
+        operation_description=(
+            "Create users in bulk (admin only). Send {\"users\": [{email, password, first_name, last_name}, ...]} "
+            "or upload a CSV/NDJSON 'file'. Invalid rows are reported per row and skipped."
+        ),
+        request_body=openapi.Schema(
+            type=openapi.TYPE_OBJECT,
+            properties={
+                "users": openapi.Schema(
+                    type=openapi.TYPE_ARRAY,
+                    items=openapi.Schema(
+                        type=openapi.TYPE_OBJECT,
+                        properties={
+                            "email": openapi.Schema(type=openapi.TYPE_STRING),
+                            "password": openapi.Schema(type=openapi.TYPE_STRING),
+                            "first_name": openapi.Schema(type=openapi.TYPE_STRING),
+                            "last_name": openapi.Schema(type=openapi.TYPE_STRING),
+                        },
+                    ),
+                ),
+            },
+        ),
+        responses={
+            200: openapi.Response(description="Import processed; see created and errors."),
+            400: openapi.Response(description="Bad request"),
+            403: openapi.Response(description="Not an admin"),
+            500: openapi.Response(description="Internal server error"),
+        },
+        tags=["User"],
+    )
+    def post(self, request):
+        try:
+            upload = request.FILES.get("file")
+            if upload is not None:
+                fmt = "ndjson" if upload.name.endswith((".ndjson", ".jsonl")) else "csv"
+                rows = list(read_rows(io.TextIOWrapper(upload.file, encoding="utf-8-sig"), fmt))
+            else:
+                rows = request.data if isinstance(request.data, list) else request.data.get("users")
+
+            if not isinstance(rows, list):
+                return api_response(
+                    is_success=False,
+                    error_message="Send a 'users' list or a CSV/NDJSON 'file'.",
+                    status_code=status.HTTP_400_BAD_REQUEST,
+                )
+            if len(rows) > self.MAX_ROWS:
+                return api_response(
+                    is_success=False,
+                    error_message=f"At most {self.MAX_ROWS} users per request.",
+                    status_code=status.HTTP_400_BAD_REQUEST,
+                )
+
+            # Never a process pool from inside a web worker.
+            result = provision_users(rows, hasher=PooledPasswordHasher())
+            return api_response(
+                is_success=True,
+                status_code=status.HTTP_200_OK,
+                result={
+                    "created": [
+                        {"row": number, "email": email, "id": str(user_id)}
+                        for number, email, user_id in result.created
+                    ],
+                    "errors": result.errors,
+                },
+            )
+        except Exception as e:
+            logger.error(f"Error in BulkProvisionUsersView: {str(e)}")
+            return api_response(
+                is_success=False,
+                error_message="Internal Server Error",
+                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            )